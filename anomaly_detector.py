@@ -0,0 +1,257 @@
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+from pymongo import UpdateOne
+from mongo import anomaly_state, alerts, SENSOR_META_FIELD
+from operational_context import operational_context
+from config import (
+    ANOMALY_EWMA_ALPHA, ANOMALY_Z_THRESHOLD, ANOMALY_WARMUP_READINGS, ANOMALY_CHECKPOINT_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+# Guards against division by zero for flat signals
+MIN_VARIANCE = 1e-9
+
+def reading_key(doc):
+    """(asset_field, asset_id, sensor_type) a reading is tracked under; parts are more specific than machines."""
+    meta = doc[SENSOR_META_FIELD]
+    asset_field = 'part_id' if meta.get('part_id') else 'machine_id'
+    return asset_field, str(meta[asset_field]), meta['sensor_type']
+
+def state_id(key):
+    return ':'.join(key)
+
+def fold_pipeline(key, n, mean, var, alpha, now):
+    """Update pipeline folding n readings with batch mean/var into a stored anomaly_state row,
+    the way AnomalyDetector folds a batch into its arrays; atomic, so workers' folds add up."""
+    count = {'$ifNull': ['$count', 0]}
+    asset_field, asset_id, sensor_type = key
+    return [
+        {'$set': {
+            '_weight': {'$cond': [{'$gt': [count, 0]}, 1.0 - (1.0 - alpha) ** n, 1.0]},
+            '_mean': {'$ifNull': ['$mean', 0.0]},
+            '_var': {'$ifNull': ['$var', 0.0]}
+        }},
+        {'$set': {'mean': {'$add': [{'$multiply': [{'$subtract': [1, '$_weight']}, '$_mean']}, {'$multiply': ['$_weight', mean]}]}}},
+        {'$set': {
+            'var': {'$add': [
+                {'$multiply': [{'$subtract': [1, '$_weight']}, {'$add': ['$_var', {'$pow': [{'$subtract': ['$_mean', '$mean']}, 2]}]}]},
+                {'$multiply': ['$_weight', {'$add': [var, {'$pow': [{'$subtract': [mean, '$mean']}, 2]}]}]}
+            ]},
+            'count': {'$add': [count, n]},
+            'asset_field': {'$literal': asset_field},
+            'asset_id': {'$literal': asset_id},
+            'sensor_type': {'$literal': sensor_type},
+            'updated_at': now
+        }},
+        {'$unset': ['_weight', '_mean', '_var']}
+    ]
+
+def merge_stats(n_a, mean_a, m2_a, n_b, mean_b, m2_b):
+    """Combined (count, mean, sum of squared deviations) of two sets of readings."""
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    share = np.divide(n_b, n, out=np.zeros_like(n), where=n > 0)
+    return n, mean_a + delta * share, m2_a + m2_b + delta ** 2 * n_a * share
+
+class AnomalyDetector:
+    """Rolling EWMA z-score detector per (asset, sensor type), vectorized over each ingest batch.
+
+    State is three parallel arrays (mean, variance, count) indexed by a slot per key, loaded
+    lazily from the anomaly_state collection. Every gunicorn worker runs its own detector: each
+    one accumulates the readings it folded since its last checkpoint (pending_*) and the
+    checkpoint folds them into the stored rows atomically, then reloads the rows any worker
+    changed. Workers' baselines therefore converge at every checkpoint instead of overwriting
+    each other; in between, each scores against its own view plus its own readings.
+    """
+
+    def __init__(self, alpha=ANOMALY_EWMA_ALPHA, threshold=ANOMALY_Z_THRESHOLD,
+                 warmup=ANOMALY_WARMUP_READINGS, checkpoint_seconds=ANOMALY_CHECKPOINT_SECONDS):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.checkpoint_seconds = checkpoint_seconds
+        self.slots = {}
+        self.keys = []
+        self.mean = np.zeros(0)
+        self.var = np.zeros(0)
+        self.count = np.zeros(0, dtype=np.int64)
+        # Readings folded in since the last checkpoint: count, mean and sum of squared deviations
+        self.pending_n = np.zeros(0)
+        self.pending_mean = np.zeros(0)
+        self.pending_m2 = np.zeros(0)
+        self.last_checkpoint = time.monotonic()
+        self.synced_at = datetime.now()
+        self.lock = threading.Lock()
+
+    def _grow(self, new_keys):
+        """Allocate slots for unseen keys, seeding them from their last checkpoint."""
+        if not new_keys:
+            return
+        start = len(self.keys)
+        for offset, key in enumerate(new_keys):
+            self.slots[key] = start + offset
+            self.keys.append(key)
+        pad = len(new_keys)
+        self.mean = np.concatenate([self.mean, np.zeros(pad)])
+        self.var = np.concatenate([self.var, np.zeros(pad)])
+        self.count = np.concatenate([self.count, np.zeros(pad, dtype=np.int64)])
+        self.pending_n = np.concatenate([self.pending_n, np.zeros(pad)])
+        self.pending_mean = np.concatenate([self.pending_mean, np.zeros(pad)])
+        self.pending_m2 = np.concatenate([self.pending_m2, np.zeros(pad)])
+        for saved in anomaly_state.find({'_id': {'$in': [state_id(k) for k in new_keys]}}):
+            slot = self.slots[(saved['asset_field'], saved['asset_id'], saved['sensor_type'])]
+            self.mean[slot] = saved['mean']
+            self.var[slot] = saved['var']
+            self.count[slot] = saved['count']
+
+    def _score(self, docs):
+        """Batch statistics per key and each reading's z-score against its key's state before the
+        batch; reads state only. Caller holds the lock."""
+        keys = [reading_key(d) for d in docs]
+        self._grow([k for k in dict.fromkeys(keys) if k not in self.slots])
+        slots = np.fromiter((self.slots[k] for k in keys), dtype=np.int64, count=len(keys))
+        values = np.fromiter((d['value'] for d in docs), dtype=np.float64, count=len(docs))
+
+        # Per-key batch statistics
+        batch_slots, inverse = np.unique(slots, return_inverse=True)
+        n = np.bincount(inverse).astype(np.float64)
+        batch_mean = np.bincount(inverse, weights=values) / n
+        batch_var = np.bincount(inverse, weights=(values - batch_mean[inverse]) ** 2) / n
+
+        # Keys without history are scored against this batch's statistics
+        fresh = self.count[batch_slots] == 0
+        mean = np.where(fresh[inverse], batch_mean[inverse], self.mean[slots])
+        var = np.where(fresh[inverse], batch_var[inverse], self.var[slots])
+        known = self.count[slots] + np.where(fresh[inverse], n[inverse], 0) >= self.warmup
+        z = np.abs(values - mean) / np.sqrt(np.maximum(var, MIN_VARIANCE))
+        flagged = known & (z > self.threshold)
+        return keys, batch_slots, n, batch_mean, batch_var, fresh, z, flagged
+
+    def _fold(self, slots, n, batch_mean, batch_var):
+        """Fold per-slot batch statistics into the EWMA state as n consecutive steps of weight
+        alpha; slots without history take the batch statistics outright. Caller holds the lock."""
+        fresh = self.count[slots] == 0
+        weight = np.where(fresh, 1.0, 1.0 - (1.0 - self.alpha) ** n)
+        old_mean = self.mean[slots]
+        new_mean = (1 - weight) * old_mean + weight * batch_mean
+        self.var[slots] = (1 - weight) * (self.var[slots] + (old_mean - new_mean) ** 2) + \
+            weight * (batch_var + (batch_mean - new_mean) ** 2)
+        self.mean[slots] = new_mean
+        self.count[slots] += n.astype(np.int64)
+
+    def flag(self, docs):
+        """Flag anomalous readings in place (is_anomaly) without updating any state, e.g. before
+        they are stored; process() the readings that were written."""
+        if not docs:
+            return
+        with self.lock:
+            flagged = self._score(docs)[-1]
+        for doc, is_anomaly in zip(docs, flagged.tolist()):
+            doc['is_anomaly'] = doc.get('is_anomaly', False) or is_anomaly
+
+    def process(self, docs):
+        """Flag anomalous readings in place (is_anomaly), fold them into the state and return alert documents to raise."""
+        if not docs:
+            return []
+        with self.lock:
+            keys, batch_slots, n, batch_mean, batch_var, fresh, z, flagged = self._score(docs)
+            self._fold(batch_slots, n, batch_mean, batch_var)
+            self._add_pending(batch_slots, n, batch_mean, batch_var * n)
+
+            for doc, is_anomaly in zip(docs, flagged.tolist()):
+                doc['is_anomaly'] = doc.get('is_anomaly', False) or is_anomaly
+            raised = self._alerts(docs, keys, z, flagged)
+        self.maybe_checkpoint()
+        return raised
+
+    def _alerts(self, docs, keys, z, flagged):
+        """One alert per key with anomalous readings in the batch."""
+        by_key = {}
+        for i in np.flatnonzero(flagged).tolist():
+            worst = by_key.get(keys[i])
+            by_key[keys[i]] = {
+                'count': (worst['count'] if worst else 0) + 1,
+                'index': i if not worst or z[i] > z[worst['index']] else worst['index']
+            }
+        raised = []
+        for key, found in by_key.items():
+            doc = docs[found['index']]
+            meta = doc[SENSOR_META_FIELD]
+            peak = float(z[found['index']])
+            alert = {
+                'alert_type': 'sensor_anomaly',
+                'sensor_type': key[2],
+                'severity': 'critical' if peak >= 2 * self.threshold else 'high',
+                'message': f"{found['count']} anomalous {key[2]} reading(s); value {doc['value']:.2f} is {peak:.1f} standard deviations from normal",
+                'timestamp': doc['timestamp'],
+                'created_at': datetime.now()
+            }
+            for field in ('machine_id', 'part_id'):
+                if meta.get(field):
+                    alert[field] = str(meta[field])
+            raised.append(alert)
+        return raised
+
+    def _add_pending(self, slots, n, mean, m2):
+        # Caller holds the lock
+        self.pending_n[slots], self.pending_mean[slots], self.pending_m2[slots] = merge_stats(
+            self.pending_n[slots], self.pending_mean[slots], self.pending_m2[slots], n, mean, m2
+        )
+
+    def maybe_checkpoint(self, force=False):
+        """Fold the readings seen since the last checkpoint into anomaly_state and pick up what
+        other workers folded in meanwhile."""
+        if not force and time.monotonic() - self.last_checkpoint < self.checkpoint_seconds:
+            return
+        now = datetime.now()
+        with self.lock:
+            self.last_checkpoint = time.monotonic()
+            slots = np.flatnonzero(self.pending_n)
+            taken = (self.pending_n[slots].copy(), self.pending_mean[slots].copy(), self.pending_m2[slots].copy())
+            self.pending_n[slots] = self.pending_mean[slots] = self.pending_m2[slots] = 0
+            keys = [self.keys[slot] for slot in slots.tolist()]
+            # Rows other workers wrote since our last sync; the overlap tolerates clock skew between hosts
+            since = self.synced_at - timedelta(seconds=self.checkpoint_seconds)
+        operations = [
+            UpdateOne({'_id': state_id(key)}, fold_pipeline(key, int(n), float(mean), float(m2 / n), self.alpha, now), upsert=True)
+            for key, n, mean, m2 in zip(keys, *taken)
+        ]
+        try:
+            if operations:
+                anomaly_state.bulk_write(operations, ordered=False)
+            stored = list(anomaly_state.find({'updated_at': {'$gte': since}}))
+        except Exception as e:
+            logger.error("Anomaly state checkpoint failed: %s", e)
+            with self.lock:
+                self._add_pending(slots, *taken)
+            return
+        with self.lock:
+            self.synced_at = now
+            reloaded = []
+            for saved in stored:
+                slot = self.slots.get((saved['asset_field'], saved['asset_id'], saved['sensor_type']))
+                if slot is None:
+                    continue
+                self.mean[slot], self.var[slot], self.count[slot] = saved['mean'], saved['var'], saved['count']
+                reloaded.append(slot)
+            # Readings this worker folded while the checkpoint was being written are not stored yet
+            reloaded = np.array(reloaded, dtype=np.int64)
+            reloaded = reloaded[self.pending_n[reloaded] > 0]
+            if reloaded.size:
+                n = self.pending_n[reloaded]
+                self._fold(reloaded, n, self.pending_mean[reloaded], self.pending_m2[reloaded] / n)
+
+detector = AnomalyDetector()
+
+def detect_and_alert(docs):
+    """Flag a batch of readings and insert the resulting alerts; returns the alerts raised."""
+    raised = detector.process(docs)
+    if raised:
+        alerts.insert_many(raised, ordered=False)
+        if any(alert['severity'] == 'critical' for alert in raised):
+            operational_context.alerts_changed()
+    return raised
@@ -23,6 +23,13 @@ with app.app_context():
     from routes import register_routes
     register_routes(app)
 
+# Index provisioning runs in the background so workers boot without waiting on the database
+from provisioning import start_background_provisioning, skip_provisioning
+if app.config['PROVISION_ON_STARTUP']:
+    start_background_provisioning()
+else:
+    skip_provisioning()
+
 @app.errorhandler(404)
 def page_not_found(e):
     """Handle 404 errors"""
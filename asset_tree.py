@@ -0,0 +1,134 @@
+import json
+import time
+import threading
+from collections import defaultdict
+from bson import ObjectId
+from mongo import machines, parts
+from config import ASSET_TREE_CACHE_SECONDS
+
+STATUS_COLORS = {
+    'operational': '#28a745',
+    'critical': '#e53935',
+    'warning': '#ffc107',
+    'maintenance': '#e53935',
+    'error': '#e53935',
+    'in_transit': '#6c757d'
+}
+DEFAULT_COLOR = '#6c757d'
+
+HEALTH_CIRCLE = '<span style="display:inline-block;width:12px;height:12px;border-radius:50%;background:{color};margin-right:7px;vertical-align:middle;border:1.5px solid #222;"></span>'
+
+# Health indicator markup, rendered once per status instead of once per node
+_circles = {status: HEALTH_CIRCLE.format(color=color) for status, color in STATUS_COLORS.items()}
+_default_circle = HEALTH_CIRCLE.format(color=DEFAULT_COLOR)
+
+# Serialized tree shared by all requests in this worker. Machines and parts are loaded by
+# external imports rather than written by this app, so the cache is TTL-only: a change
+# shows up within ASSET_TREE_CACHE_SECONDS without a database read per request.
+_cache = {'built_at': 0.0, 'payload': None}
+_cache_lock = threading.Lock()
+
+def health_circle(status):
+    """Colored status dot shown in front of a tree node."""
+    return _circles.get(status, _default_circle)
+
+def machine_node(m):
+    """jsTree node for a machine."""
+    m_id = str(m['_id'])
+    status = m.get('status', 'operational')
+    return {
+        'id': f'machine-{m_id}',
+        'text': health_circle(status) + m.get('name', 'Machine'),
+        'type': 'machine',
+        'machine_id': m_id,
+        'status': status,
+        'children': []
+    }
+
+def part_node(p, m_id):
+    """jsTree node for a part of machine m_id."""
+    p_id = str(p['_id'])
+    status = p.get('status', 'operational')
+    return {
+        'id': f'part-{p_id}',
+        'text': health_circle(status) + p.get('name', 'Part'),
+        'type': 'part',
+        'part_id': p_id,
+        'machine_id': m_id,
+        'status': status,
+        'children': []
+    }
+
+def build_tree():
+    """Build the machine/part hierarchy in O(machines + parts)."""
+    # Group parts by parent machine in a single pass
+    parts_by_machine = defaultdict(list)
+    for p in parts.find({}, {'name': 1, 'status': 1, 'machine_id': 1}):
+        parts_by_machine[str(p.get('machine_id'))].append(p)
+    tree = []
+    for m in machines.find({}, {'name': 1, 'status': 1}):
+        m_node = machine_node(m)
+        m_id = m_node['machine_id']
+        m_node['children'] = [part_node(p, m_id) for p in parts_by_machine.get(m_id, ())]
+        tree.append(m_node)
+    return tree
+
+def get_tree_json():
+    """Serialized asset tree, rebuilt once the cached copy is ASSET_TREE_CACHE_SECONDS old."""
+    with _cache_lock:
+        if _cache['payload'] is None or time.monotonic() - _cache['built_at'] >= ASSET_TREE_CACHE_SECONDS:
+            _cache['payload'] = json.dumps(build_tree())
+            _cache['built_at'] = time.monotonic()
+        return _cache['payload']
+
+def _parent_keys(machine_ids):
+    """parts.machine_id is stored either as a string or an ObjectId; match both."""
+    return [str(i) for i in machine_ids] + [ObjectId(i) for i in machine_ids]
+
+def child_rollups(machine_ids):
+    """Return {machine_id: {status: count}} of parts for a page of machines."""
+    if not machine_ids:
+        return {}
+    pipeline = [
+        {'$match': {'machine_id': {'$in': _parent_keys(machine_ids)}}},
+        {'$group': {
+            '_id': {'machine_id': {'$toString': '$machine_id'}, 'status': {'$ifNull': ['$status', 'operational']}},
+            'count': {'$sum': 1}
+        }}
+    ]
+    rollups = defaultdict(dict)
+    for row in parts.aggregate(pipeline):
+        rollups[row['_id']['machine_id']][row['_id']['status']] = row['count']
+    return rollups
+
+def _keyset_page(collection, query, projection, cursor, limit):
+    """One page of documents ordered by _id, starting after cursor."""
+    if cursor:
+        query = {**query, '_id': {'$gt': ObjectId(cursor)}}
+    page = list(collection.find(query, projection).sort('_id', 1).limit(limit + 1))
+    next_cursor = str(page[limit - 1]['_id']) if len(page) > limit else None
+    return page[:limit], next_cursor
+
+def machine_page(cursor=None, limit=50, statuses=None):
+    """Machines only, with child counts and status rollups; parts load on demand."""
+    query = {'status': {'$in': statuses}} if statuses else {}
+    page, next_cursor = _keyset_page(machines, query, {'name': 1, 'status': 1}, cursor, limit)
+    rollups = child_rollups([m['_id'] for m in page])
+    nodes = []
+    for m in page:
+        node = machine_node(m)
+        child_status = rollups.get(node['machine_id'], {})
+        node['child_count'] = sum(child_status.values())
+        node['child_status'] = child_status
+        # jsTree fetches children lazily when this is true
+        node['children'] = node['child_count'] > 0
+        nodes.append(node)
+    return {'nodes': nodes, 'next_cursor': next_cursor}
+
+def machine_children(machine_id, cursor=None, limit=200, statuses=None):
+    """Part nodes of one machine, keyset-paginated on _id."""
+    query = {'machine_id': {'$in': _parent_keys([machine_id])}}
+    if statuses:
+        query['status'] = {'$in': statuses}
+    page, next_cursor = _keyset_page(parts, query, {'name': 1, 'status': 1}, cursor, limit)
+    return {'nodes': [part_node(p, machine_id) for p in page], 'next_cursor': next_cursor}
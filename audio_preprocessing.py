@@ -0,0 +1,160 @@
+import io
+import time
+import wave
+import threading
+import numpy as np
+from config import (
+    AUDIO_PREPROCESSING, AUDIO_TARGET_SAMPLE_RATE, AUDIO_SILENCE_THRESHOLD, AUDIO_SILENCE_PADDING_MS
+)
+
+WAV_TYPES = ('audio/wav', 'audio/x-wav', 'audio/wave', 'audio/vnd.wave')
+FRAME_MS = 10
+FILTER_TAPS = 101
+
+def read_wav(data):
+    """(samples as float32 in -1..1 shaped (frames, channels), sample rate) of a PCM WAV."""
+    with wave.open(io.BytesIO(data), 'rb') as wav:
+        channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        raw = wav.readframes(wav.getnframes())
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 3:
+        # Little-endian 24-bit: place each sample in the top three bytes of an int32
+        triples = np.frombuffer(raw[:len(raw) - len(raw) % 3], dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = ((triples[:, 0] << 8) | (triples[:, 1] << 16) | (triples[:, 2] << 24)).astype(np.float32) / 2 ** 31
+    elif width in (2, 4):
+        samples = np.frombuffer(raw, dtype=f'<i{width}').astype(np.float32) / 2 ** (8 * width - 1)
+    else:
+        raise wave.Error(f'unsupported sample width {width}')
+    return samples[:len(samples) - len(samples) % channels].reshape(-1, channels), rate
+
+def write_wav(samples, rate):
+    """Mono 16-bit PCM WAV bytes of float samples."""
+    pcm = np.clip(np.round(samples * 32767), -32768, 32767).astype('<i2')
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+def trim_silence(samples, rate, threshold=AUDIO_SILENCE_THRESHOLD, padding_ms=AUDIO_SILENCE_PADDING_MS):
+    """samples without leading/trailing 10 ms frames whose RMS is below threshold (full scale 1.0),
+    keeping padding_ms around the speech; empty if every frame is silent."""
+    frame = max(1, rate * FRAME_MS // 1000)
+    count = len(samples) // frame
+    if count == 0:
+        return samples[:0]
+    frames = samples[:count * frame].reshape(count, frame)
+    voiced = np.flatnonzero(np.sqrt(np.mean(np.square(frames), axis=1)) >= threshold)
+    if voiced.size == 0:
+        return samples[:0]
+    padding = padding_ms // FRAME_MS
+    start = max(0, voiced[0] - padding) * frame
+    end = min(len(samples), (voiced[-1] + 1 + padding) * frame)
+    return samples[start:end]
+
+def resample(samples, rate, target_rate):
+    """Mono samples at target_rate: windowed-sinc low-pass below the new Nyquist, then linear interpolation."""
+    if rate == target_rate or len(samples) == 0:
+        return samples
+    if target_rate < rate:
+        cutoff = 0.45 * target_rate / rate
+        taps = np.arange(FILTER_TAPS) - (FILTER_TAPS - 1) / 2
+        kernel = 2 * cutoff * np.sinc(2 * cutoff * taps) * np.hamming(FILTER_TAPS)
+        samples = np.convolve(samples, (kernel / kernel.sum()).astype(np.float32), mode='same')
+    length = int(round(len(samples) * target_rate / rate))
+    positions = np.arange(length) * (rate / target_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+def upload_size(audio):
+    """Length of bytes, or of a seekable file-like object (left at its start)."""
+    if isinstance(audio, bytes):
+        return len(audio)
+    audio.seek(0, io.SEEK_END)
+    size = audio.tell()
+    audio.seek(0)
+    return size
+
+class AudioPreprocessor:
+    """Shrinks voice uploads before transcription: WAV audio is downmixed to mono, trimmed of
+    leading/trailing silence and resampled to target_rate as 16-bit PCM.
+
+    The browser already does this and uploads the smaller of that WAV and its compressed
+    recording, so this mostly catches other clients. Other formats (and WAVs that cannot be
+    parsed) pass through untouched; nothing is ever sent larger than it was uploaded.
+    """
+
+    def __init__(self, target_rate=AUDIO_TARGET_SAMPLE_RATE, threshold=AUDIO_SILENCE_THRESHOLD,
+                 padding_ms=AUDIO_SILENCE_PADDING_MS, enabled=AUDIO_PREPROCESSING):
+        self.target_rate = target_rate
+        self.threshold = threshold
+        self.padding_ms = padding_ms
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.counters = {'uploads': 0, 'processed': 0, 'silent': 0, 'passthrough': 0, 'errors': 0,
+                         'bytes_recorded': 0, 'bytes_uploaded': 0, 'bytes_sent': 0,
+                         'seconds_in': 0.0, 'seconds_out': 0.0, 'processing_ms_total': 0.0}
+
+    def _count(self, **amounts):
+        with self.lock:
+            for name, amount in amounts.items():
+                self.counters[name] += amount
+
+    def preprocess_wav(self, data):
+        """Processed WAV bytes, b'' if the audio is all silence; raises wave.Error if data is not PCM WAV."""
+        samples, rate = read_wav(data)
+        mono = samples.mean(axis=1) if samples.shape[1] > 1 else samples[:, 0]
+        voiced = trim_silence(mono, rate, self.threshold, self.padding_ms)
+        self._count(seconds_in=len(mono) / rate, seconds_out=len(voiced) / rate)
+        if len(voiced) == 0:
+            return b''
+        target_rate = min(rate, self.target_rate)
+        return write_wav(resample(voiced, rate, target_rate), target_rate)
+
+    def process(self, audio, content_type='audio/wav', recorded_bytes=None):
+        """(audio, content_type) to send for transcription; audio is bytes or a seekable file-like object.
+
+        recorded_bytes is the size of the client's original recording, when it preprocessed the
+        upload itself; bytes saved are counted against it. Non-WAV uploads come back as they were,
+        still streamable; b'' means there is nothing to transcribe.
+        """
+        size = upload_size(audio)
+        self._count(uploads=1, bytes_uploaded=size, bytes_recorded=recorded_bytes or size)
+        if not self.enabled or content_type.split(';')[0].strip().lower() not in WAV_TYPES:
+            self._count(passthrough=1, bytes_sent=size)
+            return audio, content_type
+        data = audio if isinstance(audio, bytes) else audio.read()
+        started = time.perf_counter()
+        try:
+            processed = self.preprocess_wav(data)
+        except (wave.Error, EOFError, ValueError):
+            # Mislabelled or non-PCM audio: let the transcription service sniff it
+            self._count(errors=1, passthrough=1, bytes_sent=size)
+            return data, content_type
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if not processed:
+            self._count(silent=1, processing_ms_total=elapsed_ms)
+            return b'', 'audio/wav'
+        if len(processed) >= size:
+            # Already as small as it gets, e.g. trimmed and resampled by the browser
+            processed = data
+        self._count(processed=1, bytes_sent=len(processed), processing_ms_total=elapsed_ms)
+        return processed, 'audio/wav'
+
+    def stats(self):
+        """Upload counts by outcome; bytes recorded by clients, uploaded, and sent for transcription."""
+        with self.lock:
+            stats = dict(self.counters)
+        stats['bytes_saved'] = stats['bytes_recorded'] - stats['bytes_sent']
+        stats['bytes_saved_ratio'] = round(stats['bytes_saved'] / stats['bytes_recorded'], 4) if stats['bytes_recorded'] else 0.0
+        stats['seconds_trimmed'] = round(stats['seconds_in'] - stats['seconds_out'], 2)
+        handled = stats['processed'] + stats['silent']
+        stats['processing_ms_avg'] = round(stats['processing_ms_total'] / handled, 2) if handled else 0.0
+        for name in ('seconds_in', 'seconds_out', 'processing_ms_total'):
+            stats[name] = round(stats[name], 2)
+        stats['target_sample_rate'] = self.target_rate
+        return stats
+
+audio_preprocessor = AudioPreprocessor()
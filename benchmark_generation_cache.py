@@ -0,0 +1,51 @@
+"""Measure the generation cache against a local Gemini stand-in: upstream calls, hit rate and latency saved.
+
+Usage: python benchmark_generation_cache.py [--users 32] [--questions 4] [--rounds 3] [--latency 0.8]
+
+Each round, every simulated user asks one of --questions prompts at the same moment; the stand-in
+answers after --latency seconds and counts the requests it receives.
+"""
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from gemini_client import GeminiClient
+from generation_cache import GenerationCache
+from stub_server import StubServer, gemini_reply
+
+def run(generate, users, questions, rounds):
+    """Wall-clock seconds for rounds of users asking concurrently."""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        for _ in range(rounds):
+            list(pool.map(lambda user: generate(f'Question {user % questions}: status of the fleet?'), range(users)))
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=32)
+    parser.add_argument('--questions', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.8)
+    args = parser.parse_args()
+
+    def respond(request):
+        time.sleep(args.latency)
+        return gemini_reply('stub answer')
+
+    with StubServer(respond) as server:
+        client = GeminiClient(api_key='stub', base_url=server.url,
+                              max_concurrency=args.users, pool_size=args.users)
+
+        elapsed = run(client.generate_content, args.users, args.questions, args.rounds)
+        print(f"uncached: {server.requests} upstream calls, {elapsed:.2f}s")
+
+        uncached = server.requests
+        cache = GenerationCache(client.generate_content)
+        elapsed = run(cache.generate, args.users, args.questions, args.rounds)
+        stats = cache.stats()
+        print(f"cached:   {server.requests - uncached} upstream calls, {elapsed:.2f}s")
+        print(f"hit rate {stats['hit_rate']:.2%} ({stats['hits']} hits, {stats['coalesced']} coalesced), "
+              f"upstream latency saved {stats['saved_ms_total'] / 1000:.1f}s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Measure worker boot cost: time to import the Flask app, with and without a reachable database.
+
+Usage: python benchmark_startup.py [--runs 5]
+Each run imports app in a fresh interpreter, the way a gunicorn worker boots.
+"""
+import os
+import sys
+import argparse
+import subprocess
+import statistics
+
+# Nothing listens on port 9, so server selection can only time out
+UNREACHABLE_URI = 'mongodb://127.0.0.1:9/?serverSelectionTimeoutMS=2000'
+
+IMPORT_APP = (
+    "import time; started = time.perf_counter(); import app; "
+    "print(time.perf_counter() - started)"
+)
+
+def boot_seconds(env):
+    """Seconds a fresh interpreter spends importing app."""
+    result = subprocess.run(
+        [sys.executable, '-c', IMPORT_APP],
+        env=env, capture_output=True, text=True, timeout=600,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else 'import failed')
+    return float(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    scenarios = {
+        'configured database': {},
+        'unreachable database': {'MONGO_URI': UNREACHABLE_URI},
+    }
+    print(f"{'scenario':<24} {'median ms':>10} {'max ms':>10}")
+    for name, overrides in scenarios.items():
+        env = dict(os.environ, **overrides)
+        try:
+            samples = [boot_seconds(env) * 1000 for _ in range(args.runs)]
+        except Exception as e:
+            print(f"{name:<24} failed: {e}")
+            continue
+        print(f"{name:<24} {statistics.median(samples):>10.1f} {max(samples):>10.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Compare vector search modes: recall@k against exact search, and latency.
+
+Covers the local index's exact (flat) and IVF modes and, when Atlas is reachable, $vectorSearch
+ENN against ANN across a sweep of numCandidates.
+
+Usage: python benchmark_vector_search.py [--docs 50000] [--dim 768] [--queries 200] [--k 5] [--nprobe 4 8 16]
+       python benchmark_vector_search.py --collection machine_guides   (embeddings from the iot database)
+       python benchmark_vector_search.py --atlas-scratch vector_bench --docs 20000
+           (loads the synthetic corpus into a scratch collection, builds its search index, drops it afterwards)
+       [--num-candidates 50 100 200 400] sets the ANN sweep
+"""
+import time
+import argparse
+import statistics
+import numpy as np
+from vector_search import LocalVectorIndex, AtlasVectorBackend
+from config import VECTOR_INDEX_WAIT_SECONDS
+
+def synthetic_corpus(docs, dim, clusters=200, seed=42):
+    """Clustered random vectors, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=docs)
+    vectors = centers[labels] + 0.6 * rng.normal(size=(docs, dim)).astype(np.float32)
+    return [{'title': f'doc {i}', 'content': ''} for i in range(docs)], vectors
+
+def timed(search, queries):
+    """(results per query, latencies in ms)."""
+    results, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(search(query))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return results, latencies
+
+def recall(results, truth):
+    hits = sum(len({r['title'] for r in got} & {r['title'] for r in want}) for got, want in zip(results, truth))
+    return hits / max(1, sum(len(want) for want in truth))
+
+def report(name, latencies, value=None):
+    p95 = np.percentile(latencies, 95)
+    recall_text = f"{value:>8.3f}" if value is not None else f"{'-':>8}"
+    print(f"{name:<22} {recall_text} {statistics.median(latencies):>10.3f} {p95:>10.3f}")
+
+def load_scratch(collection, docs, vectors, batch=1000):
+    """Fill a scratch collection with the synthetic corpus and build its vector index."""
+    from provisioning import ensure_vector_index
+    collection.drop()
+    for start in range(0, len(docs), batch):
+        collection.insert_many([
+            dict(doc, embedding=vector.tolist())
+            for doc, vector in zip(docs[start:start + batch], vectors[start:start + batch])
+        ])
+    started = time.perf_counter()
+    if not ensure_vector_index(collection, VECTOR_INDEX_WAIT_SECONDS):
+        raise RuntimeError('vector index did not become queryable in time')
+    print(f"Built Atlas vector index over {len(docs)} docs in {time.perf_counter() - started:.1f}s")
+
+def atlas_sweep(atlas, queries, truth, k, candidates):
+    """$vectorSearch ENN, then ANN at each numCandidates; no score cut so recall is comparable."""
+    try:
+        results, latencies = timed(lambda q: atlas.search(q.tolist(), k, min_score=None, exact=True), queries)
+        report('atlas exact (ENN)', latencies, recall(results, truth))
+        for count in candidates:
+            results, latencies = timed(
+                lambda q: atlas.search(q.tolist(), k, min_score=None, exact=False, candidates=max(count, k)), queries
+            )
+            report(f'atlas ann nc={count}', latencies, recall(results, truth))
+    except Exception as e:
+        print(f"atlas $vectorSearch unavailable: {e}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=50000)
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[4, 8, 16])
+    parser.add_argument('--num-candidates', type=int, nargs='+', default=[50, 100, 200, 400])
+    parser.add_argument('--collection', help='benchmark against a seeded collection instead of synthetic vectors')
+    parser.add_argument('--atlas-scratch', help='scratch collection to load the synthetic corpus into for Atlas')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    atlas = None
+    if args.collection:
+        from mongo import db
+        collection = db[args.collection]
+        index = LocalVectorIndex(collection, ivf_min_docs=0)
+        index.load()
+        atlas = AtlasVectorBackend(collection)
+        sample = index.matrix[rng.choice(len(index.docs), min(args.queries, len(index.docs)), replace=False)]
+        queries = sample + 0.05 * rng.normal(size=sample.shape).astype(np.float32)
+    else:
+        docs, vectors = synthetic_corpus(args.docs, args.dim)
+        index = LocalVectorIndex(None, ivf_min_docs=0)
+        started = time.perf_counter()
+        index.build(docs, vectors)
+        print(f"Built IVF over {len(docs)} x {args.dim} in {time.perf_counter() - started:.1f}s, {len(index.lists)} lists")
+        if args.atlas_scratch:
+            from mongo import db
+            atlas = AtlasVectorBackend(db[args.atlas_scratch])
+            load_scratch(atlas.collection, docs, vectors)
+        queries = vectors[rng.choice(len(docs), args.queries, replace=False)] + \
+            0.3 * rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+    index.loaded_at = time.monotonic()
+
+    print(f"{'mode':<22} {'recall':>8} {'p50 ms':>10} {'p95 ms':>10}")
+    truth, latencies = timed(lambda q: index.search(q, args.k, exact=True), queries)
+    report('flat (exact)', latencies, 1.0)
+    for nprobe in args.nprobe:
+        index.nprobe = nprobe
+        results, latencies = timed(lambda q: index.search(q, args.k), queries)
+        report(f'ivf nprobe={nprobe}', latencies, recall(results, truth))
+
+    started = time.perf_counter()
+    index.search_many(queries, args.k)
+    per_query = (time.perf_counter() - started) * 1000 / len(queries)
+    print(f"{'flat batched':<22} {1.0:>8.3f} {per_query:>10.3f} {'-':>10}")
+
+    if atlas:
+        try:
+            atlas_sweep(atlas, queries, truth, args.k, args.num_candidates)
+        finally:
+            if args.atlas_scratch:
+                atlas.collection.drop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Load-test /api/voice-chat against local Deepgram and Gemini stand-ins: latency, throughput and isolation.
+
+Usage: python benchmark_voice_chat.py [--clients 32] [--requests 4] [--stt-latency 0.5] [--llm-latency 0.8] [--context-latency 0.3]
+
+Every upload carries a unique token; the Deepgram stand-in transcribes it back and the Gemini
+stand-in echoes the question, so a response carrying another client's token means requests
+were mixed up. No database is needed: the operational context is a static stand-in.
+"""
+import os
+import re
+import sys
+import time
+import uuid
+import logging
+import argparse
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from stub_server import StubServer, gemini_reply
+
+TOKEN = re.compile(rb'voice-[0-9a-f]{32}')
+
+def delayed(respond, latency):
+    """respond(request) after latency seconds."""
+    def reply(request):
+        time.sleep(latency)
+        return respond(request)
+    return reply
+
+def transcribe(request):
+    match = TOKEN.search(request.body)
+    transcript = f"status of {match.group().decode()}" if match else ''
+    return {'results': {'channels': [{'alternatives': [{'transcript': transcript}]}]}}
+
+def answer(request):
+    question = request.prompt.rsplit('User Question:', 1)[-1].strip()
+    return gemini_reply(f"Answer to {question}")
+
+def fake_audio(token):
+    """An opaque ~65 KB upload embedding token; not WAV, so it skips audio preprocessing."""
+    return b'RIFF' + os.urandom(64 * 1024) + token.encode() + os.urandom(1024)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=4, help='requests per client')
+    parser.add_argument('--stt-latency', type=float, default=0.5)
+    parser.add_argument('--llm-latency', type=float, default=0.8)
+    parser.add_argument('--context-latency', type=float, default=0.3)
+    args = parser.parse_args()
+
+    deepgram = StubServer(delayed(transcribe, args.stt_latency))
+    gemini = StubServer(delayed(answer, args.llm_latency))
+    # Point the services at the stand-ins before they read their configuration
+    os.environ.update({
+        'DEEPGRAM_URL': f'{deepgram.url}/v1/listen',
+        'DEEPGRAM_API_KEY': 'stub',
+        'GEMINI_BASE_URL': gemini.url,
+        'GEMINI_API_KEY': 'stub',
+        'PROVISION_ON_STARTUP': 'false',
+    })
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from werkzeug.serving import make_server
+    from operational_context import operational_context
+    from app import app
+
+    def static_context():
+        time.sleep(args.context_latency)
+        return {'latest_metrics': None, 'metrics_summary': 'No recent metrics available.',
+                'alerts_summary': 'No critical alerts reported recently.', 'built_at': time.monotonic()}
+    operational_context.refresh = static_context
+    operational_context.max_age = -1  # every request rebuilds, so its cost overlaps transcription
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/api/voice-chat'
+
+    import requests
+    session = requests.Session()
+    session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=args.clients))
+
+    def one_request(_):
+        token = f'voice-{uuid.uuid4().hex}'
+        started = time.perf_counter()
+        response = session.post(url, files={'audio': ('recording', fake_audio(token), 'application/octet-stream')})
+        elapsed = time.perf_counter() - started
+        body = response.json()
+        ok = (response.status_code == 200 and body.get('transcription') == f'status of {token}'
+              and token in body.get('response', '') and body['response'].count('voice-') == 1)
+        return elapsed, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        results = list(pool.map(one_request, range(args.clients * args.requests)))
+    wall = time.perf_counter() - started
+    server.shutdown()
+
+    latencies = sorted(elapsed for elapsed, _ in results)
+    mixed_up = sum(1 for _, ok in results if not ok)
+    serial = args.stt_latency + args.context_latency + args.llm_latency
+    print(f"{len(results)} requests from {args.clients} clients in {wall:.2f}s ({len(results) / wall:.1f} req/s)")
+    print(f"latency p50 {statistics.median(latencies) * 1000:.0f} ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f} ms "
+          f"(stand-ins sum to {serial * 1000:.0f} ms if context and transcription ran one after the other)")
+    print(f"peak concurrent upstream calls: Deepgram {deepgram.peak}, "
+          f"Gemini {gemini.peak} (capped by GEMINI_MAX_CONCURRENCY)")
+    print(f"responses carrying the wrong or no transcription: {mixed_up}")
+    deepgram.close()
+    gemini.close()
+    sys.exit(1 if mixed_up else 0)
+
+if __name__ == '__main__':
+    main()
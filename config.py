@@ -8,9 +8,135 @@ SECRET_KEY = os.environ.get("SESSION_SECRET", "dev-secret-key")
 
 # MongoDB configuration
 MONGO_URI = os.getenv('MONGO_URI')
+MONGO_DB_NAME = os.environ.get("MONGO_DB_NAME", "iot")
+# One client (and pool) is shared by everything in a worker process; size it against the cluster's connection limit
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", 10))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", 0))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", 60000))           # Close pooled connections idle this long
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", 10000))  # Fail rather than queue forever on an exhausted pool
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", 10000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", 10000))
+MONGO_READ_PREFERENCE = os.environ.get("MONGO_READ_PREFERENCE", "primary")
+MONGO_COMPRESSORS = os.environ.get("MONGO_COMPRESSORS", "")  # e.g. "zstd,snappy,zlib"; zstd/snappy need their Python packages
+MONGO_APP_NAME = os.environ.get("MONGO_APP_NAME", "geoorgan")
+# Collections and indexes are created by a background task at startup, or by running provisioning.py
+PROVISION_ON_STARTUP = os.environ.get("PROVISION_ON_STARTUP", "true").lower() in ("true", "1", "yes")
+PROVISION_RETRY_SECONDS = int(os.environ.get("PROVISION_RETRY_SECONDS", 30))     # Retry interval while the database is unreachable
+PROVISION_LEASE_SECONDS = int(os.environ.get("PROVISION_LEASE_SECONDS", 60))     # How long one worker may hold provisioning per index step before another takes over
+VECTOR_INDEX_WAIT_SECONDS = int(os.environ.get("VECTOR_INDEX_WAIT_SECONDS", 600))  # Upper bound on waiting for the search index to build
+
+# Metrics snapshot configuration
+METRICS_BUCKET_SECONDS = int(os.environ.get("METRICS_BUCKET_SECONDS", 10))  # One metrics_data row per bucket
+METRICS_LEASE_SECONDS = int(os.environ.get("METRICS_LEASE_SECONDS", 5))     # How long a worker may hold a bucket while computing
+
+# Metrics retention (raw snapshots expire via TTL index, rollups keep longer history)
+METRICS_RAW_RETENTION_HOURS = int(os.environ.get("METRICS_RAW_RETENTION_HOURS", 24))
+METRICS_MINUTE_RETENTION_DAYS = int(os.environ.get("METRICS_MINUTE_RETENTION_DAYS", 2))
+METRICS_HOUR_RETENTION_DAYS = int(os.environ.get("METRICS_HOUR_RETENTION_DAYS", 90))
+METRICS_DAY_RETENTION_DAYS = int(os.environ.get("METRICS_DAY_RETENTION_DAYS", 730))
+
+# Asset tree cache (TTL-only): changes to machines/parts show up within this many seconds
+ASSET_TREE_CACHE_SECONDS = int(os.environ.get("ASSET_TREE_CACHE_SECONDS", 60))
+ASSET_TREE_PAGE_SIZE = int(os.environ.get("ASSET_TREE_PAGE_SIZE", 50))      # Machines per lazy tree page
+ASSET_TREE_MAX_PAGE_SIZE = int(os.environ.get("ASSET_TREE_MAX_PAGE_SIZE", 500))
+
+# Sensor data storage (MongoDB time-series collection) and bulk ingestion
+SENSOR_TIMESERIES_GRANULARITY = os.environ.get("SENSOR_TIMESERIES_GRANULARITY", "seconds")
+SENSOR_DATA_RETENTION_DAYS = int(os.environ.get("SENSOR_DATA_RETENTION_DAYS", 0))  # 0 keeps readings forever
+SENSOR_INGEST_CHUNK_SIZE = int(os.environ.get("SENSOR_INGEST_CHUNK_SIZE", 1000))   # Documents per insert_many
+SENSOR_PAGE_MAX_ROWS = int(os.environ.get("SENSOR_PAGE_MAX_ROWS", 1000))           # Rows per JSON page of /api/sensor-data
+SENSOR_STREAM_MAX_ROWS = int(os.environ.get("SENSOR_STREAM_MAX_ROWS", 1000000))    # Rows per NDJSON export
+
+# Sensor series returned with asset details
+SENSOR_SERIES_DEFAULT_HOURS = int(os.environ.get("SENSOR_SERIES_DEFAULT_HOURS", 24))  # Recent-readings window health scores are computed over
+SENSOR_SERIES_MAX_POINTS = int(os.environ.get("SENSOR_SERIES_MAX_POINTS", 500))       # Buckets per sensor type
+
+# Asset recommendations are generated off the request path and cached by input hash
+RECOMMENDATION_WORKERS = int(os.environ.get("RECOMMENDATION_WORKERS", 4))
+RECOMMENDATION_TTL_SECONDS = int(os.environ.get("RECOMMENDATION_TTL_SECONDS", 6 * 3600))
+RECOMMENDATION_TIMEOUT_SECONDS = int(os.environ.get("RECOMMENDATION_TIMEOUT_SECONDS", 120))  # Pending claims older than this are retried
+
+# Streaming anomaly detection applied to readings at ingest
+ANOMALY_EWMA_ALPHA = float(os.environ.get("ANOMALY_EWMA_ALPHA", 0.05))          # Weight of each new reading in the rolling mean/variance
+ANOMALY_Z_THRESHOLD = float(os.environ.get("ANOMALY_Z_THRESHOLD", 3.0))         # Readings further than this many std devs are anomalous
+ANOMALY_WARMUP_READINGS = int(os.environ.get("ANOMALY_WARMUP_READINGS", 30))    # Readings per sensor before flagging starts
+ANOMALY_CHECKPOINT_SECONDS = int(os.environ.get("ANOMALY_CHECKPOINT_SECONDS", 30))  # How often each worker merges its detector state into anomaly_state
+
+# Materialized asset health scores
+HEALTH_REFRESH_SECONDS = int(os.environ.get("HEALTH_REFRESH_SECONDS", 300))              # Refresh interval: recounts assets whose anomalies or alerts arrived or aged out since the last one
+HEALTH_HISTORY_RETENTION_DAYS = int(os.environ.get("HEALTH_HISTORY_RETENTION_DAYS", 90))
+HEALTH_PAGE_MAX_ROWS = int(os.environ.get("HEALTH_PAGE_MAX_ROWS", 500))                  # Assets per /api/assets/health response
 
 # Gemini API configuration
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+GEMINI_BASE_URL = os.environ.get("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+GEMINI_TEXT_MODEL = os.environ.get("GEMINI_TEXT_MODEL", "gemini-2.0-flash")
+GEMINI_EMBEDDING_MODEL = os.environ.get("GEMINI_EMBEDDING_MODEL", "embedding-001")
+GEMINI_CONNECT_TIMEOUT = float(os.environ.get("GEMINI_CONNECT_TIMEOUT", 5))
+GEMINI_READ_TIMEOUT = float(os.environ.get("GEMINI_READ_TIMEOUT", 60))
+GEMINI_MAX_RETRIES = int(os.environ.get("GEMINI_MAX_RETRIES", 3))          # Retries on 429/5xx, connection errors and timeouts
+GEMINI_BACKOFF_BASE = float(os.environ.get("GEMINI_BACKOFF_BASE", 0.5))    # Seconds; doubled per attempt, with full jitter
+GEMINI_BACKOFF_MAX = float(os.environ.get("GEMINI_BACKOFF_MAX", 8))
+GEMINI_MAX_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", 8))  # In-flight requests per worker process
+GEMINI_QUEUE_TIMEOUT = float(os.environ.get("GEMINI_QUEUE_TIMEOUT", 30))   # Seconds to wait for a free slot
+GEMINI_POOL_SIZE = int(os.environ.get("GEMINI_POOL_SIZE", 16))             # Keep-alive connections per worker process
+
+# Embedding cache: in-process LRU in front of the embedding_cache collection
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", 2048))        # Entries per worker process
+EMBEDDING_CACHE_TTL_DAYS = int(os.environ.get("EMBEDDING_CACHE_TTL_DAYS", 30))
+EMBEDDING_BATCH_WORKERS = int(os.environ.get("EMBEDDING_BATCH_WORKERS", 4))  # Concurrent batchEmbedContents requests when bulk embedding
+
+# Generation cache: identical Gemini prompts are answered once per TTL, and coalesced while in flight
+GENERATION_CACHE_SIZE = int(os.environ.get("GENERATION_CACHE_SIZE", 512))              # Entries per worker process
+GENERATION_CACHE_TTL_SECONDS = int(os.environ.get("GENERATION_CACHE_TTL_SECONDS", 300))  # Upper bound; prompts with live data expire sooner
+
+# Operational context (metrics and critical-alert summaries) embedded in AI prompts, kept in memory
+CONTEXT_REFRESH_SECONDS = float(os.environ.get("CONTEXT_REFRESH_SECONDS", 5))  # Background rebuild interval
+CONTEXT_MAX_AGE_SECONDS = float(os.environ.get("CONTEXT_MAX_AGE_SECONDS", 30))  # Older snapshots are rebuilt on the request path
+
+# Voice chat transcription
+DEEPGRAM_API_KEY = os.environ.get("DEEPGRAM_API_KEY")
+DEEPGRAM_URL = os.environ.get("DEEPGRAM_URL", "https://api.deepgram.com/v1/listen")
+DEEPGRAM_TIMEOUT = float(os.environ.get("DEEPGRAM_TIMEOUT", 30))         # Seconds per transcription request
+VOICE_CHAT_WORKERS = int(os.environ.get("VOICE_CHAT_WORKERS", 16))        # Concurrent transcriptions/context builds per process
+AUDIO_PREPROCESSING = os.environ.get("AUDIO_PREPROCESSING", "true").lower() in ("true", "1", "yes")  # Trim/downmix/resample WAV uploads
+AUDIO_TARGET_SAMPLE_RATE = int(os.environ.get("AUDIO_TARGET_SAMPLE_RATE", 16000))  # Speech recognition needs no more
+AUDIO_SILENCE_THRESHOLD = float(os.environ.get("AUDIO_SILENCE_THRESHOLD", 0.01))    # Frame RMS below this (full scale 1.0) is silence
+AUDIO_SILENCE_PADDING_MS = int(os.environ.get("AUDIO_SILENCE_PADDING_MS", 200))     # Silence kept around the speech
+
+# Vector search for RAG: "atlas" ($vectorSearch), "local" (in-process NumPy index) or "auto" (Atlas, else local)
+VECTOR_SEARCH_BACKEND = os.environ.get("VECTOR_SEARCH_BACKEND", "auto")
+VECTOR_LOCAL_REFRESH_SECONDS = int(os.environ.get("VECTOR_LOCAL_REFRESH_SECONDS", 300))  # How often the local index reloads embeddings
+VECTOR_ATLAS_RETRY_SECONDS = int(os.environ.get("VECTOR_ATLAS_RETRY_SECONDS", 60))  # auto: how long to use the local index before retrying $vectorSearch
+VECTOR_IVF_MIN_DOCS = int(os.environ.get("VECTOR_IVF_MIN_DOCS", 20000))    # Corpus size from which the local index clusters (IVF)
+VECTOR_IVF_NPROBE = int(os.environ.get("VECTOR_IVF_NPROBE", 8))            # Clusters scanned per IVF query
+VECTOR_SEARCH_EXACT = os.environ.get("VECTOR_SEARCH_EXACT", "false").lower() == "true"  # Exhaustive (ENN) instead of HNSW (ANN) $vectorSearch
+VECTOR_NUM_CANDIDATES_FACTOR = int(os.environ.get("VECTOR_NUM_CANDIDATES_FACTOR", 20))  # ANN numCandidates as a multiple of limit
+VECTOR_MAX_NUM_CANDIDATES = int(os.environ.get("VECTOR_MAX_NUM_CANDIDATES", 10000))     # Atlas's numCandidates ceiling
+VECTOR_MIN_SCORE = float(os.environ.get("VECTOR_MIN_SCORE", 0.75))         # Hits scoring below this are dropped in the pipeline
+VECTOR_RAG_LIMIT = int(os.environ.get("VECTOR_RAG_LIMIT", 3))              # Guides retrieved per RAG query
+VECTOR_GEO_LIMIT = int(os.environ.get("VECTOR_GEO_LIMIT", 5))              # Best practices retrieved per geo-advisor query
+
+# Guides are split into overlapping passages (runs of whole paragraphs) for retrieval
+RAG_PASSAGE_SEARCH = os.environ.get("RAG_PASSAGE_SEARCH", "true").lower() == "true"  # false = search whole guides
+PASSAGE_MAX_CHARS = int(os.environ.get("PASSAGE_MAX_CHARS", 400))          # Upper bound on a passage (unless one paragraph line is longer)
+PASSAGE_OVERLAP_CHARS = int(os.environ.get("PASSAGE_OVERLAP_CHARS", 200))  # Trailing text repeated at the start of the next passage
+RAG_PASSAGE_LIMIT = int(os.environ.get("RAG_PASSAGE_LIMIT", 5))            # Passages retrieved per RAG query
+
+# Lexical search for RAG: "atlas" ($search), "local" (in-process BM25 index) or "auto" (Atlas, else local)
+TEXT_SEARCH_BACKEND = os.environ.get("TEXT_SEARCH_BACKEND", "auto")
+TEXT_LOCAL_REFRESH_SECONDS = int(os.environ.get("TEXT_LOCAL_REFRESH_SECONDS", 300))  # How often the local index reloads guides
+TEXT_ATLAS_RETRY_SECONDS = int(os.environ.get("TEXT_ATLAS_RETRY_SECONDS", 60))  # auto: how long to use the local index before retrying $search
+TEXT_MIN_TERM_MATCH = float(os.environ.get("TEXT_MIN_TERM_MATCH", 0.5))  # Share of distinct query terms a lexical hit must contain (at least one)
+
+# Hybrid retrieval: lexical and vector search fused with reciprocal-rank fusion
+HYBRID_SEARCH = os.environ.get("HYBRID_SEARCH", "true").lower() == "true"  # false = vector search only
+HYBRID_RRF_K = int(os.environ.get("HYBRID_RRF_K", 60))                  # RRF rank damping constant
+HYBRID_LEG_DEPTH = int(os.environ.get("HYBRID_LEG_DEPTH", 20))          # Results fetched from each leg before fusing
+HYBRID_CACHE_SECONDS = int(os.environ.get("HYBRID_CACHE_SECONDS", 300))  # How long fused results are reused per query
+HYBRID_CACHE_SIZE = int(os.environ.get("HYBRID_CACHE_SIZE", 1024))       # Fused result sets kept in memory
+HYBRID_WORKERS = int(os.environ.get("HYBRID_WORKERS", 8))               # Threads running the lexical leg
 
 # Application settings
 UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
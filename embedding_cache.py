@@ -0,0 +1,160 @@
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pymongo import UpdateOne
+from mongo import embedding_cache as embedding_store
+from gemini_client import gemini_client, GEMINI_EMBED_BATCH_LIMIT
+from config import GEMINI_EMBEDDING_MODEL, EMBEDDING_CACHE_SIZE, EMBEDDING_BATCH_WORKERS
+
+logger = logging.getLogger(__name__)
+
+def normalize_text(text):
+    """Unicode-normalized text with whitespace collapsed, so trivially different queries share an entry."""
+    return ' '.join(unicodedata.normalize('NFKC', text).split())
+
+def embedding_key(model, text):
+    """Cache key: model name plus a hash of the normalized text."""
+    digest = hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+    return f'{model}:{digest}'
+
+class EmbeddingCache:
+    """Embeddings keyed by (model, normalized text hash): an in-process LRU over a Mongo store with a TTL."""
+
+    def __init__(self, embed, embed_batch=None, max_entries=EMBEDDING_CACHE_SIZE):
+        # embed(text, model=...) -> list of floats, e.g. GeminiClient.embed_content;
+        # embed_batch(texts, model=...) -> list of those, e.g. GeminiClient.batch_embed_contents
+        self.embed = embed
+        self.embed_batch = embed_batch
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {'memory_hits': 0, 'store_hits': 0, 'misses': 0, 'store_errors': 0, 'embed_ms_total': 0.0}
+
+    def _count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def _remember(self, key, values):
+        with self.lock:
+            self.entries[key] = values
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get(self, text, model=GEMINI_EMBEDDING_MODEL):
+        """Embedding of text, computed at most once per normalized text and model."""
+        key = embedding_key(model, text)
+        with self.lock:
+            values = self.entries.get(key)
+            if values is not None:
+                self.entries.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return values
+
+        try:
+            doc = embedding_store.find_one({'_id': key}, {'values': 1})
+        except Exception as e:
+            logger.error("Embedding cache read failed: %s", e)
+            self._count('store_errors')
+            doc = None
+        if doc:
+            self._count('store_hits')
+            self._remember(key, doc['values'])
+            return doc['values']
+
+        started = time.perf_counter()
+        values = self.embed(normalize_text(text), model=model)
+        self._count('embed_ms_total', (time.perf_counter() - started) * 1000)
+        self._count('misses')
+        self._remember(key, values)
+        try:
+            embedding_store.update_one(
+                {'_id': key},
+                {'$set': {'model': model, 'values': values, 'created_at': datetime.now()}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error("Embedding cache write failed: %s", e)
+            self._count('store_errors')
+        return values
+
+    def get_many(self, texts, model=GEMINI_EMBEDDING_MODEL, batch_size=GEMINI_EMBED_BATCH_LIMIT,
+                 workers=EMBEDDING_BATCH_WORKERS, on_batch=None):
+        """Embeddings of texts in input order; misses are embedded in batches across a bounded pool.
+
+        on_batch(count) is called after each batch of misses is embedded, for progress reporting.
+        """
+        keys = [embedding_key(model, text) for text in texts]
+        found = {}
+        with self.lock:
+            for key in keys:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    found[key] = self.entries[key]
+            self.counters['memory_hits'] += len(found)
+
+        pending = [key for key in dict.fromkeys(keys) if key not in found]
+        if pending:
+            try:
+                for doc in embedding_store.find({'_id': {'$in': pending}}, {'values': 1}):
+                    found[doc['_id']] = doc['values']
+                    self._remember(doc['_id'], doc['values'])
+                    self._count('store_hits')
+            except Exception as e:
+                logger.error("Embedding cache read failed: %s", e)
+                self._count('store_errors')
+
+        # One text per missing key, normalized as in get()
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = normalize_text(text)
+        missing_keys = list(missing)
+        batches = [missing_keys[i:i + batch_size] for i in range(0, len(missing_keys), batch_size)]
+
+        def embed_batch(batch_keys):
+            started = time.perf_counter()
+            batch_texts = [missing[key] for key in batch_keys]
+            if self.embed_batch:
+                vectors = self.embed_batch(batch_texts, model=model)
+            else:
+                vectors = [self.embed(text, model=model) for text in batch_texts]
+            self._count('embed_ms_total', (time.perf_counter() - started) * 1000)
+            self._count('misses', len(batch_keys))
+            now = datetime.now()
+            for key, values in zip(batch_keys, vectors):
+                found[key] = values
+                self._remember(key, values)
+            try:
+                embedding_store.bulk_write([
+                    UpdateOne({'_id': key}, {'$set': {'model': model, 'values': values, 'created_at': now}}, upsert=True)
+                    for key, values in zip(batch_keys, vectors)
+                ], ordered=False)
+            except Exception as e:
+                logger.error("Embedding cache write failed: %s", e)
+                self._count('store_errors')
+            if on_batch:
+                on_batch(len(batch_keys))
+
+        if batches:
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(batches))), thread_name_prefix='embed-batch') as executor:
+                # list() re-raises the first failed batch
+                list(executor.map(embed_batch, batches))
+        return [found[key] for key in keys]
+
+    def stats(self):
+        """Hit/miss counters, hit rate and the network time spent on misses."""
+        with self.lock:
+            stats = dict(self.counters, entries=len(self.entries), max_entries=self.max_entries)
+        lookups = stats['memory_hits'] + stats['store_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['store_hits']) / lookups, 4) if lookups else 0.0
+        stats['embed_ms_avg'] = round(stats['embed_ms_total'] / stats['misses'], 2) if stats['misses'] else 0.0
+        stats['embed_ms_total'] = round(stats['embed_ms_total'], 2)
+        return stats
+
+embedding_cache = EmbeddingCache(gemini_client.embed_content, gemini_client.batch_embed_contents)
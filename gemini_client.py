@@ -0,0 +1,170 @@
+import json
+import time
+import random
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from config import (
+    GEMINI_API_KEY, GEMINI_BASE_URL, GEMINI_TEXT_MODEL, GEMINI_EMBEDDING_MODEL,
+    GEMINI_CONNECT_TIMEOUT, GEMINI_READ_TIMEOUT, GEMINI_MAX_RETRIES, GEMINI_BACKOFF_BASE,
+    GEMINI_BACKOFF_MAX, GEMINI_MAX_CONCURRENCY, GEMINI_QUEUE_TIMEOUT, GEMINI_POOL_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+# Throttling and transient upstream failures are retried; other errors are not
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Most texts batchEmbedContents accepts in one request
+GEMINI_EMBED_BATCH_LIMIT = 100
+
+class GeminiBusyError(requests.exceptions.RequestException):
+    """Raised when no concurrency slot frees up within GEMINI_QUEUE_TIMEOUT."""
+
+class GeminiClient:
+    """Shared Gemini REST client: pooled keep-alive session, timeouts, jittered retries and a concurrency limit."""
+
+    def __init__(self, api_key=GEMINI_API_KEY, base_url=GEMINI_BASE_URL,
+                 timeout=(GEMINI_CONNECT_TIMEOUT, GEMINI_READ_TIMEOUT), max_retries=GEMINI_MAX_RETRIES,
+                 max_concurrency=GEMINI_MAX_CONCURRENCY, pool_size=GEMINI_POOL_SIZE):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        # Retries are handled here so they can be counted and jittered
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.lock = threading.Lock()
+        self.counters = {}
+
+    def url(self, model, method):
+        return f"{self.base_url}/models/{model}:{method}"
+
+    def _record(self, operation, **values):
+        with self.lock:
+            counters = self.counters.setdefault(operation, {
+                'calls': 0, 'errors': 0, 'retries': 0, 'throttled': 0, 'timeouts': 0,
+                'latency_ms_total': 0.0, 'latency_ms_max': 0.0
+            })
+            for key, value in values.items():
+                if key == 'latency_ms':
+                    counters['latency_ms_total'] += value
+                    counters['latency_ms_max'] = max(counters['latency_ms_max'], value)
+                else:
+                    counters[key] += value
+
+    def backoff(self, attempt, response=None):
+        """Full-jitter exponential delay, never shorter than a Retry-After the server sent."""
+        delay = random.uniform(0, min(GEMINI_BACKOFF_MAX, GEMINI_BACKOFF_BASE * 2 ** attempt))
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), GEMINI_BACKOFF_MAX))
+        return delay
+
+    def post(self, model, method, payload, stream=False, params=None):
+        """POST to models/{model}:{method} and return the response; raises requests exceptions on failure.
+
+        With stream=True the concurrency slot covers the request up to the response headers,
+        not the time the caller spends reading the body.
+        """
+        operation = method
+        started = time.perf_counter()
+        self._record(operation, calls=1)
+        if not self.slots.acquire(timeout=GEMINI_QUEUE_TIMEOUT):
+            self._record(operation, errors=1)
+            raise GeminiBusyError(f'Gemini concurrency limit reached for {GEMINI_QUEUE_TIMEOUT}s')
+        try:
+            for attempt in range(self.max_retries + 1):
+                response = None
+                try:
+                    response = self.session.post(
+                        self.url(model, method),
+                        headers={'x-goog-api-key': self.api_key or ''},
+                        json=payload,
+                        timeout=self.timeout,
+                        stream=stream,
+                        params=params
+                    )
+                    if response.status_code not in RETRY_STATUSES:
+                        response.raise_for_status()
+                        return response
+                    if response.status_code == 429:
+                        self._record(operation, throttled=1)
+                    if attempt == self.max_retries:
+                        response.raise_for_status()
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    if isinstance(e, requests.exceptions.Timeout):
+                        self._record(operation, timeouts=1)
+                    if attempt == self.max_retries:
+                        raise
+                self._record(operation, retries=1)
+                if response is not None:
+                    response.close()
+                time.sleep(self.backoff(attempt, response))
+        except Exception:
+            self._record(operation, errors=1)
+            raise
+        finally:
+            self.slots.release()
+            self._record(operation, latency_ms=(time.perf_counter() - started) * 1000)
+
+    def generate_content(self, prompt, generation_config=None, model=GEMINI_TEXT_MODEL):
+        """Text of the first candidate for a single-turn prompt, or None if there is none."""
+        payload = {'contents': [{'parts': [{'text': prompt}]}]}
+        if generation_config:
+            payload['generationConfig'] = generation_config
+        result = self.post(model, 'generateContent', payload).json()
+        candidates = result.get('candidates') or []
+        if not candidates:
+            return None
+        return candidates[0]['content']['parts'][0]['text']
+
+    def stream_generate_content(self, prompt, generation_config=None, model=GEMINI_TEXT_MODEL):
+        """Text chunks of the first candidate as Gemini produces them (streamGenerateContent over SSE)."""
+        payload = {'contents': [{'parts': [{'text': prompt}]}]}
+        if generation_config:
+            payload['generationConfig'] = generation_config
+        response = self.post(model, 'streamGenerateContent', payload, stream=True, params={'alt': 'sse'})
+        try:
+            # Lines as bytes: text/event-stream is UTF-8, but requests would decode it as ISO-8859-1
+            for line in response.iter_lines():
+                line = line.decode('utf-8')
+                if not line.startswith('data:'):
+                    continue
+                for candidate in json.loads(line[len('data:'):]).get('candidates') or []:
+                    for part in candidate.get('content', {}).get('parts', []):
+                        if part.get('text'):
+                            yield part['text']
+                    break
+        finally:
+            response.close()
+
+    def embed_content(self, text, model=GEMINI_EMBEDDING_MODEL):
+        """Embedding vector for text."""
+        payload = {'model': f'models/{model}', 'content': {'parts': [{'text': text}]}}
+        return self.post(model, 'embedContent', payload).json()['embedding']['values']
+
+    def batch_embed_contents(self, texts, model=GEMINI_EMBEDDING_MODEL):
+        """Embedding vectors for up to GEMINI_EMBED_BATCH_LIMIT texts in one request, in input order."""
+        payload = {'requests': [
+            {'model': f'models/{model}', 'content': {'parts': [{'text': text}]}}
+            for text in texts
+        ]}
+        return [e['values'] for e in self.post(model, 'batchEmbedContents', payload).json()['embeddings']]
+
+    def stats(self):
+        """Per-operation call, retry and error counters with latency figures."""
+        with self.lock:
+            counters = {op: dict(values) for op, values in self.counters.items()}
+        for values in counters.values():
+            values['latency_ms_avg'] = round(values['latency_ms_total'] / values['calls'], 2) if values['calls'] else 0.0
+            values['latency_ms_total'] = round(values['latency_ms_total'], 2)
+            values['latency_ms_max'] = round(values['latency_ms_max'], 2)
+        return counters
+
+gemini_client = GeminiClient()
@@ -0,0 +1,135 @@
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from gemini_client import gemini_client
+from config import GEMINI_TEXT_MODEL, GENERATION_CACHE_SIZE, GENERATION_CACHE_TTL_SECONDS
+
+def generation_key(model, prompt, generation_config=None):
+    """Cache key: model plus a hash of the prompt and its generationConfig."""
+    config = json.dumps(generation_config or {}, sort_keys=True)
+    digest = hashlib.sha256(f"{prompt}\n{config}".encode('utf-8')).hexdigest()
+    return f'{model}:{digest}'
+
+class GenerationCache:
+    """Gemini generation results by (model, prompt, generationConfig): an in-process LRU with
+    per-entry TTLs, plus single-flight coalescing so identical prompts in flight share one call.
+
+    Failures and empty responses are shared with the callers waiting on them but not cached.
+    """
+
+    def __init__(self, generate, stream=None, max_entries=GENERATION_CACHE_SIZE, default_ttl=GENERATION_CACHE_TTL_SECONDS):
+        # generate(prompt, generation_config=..., model=...) -> text or None, e.g. GeminiClient.generate_content;
+        # stream(same arguments) -> iterator of text chunks, e.g. GeminiClient.stream_generate_content
+        self.generate_upstream = generate
+        self.stream_upstream = stream
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'coalesced': 0, 'misses': 0, 'errors': 0, 'upstream_ms_total': 0.0, 'saved_ms_total': 0.0}
+
+    def _lookup(self, key):
+        """Cached text for key, counting the hit, or None."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or time.monotonic() >= entry['expires_at']:
+                return None
+            self.entries.move_to_end(key)
+            self.counters['hits'] += 1
+            self.counters['saved_ms_total'] += entry['upstream_ms']
+            return entry['text']
+
+    def _store(self, key, text, upstream_ms, ttl):
+        # Caller holds the lock
+        self.counters['upstream_ms_total'] += upstream_ms
+        if text and ttl > 0:
+            self.entries[key] = {'text': text, 'upstream_ms': upstream_ms, 'expires_at': time.monotonic() + ttl}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def generate(self, prompt, generation_config=None, model=GEMINI_TEXT_MODEL, ttl=None):
+        """Text for prompt, reusing a cached or in-flight result for the same key.
+
+        ttl bounds how long the result is reused (default GENERATION_CACHE_TTL_SECONDS); pass the
+        remaining freshness of any live data embedded in the prompt. ttl <= 0 still coalesces.
+        """
+        ttl = self.default_ttl if ttl is None else min(ttl, self.default_ttl)
+        key = generation_key(model, prompt, generation_config)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        with self.lock:
+            future = self.in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self.in_flight[key] = Future()
+                self.counters['misses'] += 1
+            else:
+                self.counters['coalesced'] += 1
+
+        if not leader:
+            text, upstream_ms = future.result()
+            with self.lock:
+                self.counters['saved_ms_total'] += upstream_ms
+            return text
+
+        started = time.perf_counter()
+        try:
+            text = self.generate_upstream(prompt, generation_config=generation_config, model=model)
+        except BaseException as e:
+            with self.lock:
+                self.counters['errors'] += 1
+                del self.in_flight[key]
+            future.set_exception(e)
+            raise
+        upstream_ms = (time.perf_counter() - started) * 1000
+        with self.lock:
+            self._store(key, text, upstream_ms, ttl)
+            del self.in_flight[key]
+        future.set_result((text, upstream_ms))
+        return text
+
+    def stream(self, prompt, generation_config=None, model=GEMINI_TEXT_MODEL, ttl=None):
+        """Text chunks for prompt: the cached text in one chunk, or Gemini's chunks as they arrive.
+
+        A completed stream is cached like generate(); streams are not coalesced, since each
+        caller wants its own first chunk as early as possible.
+        """
+        ttl = self.default_ttl if ttl is None else min(ttl, self.default_ttl)
+        key = generation_key(model, prompt, generation_config)
+        cached = self._lookup(key)
+        if cached is not None:
+            yield cached
+            return
+        with self.lock:
+            self.counters['misses'] += 1
+        started = time.perf_counter()
+        chunks = []
+        try:
+            for chunk in self.stream_upstream(prompt, generation_config=generation_config, model=model):
+                chunks.append(chunk)
+                yield chunk
+        except Exception:
+            with self.lock:
+                self.counters['errors'] += 1
+            raise
+        with self.lock:
+            self._store(key, ''.join(chunks), (time.perf_counter() - started) * 1000, ttl)
+
+    def stats(self):
+        """Hit and coalescing counters, hit rate and the upstream latency they saved."""
+        with self.lock:
+            stats = dict(self.counters, entries=len(self.entries), in_flight=len(self.in_flight), max_entries=self.max_entries)
+        lookups = stats['hits'] + stats['coalesced'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['coalesced']) / lookups, 4) if lookups else 0.0
+        stats['upstream_ms_avg'] = round(stats['upstream_ms_total'] / stats['misses'], 2) if stats['misses'] else 0.0
+        stats['upstream_ms_total'] = round(stats['upstream_ms_total'], 2)
+        stats['saved_ms_total'] = round(stats['saved_ms_total'], 2)
+        return stats
+
+generation_cache = GenerationCache(gemini_client.generate_content, gemini_client.stream_generate_content)
@@ -0,0 +1,274 @@
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from mongo import machines, parts, alerts, sensor_data, health_history, cache_versions, SENSOR_META_FIELD
+from config import SENSOR_SERIES_DEFAULT_HOURS, HEALTH_REFRESH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENALTY = {
+    'critical': 40,
+    'error': 30,
+    'warning': 20,
+    'maintenance': 15,
+    'in_transit': 10
+}
+ALERT_PENALTY = 5
+MAX_PENALIZED_ALERTS = 5
+ANOMALY_PENALTY = 2
+
+ASSET_COLLECTIONS = {'machine': machines, 'part': parts}
+
+REFRESH_KEY = 'health_refresh'
+
+# Full recomputations run off the request path
+_refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='health-refresh')
+
+def health_score(status, alert_count, anomaly_count):
+    """Device health score (0-100) from status, alert and anomaly counts."""
+    score = 100 - STATUS_PENALTY.get(status or 'operational', 0)
+    score -= min(alert_count, MAX_PENALIZED_ALERTS) * ALERT_PENALTY
+    score -= anomaly_count * ANOMALY_PENALTY
+    return max(0, min(100, score))
+
+# Assets whose status changed since their score was computed
+STATUS_CHANGED = {'$expr': {'$ne': [{'$ifNull': ['$status', None]}, {'$ifNull': ['$health.status', None]}]}}
+
+# health_score() as an aggregation expression over a machine/part document
+SCORE_EXPRESSION = {'$max': [0, {'$min': [100, {'$subtract': [100, {'$add': [
+    {'$switch': {
+        'branches': [{'case': {'$eq': ['$status', status]}, 'then': penalty} for status, penalty in STATUS_PENALTY.items()],
+        'default': 0
+    }},
+    {'$multiply': [{'$min': ['$health.alerts', MAX_PENALIZED_ALERTS]}, ALERT_PENALTY]},
+    {'$multiply': ['$health.anomalies', ANOMALY_PENALTY]}
+]}]}]}]}
+
+def health_update(anomalies, alert_count, now, absolute=False):
+    """Update pipeline applying anomaly/alert counts (or increments) and rescoring in place;
+    the status the score was computed from is kept in health.status."""
+    def value(field, n):
+        return {'$literal': n} if absolute else {'$add': [{'$ifNull': [f'$health.{field}', 0]}, n]}
+    return [
+        {'$set': {
+            'health.previous_score': {'$ifNull': ['$health_score', None]},
+            'health.anomalies': value('anomalies', anomalies),
+            'health.alerts': value('alerts', alert_count),
+            'health.status': {'$ifNull': ['$status', None]}
+        }},
+        {'$set': {'health_score': SCORE_EXPRESSION, 'health.updated_at': now}}
+    ]
+
+def _object_id(value):
+    return ObjectId(value) if ObjectId.is_valid(str(value)) else value
+
+def _record_history(asset_type, now, ids):
+    """Append a history point for each of ids whose score changed in the update stamped now."""
+    points = [
+        {'asset_type': asset_type, 'asset_id': str(doc['_id']), 'score': doc['health_score'], 'timestamp': now}
+        for doc in ASSET_COLLECTIONS[asset_type].find(
+            {'_id': {'$in': ids}, 'health.updated_at': now}, {'health_score': 1, 'health.previous_score': 1}
+        )
+        if doc.get('health_score') != doc.get('health', {}).get('previous_score')
+    ]
+    if points:
+        health_history.insert_many(points, ordered=False)
+
+def apply_deltas(deltas):
+    """Increment anomaly/alert counts per asset and rescore; deltas maps (asset_type, id) -> (anomalies, alerts)."""
+    now = datetime.now()
+    by_type = defaultdict(dict)
+    for (asset_type, asset_id), (anomalies, alert_count) in deltas.items():
+        by_type[asset_type][_object_id(asset_id)] = health_update(anomalies, alert_count, now)
+    for asset_type, updates in by_type.items():
+        ASSET_COLLECTIONS[asset_type].bulk_write(
+            [UpdateOne({'_id': asset_id}, update) for asset_id, update in updates.items()], ordered=False
+        )
+        _record_history(asset_type, now, list(updates))
+
+def ingest_deltas(docs, raised):
+    """Per-asset anomaly and alert increments for a scored ingest batch."""
+    deltas = defaultdict(lambda: [0, 0])
+    for doc in docs:
+        if doc.get('is_anomaly'):
+            for field in ('machine_id', 'part_id'):
+                if doc[SENSOR_META_FIELD].get(field):
+                    deltas[(field[:-3], str(doc[SENSOR_META_FIELD][field]))][0] += 1
+    for alert in raised:
+        for field in ('machine_id', 'part_id'):
+            if alert.get(field):
+                deltas[(field[:-3], alert[field])][1] += 1
+    return {key: tuple(counts) for key, counts in deltas.items()}
+
+def _id_keys(asset_ids):
+    """Asset ids are stored either as strings or ObjectIds; match both."""
+    return [str(i) for i in asset_ids] + [ObjectId(i) for i in asset_ids if ObjectId.is_valid(str(i))]
+
+def _facet_counts(collection, match, id_field, ids=None):
+    """{asset_type: {asset_id: matching documents}} in one aggregation, optionally only for ids."""
+    counts = {'machine': {}, 'part': {}}
+    if ids is not None:
+        of_ids = [
+            {id_field.format(asset_type): {'$in': _id_keys(ids[asset_type])}} for asset_type in counts if ids[asset_type]
+        ]
+        if not of_ids:
+            return counts
+        match = {'$and': [match, {'$or': of_ids}]}
+    pipeline = [
+        {'$match': match},
+        {'$facet': {
+            asset_type: [{'$group': {'_id': f'${id_field.format(asset_type)}', 'count': {'$sum': 1}}}]
+            for asset_type in counts
+        }}
+    ]
+    for result in collection.aggregate(pipeline):
+        for asset_type in counts:
+            counts[asset_type] = {str(row['_id']): row['count'] for row in result[asset_type] if row['_id']}
+    return counts
+
+def _anomaly_counts(timestamps, ids=None):
+    """{asset_type: {asset_id: anomalous readings}} with timestamps matching any of the given ranges."""
+    match = {'is_anomaly': True, '$or': [{'timestamp': r} for r in timestamps]}
+    return _facet_counts(sensor_data, match, SENSOR_META_FIELD + '.{}_id', ids)
+
+def _alert_counts(timestamps, ids=None):
+    """{asset_type: {asset_id: alerts}} with timestamps matching any of the given ranges."""
+    return _facet_counts(alerts, {'$or': [{'timestamp': r} for r in timestamps]}, '{}_id', ids)
+
+def refresh_health_scores(window_hours=SENSOR_SERIES_DEFAULT_HOURS):
+    """Recount anomalies and alerts in the scoring window for the assets whose counts may have
+    changed since the last refresh: those with readings or alerts newer than its watermark,
+    those whose readings or alerts have since aged out of the window, and those whose status
+    changed since they were scored.
+
+    Ingest keeps counts current between refreshes (apply_deltas); this catches what ages out.
+    """
+    now = datetime.now()
+    window = timedelta(hours=window_hours)
+    watermark = (cache_versions.find_one({'_id': REFRESH_KEY}) or {}).get('watermark')
+    touched = {asset_type: set() for asset_type in ASSET_COLLECTIONS}
+    if watermark is None:
+        # First refresh: everything in the window, plus assets still carrying counts from before it
+        ranges = [{'$gte': now - window}]
+        for asset_type, collection in ASSET_COLLECTIONS.items():
+            counted = collection.find({'$or': [{'health.anomalies': {'$gt': 0}}, {'health.alerts': {'$gt': 0}}]}, {'_id': 1})
+            touched[asset_type].update(str(doc['_id']) for doc in counted)
+    else:
+        ranges = [{'$gte': watermark}, {'$gte': watermark - window, '$lt': now - window}]
+    for counts in (_anomaly_counts(ranges), _alert_counts(ranges)):
+        for asset_type in touched:
+            touched[asset_type].update(counts[asset_type])
+    for asset_type, collection in ASSET_COLLECTIONS.items():
+        touched[asset_type].update(str(doc['_id']) for doc in collection.find(STATUS_CHANGED, {'_id': 1}))
+
+    in_window = [{'$gte': now - window}]
+    anomaly_counts = _anomaly_counts(in_window, touched)
+    alert_counts = _alert_counts(in_window, touched)
+    for asset_type, collection in ASSET_COLLECTIONS.items():
+        ids = [_object_id(asset_id) for asset_id in touched[asset_type]]
+        if ids:
+            collection.bulk_write([
+                UpdateOne({'_id': _object_id(asset_id)}, health_update(
+                    anomaly_counts[asset_type].get(asset_id, 0), alert_counts[asset_type].get(asset_id, 0), now, absolute=True
+                ))
+                for asset_id in touched[asset_type]
+            ], ordered=False)
+            _record_history(asset_type, now, ids)
+    cache_versions.update_one({'_id': REFRESH_KEY}, {'$set': {'watermark': now}}, upsert=True)
+    return {asset_type: len(ids) for asset_type, ids in touched.items()}
+
+def maybe_refresh():
+    """Schedule a refresh if none ran in the last HEALTH_REFRESH_SECONDS in any worker."""
+    now = datetime.now()
+    stale_before = now - timedelta(seconds=HEALTH_REFRESH_SECONDS)
+    # Read first: nearly every call finds a recent refresh and should not cost a write
+    marker = cache_versions.find_one({'_id': REFRESH_KEY}, {'refreshed_at': 1})
+    if marker and marker.get('refreshed_at') and marker['refreshed_at'] >= stale_before:
+        return False
+    try:
+        cache_versions.find_one_and_update(
+            {'_id': REFRESH_KEY, '$or': [{'refreshed_at': {'$lt': stale_before}}, {'refreshed_at': {'$exists': False}}]},
+            {'$set': {'refreshed_at': now}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Another worker claimed it first
+        return False
+    _refresh_executor.submit(_refresh_safely)
+    return True
+
+def _refresh_safely():
+    try:
+        refresh_health_scores()
+    except Exception as e:
+        logger.error("Health score refresh failed: %s", e)
+
+def ensure_health(asset_type, asset):
+    """Stored health score of an asset document, materializing it on first use and rescoring
+    it if the status changed since it was scored."""
+    now = datetime.now()
+    asset_id = str(asset['_id'])
+    health = asset.get('health') or {}
+    if asset.get('health_score') is not None:
+        if health.get('status') == asset.get('status'):
+            return asset['health_score']
+        # Same counts, current status
+        ASSET_COLLECTIONS[asset_type].update_one({'_id': _object_id(asset_id)}, health_update(0, 0, now))
+        _record_history(asset_type, now, [_object_id(asset_id)])
+        return health_score(asset.get('status'), health.get('alerts', 0), health.get('anomalies', 0))
+    field = f'{asset_type}_id'
+    since = now - timedelta(hours=SENSOR_SERIES_DEFAULT_HOURS)
+    anomalies = sensor_data.count_documents({
+        f'{SENSOR_META_FIELD}.{field}': {'$in': [asset_id, _object_id(asset_id)]},
+        'is_anomaly': True, 'timestamp': {'$gte': since}
+    })
+    alert_count = alerts.count_documents({field: asset_id, 'timestamp': {'$gte': since}})
+    ASSET_COLLECTIONS[asset_type].update_one(
+        {'_id': _object_id(asset_id)}, health_update(anomalies, alert_count, now, absolute=True)
+    )
+    _record_history(asset_type, now, [_object_id(asset_id)])
+    return health_score(asset.get('status'), alert_count, anomalies)
+
+def worst_assets(asset_type=None, below=None, descending=False, limit=50):
+    """Assets ordered by stored health score, optionally only those below a threshold."""
+    query = {'health_score': {'$ne': None}}
+    if below is not None:
+        query['health_score'] = {'$lt': below}
+    projection = {'name': 1, 'status': 1, 'machine_id': 1, 'health_score': 1, 'health': 1}
+    results = []
+    for kind, collection in ASSET_COLLECTIONS.items():
+        if asset_type and kind != asset_type:
+            continue
+        for doc in collection.find(query, projection).sort('health_score', -1 if descending else 1).limit(limit):
+            health = doc.get('health', {})
+            results.append({
+                'asset_type': kind,
+                'id': str(doc['_id']),
+                'name': doc.get('name', ''),
+                'status': doc.get('status', 'operational'),
+                'machine_id': str(doc['machine_id']) if doc.get('machine_id') else None,
+                'health_score': doc['health_score'],
+                'alerts': health.get('alerts', 0),
+                'anomalies': health.get('anomalies', 0),
+                'updated_at': health.get('updated_at')
+            })
+    results.sort(key=lambda r: r['health_score'], reverse=descending)
+    return results[:limit]
+
+def get_health_history(asset_type, asset_id, since=None, limit=100):
+    """Score history of one asset, newest first."""
+    query = {'asset_type': asset_type, 'asset_id': asset_id}
+    if since:
+        query['timestamp'] = {'$gte': since}
+    return [
+        {'score': point['score'], 'timestamp': point['timestamp'].isoformat()}
+        for point in health_history.find(query).sort('timestamp', -1).limit(limit)
+    ]
+
+if __name__ == '__main__':
+    refresh_health_scores()
+    print("Health scores refreshed.")
@@ -0,0 +1,161 @@
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from embedding_cache import embedding_cache, normalize_text
+from vector_search import vector_backend, filter_values
+from text_search import text_backend
+from config import HYBRID_RRF_K, HYBRID_LEG_DEPTH, HYBRID_CACHE_SECONDS, HYBRID_CACHE_SIZE, HYBRID_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# The lexical leg runs here while the request thread embeds the query and runs the vector leg
+_executor = ThreadPoolExecutor(max_workers=HYBRID_WORKERS, thread_name_prefix='hybrid-search')
+
+def result_key(doc):
+    """Identity of a hit: its passage id, or the title for whole-document collections."""
+    return doc.get('passage_id') or doc['title']
+
+def rrf_fuse(rankings, limit, k=HYBRID_RRF_K, key=result_key):
+    """Reciprocal-rank fusion of {leg: ranked results}: each leg adds 1 / (k + rank) to a document.
+
+    score is the fused score scaled to 0..1 (1 = ranked first by every leg); each leg's own
+    score is kept as <leg>_score.
+    """
+    fused = {}
+    for leg, results in rankings.items():
+        for rank, doc in enumerate(results, 1):
+            entry = fused.get(key(doc))
+            if entry is None:
+                entry = fused[key(doc)] = {field: value for field, value in doc.items() if field != 'score'}
+                entry.update(rrf_score=0.0, matched_by=[])
+            entry['rrf_score'] += 1.0 / (k + rank)
+            entry[f'{leg}_score'] = doc.get('score')
+            entry['matched_by'].append(leg)
+    best = sorted(fused.values(), key=lambda entry: entry['rrf_score'], reverse=True)[:limit]
+    ceiling = len(rankings) / (k + 1)
+    for entry in best:
+        entry['score'] = round(entry['rrf_score'] / ceiling, 4) if ceiling else 0.0
+    return best
+
+class HybridRetriever:
+    """Lexical and vector search over one collection, run concurrently and fused with RRF.
+
+    Each leg applies its own relevance floor before fusing: VECTOR_MIN_SCORE for the vector
+    leg, TEXT_MIN_TERM_MATCH of the query's terms for the lexical one.
+
+    Fused results are cached per (normalized query, limit, filters) for HYBRID_CACHE_SECONDS.
+    If one leg fails the other's results are returned (uncached).
+    """
+
+    def __init__(self, collection, embed=embedding_cache.get, depth=HYBRID_LEG_DEPTH,
+                 cache_seconds=HYBRID_CACHE_SECONDS, max_entries=HYBRID_CACHE_SIZE):
+        self.collection = collection
+        self.embed = embed
+        self.depth = depth
+        self.cache_seconds = cache_seconds
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {
+            'hits': 0, 'misses': 0, 'text_errors': 0, 'vector_errors': 0,
+            'text_ms_total': 0.0, 'vector_ms_total': 0.0, 'search_ms_total': 0.0
+        }
+
+    def _count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def _cached(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() > entry[0]:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry[1]
+
+    def _remember(self, key, results):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.cache_seconds, results)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _timed(self, leg, search):
+        started = time.perf_counter()
+        try:
+            return search()
+        finally:
+            self._count(f'{leg}_ms_total', (time.perf_counter() - started) * 1000)
+
+    def _text_leg(self, text, depth, filters):
+        return self._timed('text', lambda: text_backend(self.collection).search(text, depth, filters))
+
+    def _vector_leg(self, text, depth, filters):
+        return self._timed('vector', lambda: vector_backend(self.collection).search(self.embed(text), depth, filters=filters))
+
+    def search(self, text, limit, filters=None):
+        """Top limit documents for text, best first; see rrf_fuse for the result fields."""
+        key = (normalize_text(text), limit, json.dumps(filter_values(filters), sort_keys=True, default=str))
+        cached = self._cached(key)
+        if cached is not None:
+            return [dict(doc) for doc in cached]
+        self._count('misses')
+
+        started = time.perf_counter()
+        depth = max(limit, self.depth)
+        text_future = _executor.submit(self._text_leg, text, depth, filters)
+        rankings, failed = {}, []
+        try:
+            rankings['vector'] = self._vector_leg(text, depth, filters)
+        except Exception as e:
+            logger.error("Vector leg of hybrid search failed: %s", e)
+            self._count('vector_errors')
+            failed.append(e)
+        try:
+            rankings['text'] = text_future.result()
+        except Exception as e:
+            logger.error("Text leg of hybrid search failed: %s", e)
+            self._count('text_errors')
+            failed.append(e)
+        if not rankings:
+            raise failed[0]
+
+        results = rrf_fuse(rankings, limit)
+        self._count('search_ms_total', (time.perf_counter() - started) * 1000)
+        if not failed:
+            self._remember(key, results)
+        return [dict(doc) for doc in results]
+
+    def stats(self):
+        """Cache hit rate and average per-leg and end-to-end latency of uncached searches."""
+        with self.lock:
+            stats = dict(self.counters, entries=len(self.entries), max_entries=self.max_entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        for name in ('text_ms', 'vector_ms', 'search_ms'):
+            total = stats.pop(f'{name}_total')
+            stats[f'{name}_avg'] = round(total / stats['misses'], 2) if stats['misses'] else 0.0
+        return stats
+
+_retrievers = {}
+_retrievers_lock = threading.Lock()
+
+def hybrid_retriever(collection):
+    """Shared hybrid retriever for a collection."""
+    with _retrievers_lock:
+        if collection.full_name not in _retrievers:
+            _retrievers[collection.full_name] = HybridRetriever(collection)
+        return _retrievers[collection.full_name]
+
+def retriever_stats():
+    """stats() of every retriever, keyed by collection."""
+    with _retrievers_lock:
+        retrievers = dict(_retrievers)
+    return {name: retriever.stats() for name, retriever in retrievers.items()}
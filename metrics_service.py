@@ -0,0 +1,301 @@
+import time
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from mongo import machines, parts, organs, metrics_data, metrics_rollups
+from config import (
+    METRICS_BUCKET_SECONDS, METRICS_LEASE_SECONDS,
+    METRICS_MINUTE_RETENTION_DAYS, METRICS_HOUR_RETENTION_DAYS, METRICS_DAY_RETENTION_DAYS
+)
+
+logger = logging.getLogger(__name__)
+
+FAILURE_STATUSES = ('critical', 'error', 'maintenance')
+ORGAN_STATUSES = ('available', 'in_transit', 'reserved', 'delivered')
+
+# Default value, could be calculated from actual data
+AVG_RESPONSE_MINUTES = 2.3
+
+# Fields returned by /api/metrics
+PUBLIC_FIELDS = (
+    'total_organs',
+    'total_flights',
+    'total_devices',
+    'active_failures',
+    'avg_response',
+    'success_rate',
+    'total_available_organs',
+    'total_in_transit_organs',
+    'total_reserved_organs',
+    'total_delivered_organs',
+    'total_medical_organs',
+)
+
+# Numeric fields aggregated into minute/hour/day rollups
+ROLLUP_FIELDS = (
+    'total_organs',
+    'total_flights',
+    'total_devices',
+    'active_failures',
+    'operational_devices',
+    'total_machines',
+    'total_parts',
+    'total_available_organs',
+    'total_in_transit_organs',
+    'total_reserved_organs',
+    'total_delivered_organs',
+    'total_medical_organs',
+)
+
+# Rollup resolution -> (bucket truncation, retention)
+ROLLUP_RESOLUTIONS = {
+    'minute': (dict(second=0, microsecond=0), timedelta(days=METRICS_MINUTE_RETENTION_DAYS)),
+    'hour': (dict(minute=0, second=0, microsecond=0), timedelta(days=METRICS_HOUR_RETENTION_DAYS)),
+    'day': (dict(hour=0, minute=0, second=0, microsecond=0), timedelta(days=METRICS_DAY_RETENTION_DAYS)),
+}
+
+# Rollups are written off the request path
+_rollup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='metrics-rollup')
+
+# Timing of the most recent refresh, for diagnostics
+last_refresh = {'round_trips': 0, 'elapsed_ms': 0.0, 'timestamp': None}
+
+# Snapshot served to every request of the current bucket in this worker
+_snapshot = {'bucket': None, 'metrics': None}
+_snapshot_lock = threading.Lock()
+# Bucket -> Future of the snapshot one request thread is loading; the lock is not held meanwhile
+_loading = {}
+
+# Matches metrics_data rows that hold a finished snapshot
+COMPLETED_SNAPSHOT = {'computing': {'$exists': False}}
+
+def _group_by_status(source):
+    """Pipeline stage counting documents per status, tagged with the source collection."""
+    return {'$group': {'_id': {'source': source, 'status': '$status'}, 'count': {'$sum': 1}}}
+
+def status_counts_pipeline():
+    """Single pipeline counting machines, parts and organs per status via $unionWith."""
+    return [
+        _group_by_status('machines'),
+        {'$unionWith': {'coll': parts.name, 'pipeline': [_group_by_status('parts')]}},
+        {'$unionWith': {'coll': organs.name, 'pipeline': [_group_by_status('organs')]}},
+    ]
+
+def collect_status_counts():
+    """Return {collection: {status: count}} for machines, parts and organs in one round-trip."""
+    counts = {'machines': {}, 'parts': {}, 'organs': {}}
+    for row in machines.aggregate(status_counts_pipeline()):
+        counts[row['_id']['source']][row['_id'].get('status')] = row['count']
+    return counts
+
+def build_metrics(counts):
+    """Build the metrics document from per-collection status counts."""
+    machine_counts = counts['machines']
+    part_counts = counts['parts']
+    organ_counts = counts['organs']
+
+    # Count total organs (machines + parts)
+    total_machines = sum(machine_counts.values())
+    total_parts = sum(part_counts.values())
+    total_organs = total_machines + total_parts
+
+    # Count total flights (machines with in_transit status)
+    total_flights = machine_counts.get('in_transit', 0)
+
+    # Count total devices monitored (all machines and parts)
+    total_devices = total_organs
+
+    # Count active failures (critical, error, maintenance status)
+    active_failures = sum(machine_counts.get(s, 0) + part_counts.get(s, 0) for s in FAILURE_STATUSES)
+
+    # Calculate success rate (operational devices / total devices)
+    operational_devices = machine_counts.get('operational', 0) + part_counts.get('operational', 0)
+    success_rate = (operational_devices / total_devices * 100) if total_devices > 0 else 0
+
+    # Medical organ metrics from the organs collection
+    total_available_organs = organ_counts.get('available', 0)
+    total_in_transit_organs = organ_counts.get('in_transit', 0)
+    total_reserved_organs = organ_counts.get('reserved', 0)
+    total_delivered_organs = organ_counts.get('delivered', 0)
+    total_medical_organs = sum(organ_counts.get(s, 0) for s in ORGAN_STATUSES)
+
+    return {
+        'total_organs': total_organs,
+        'total_flights': total_flights,
+        'total_devices': total_devices,
+        'active_failures': active_failures,
+        'avg_response': f'{AVG_RESPONSE_MINUTES:.1f}m',
+        'success_rate': f'{success_rate:.1f}%',
+        'timestamp': datetime.now(),
+        'operational_devices': operational_devices,
+        'total_machines': total_machines,
+        'total_parts': total_parts,
+        'total_available_organs': total_available_organs,
+        'total_in_transit_organs': total_in_transit_organs,
+        'total_reserved_organs': total_reserved_organs,
+        'total_delivered_organs': total_delivered_organs,
+        'total_medical_organs': total_medical_organs
+    }
+
+def compute_metrics():
+    """Compute the dashboard metrics and record how long the refresh took."""
+    started = time.perf_counter()
+    metrics = build_metrics(collect_status_counts())
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    last_refresh.update({'round_trips': 1, 'elapsed_ms': round(elapsed_ms, 2), 'timestamp': metrics['timestamp']})
+    metrics['refresh_round_trips'] = 1
+    metrics['refresh_ms'] = round(elapsed_ms, 2)
+    logger.debug("Metrics refresh: 1 round-trip in %.2f ms", elapsed_ms)
+    return metrics
+
+def public_metrics(metrics):
+    """Subset of a metrics document returned by /api/metrics."""
+    return {key: metrics[key] for key in PUBLIC_FIELDS}
+
+def current_bucket(now=None):
+    """Index of the time bucket containing now."""
+    return int((now if now is not None else time.time()) // METRICS_BUCKET_SECONDS)
+
+def get_snapshot():
+    """Return the metrics snapshot for the current bucket, computing it at most once across workers."""
+    bucket = current_bucket()
+    with _snapshot_lock:
+        if _snapshot['bucket'] == bucket:
+            return _snapshot['metrics']
+        previous = _snapshot['metrics']
+        future = _loading.get(bucket)
+        leader = future is None
+        if leader:
+            future = _loading[bucket] = Future()
+    if not leader:
+        # One thread loads the bucket (possibly waiting on another worker); the rest keep
+        # serving the previous snapshot rather than queueing behind it
+        return previous if previous is not None else future.result()
+    try:
+        metrics = _load_or_compute(bucket)
+    except BaseException as e:
+        with _snapshot_lock:
+            del _loading[bucket]
+        future.set_exception(e)
+        raise
+    with _snapshot_lock:
+        if _snapshot['bucket'] is None or bucket > _snapshot['bucket']:
+            _snapshot.update(bucket=bucket, metrics=metrics)
+        del _loading[bucket]
+    future.set_result(metrics)
+    return metrics
+
+def _load_or_compute(bucket):
+    """Serve the persisted snapshot for bucket, or claim the bucket and compute it."""
+    now = datetime.now()
+    try:
+        existing = metrics_data.find_one_and_update(
+            {'bucket': bucket},
+            {'$setOnInsert': {'bucket': bucket, 'computing': True, 'timestamp': now,
+                              'lease_until': now + timedelta(seconds=METRICS_LEASE_SECONDS)}},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+    except DuplicateKeyError:
+        # Another worker inserted the placeholder between our read and write
+        existing = {'computing': True}
+    if existing is None:
+        return _publish(bucket)
+    if not existing.get('computing'):
+        return existing
+    return _wait_for(bucket)
+
+def _publish(bucket):
+    """Compute the snapshot for a bucket this worker has claimed and persist it."""
+    try:
+        metrics = compute_metrics()
+        metrics['bucket'] = bucket
+        metrics_data.update_one(
+            {'bucket': bucket},
+            {'$set': metrics, '$unset': {'computing': '', 'lease_until': ''}}
+        )
+    except Exception:
+        # Release the claim so another request can retry this bucket
+        metrics_data.delete_one({'bucket': bucket, 'computing': True})
+        raise
+    _rollup_executor.submit(record_rollups, dict(metrics))
+    return metrics
+
+def _wait_for(bucket):
+    """Wait for the worker computing bucket to publish, taking over if its lease expires."""
+    deadline = time.monotonic() + METRICS_LEASE_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        done = metrics_data.find_one({'bucket': bucket, **COMPLETED_SNAPSHOT})
+        if done:
+            return done
+    now = datetime.now()
+    taken = metrics_data.find_one_and_update(
+        {'bucket': bucket, 'computing': True, 'lease_until': {'$lt': now}},
+        {'$set': {'lease_until': now + timedelta(seconds=METRICS_LEASE_SECONDS)}}
+    )
+    if taken:
+        return _publish(bucket)
+    # Still being computed elsewhere; the previous bucket is close enough
+    previous = metrics_data.find_one(COMPLETED_SNAPSHOT, sort=[('timestamp', -1)])
+    return previous or compute_metrics()
+
+def record_rollups(metrics):
+    """Fold one snapshot into its minute, hour and day rollup buckets."""
+    try:
+        timestamp = metrics['timestamp']
+        values = {field: metrics.get(field, 0) for field in ROLLUP_FIELDS}
+        operations = []
+        for resolution, (truncate, retention) in ROLLUP_RESOLUTIONS.items():
+            bucket_start = timestamp.replace(**truncate)
+            operations.append(UpdateOne(
+                {'resolution': resolution, 'bucket_start': bucket_start},
+                {
+                    '$inc': {'samples': 1, **{f'sum.{f}': v for f, v in values.items()}},
+                    '$min': {f'min.{f}': v for f, v in values.items()},
+                    '$max': {f'max.{f}': v for f, v in values.items()},
+                    '$set': {'expire_at': bucket_start + retention},
+                },
+                upsert=True
+            ))
+        metrics_rollups.bulk_write(operations, ordered=False)
+    except Exception as e:
+        logger.error("Metrics rollup failed: %s", e)
+
+def get_history(resolution='raw', since=None, limit=100):
+    """Metrics history, newest first, from raw snapshots or a rollup resolution."""
+    if resolution == 'raw':
+        query = dict(COMPLETED_SNAPSHOT)
+        if since:
+            query['timestamp'] = {'$gte': since}
+        history = list(metrics_data.find(query).sort('timestamp', -1).limit(limit))
+        for record in history:
+            record['_id'] = str(record['_id'])
+            if 'timestamp' in record and hasattr(record['timestamp'], 'isoformat'):
+                record['timestamp'] = record['timestamp'].isoformat()
+        return history
+
+    if resolution not in ROLLUP_RESOLUTIONS:
+        raise ValueError(f"Unknown resolution '{resolution}'")
+    query = {'resolution': resolution}
+    if since:
+        query['bucket_start'] = {'$gte': since}
+    history = []
+    for rollup in metrics_rollups.find(query).sort('bucket_start', -1).limit(limit):
+        samples = rollup.get('samples', 0) or 1
+        record = {field: round(rollup['sum'].get(field, 0) / samples, 2) for field in ROLLUP_FIELDS}
+        success_rate = (record['operational_devices'] / record['total_devices'] * 100) if record['total_devices'] > 0 else 0
+        record.update({
+            'timestamp': rollup['bucket_start'].isoformat(),
+            'resolution': resolution,
+            'samples': rollup.get('samples', 0),
+            'success_rate': f'{success_rate:.1f}%',
+            'min': rollup.get('min', {}),
+            'max': rollup.get('max', {}),
+        })
+        history.append(record)
+    return history
@@ -0,0 +1,93 @@
+import time
+from mongo import db, sensor_data, ensure_sensor_timeseries, create_asset_indexes, SENSOR_META_FIELD
+from sensor_series import META_FIELDS
+
+LEGACY_NAME = 'sensor_data_legacy'
+BATCH_SIZE = 5000
+# Progress of an interrupted copy, so a re-run resumes after the last copied reading
+PROGRESS_ID = 'sensor_data_timeseries'
+
+def to_timeseries_document(doc):
+    """Move asset and sensor type fields of a legacy reading under the metaField.
+
+    The legacy _id is kept, so a resumed copy can tell which readings already made it.
+    """
+    reading = {k: v for k, v in doc.items() if k not in META_FIELDS}
+    reading[SENSOR_META_FIELD] = {k: doc[k] for k in META_FIELDS if doc.get(k) is not None}
+    return reading
+
+def _already_copied(batch):
+    """_ids of a batch already in sensor_data (copied before the last progress checkpoint)."""
+    timestamps = [doc['timestamp'] for doc in batch]
+    return {doc['_id'] for doc in sensor_data.find({
+        '_id': {'$in': [doc['_id'] for doc in batch]},
+        'timestamp': {'$gte': min(timestamps), '$lte': max(timestamps)}
+    }, {'_id': 1})}
+
+def migrate_sensor_data():
+    """Convert the plain sensor_data collection into a time-series collection; re-run to resume."""
+    names = set(db.list_collection_names())
+    existing = list(db.list_collections(filter={'name': sensor_data.name}))
+    if existing and existing[0].get('type') != 'timeseries':
+        if LEGACY_NAME in names:
+            print(f"Both a plain sensor_data and {LEGACY_NAME} exist; merge or remove one before migrating.")
+            return
+        # Time-series collections cannot be renamed, so the legacy data moves aside instead
+        print(f"Renaming sensor_data to {LEGACY_NAME}...")
+        sensor_data.rename(LEGACY_NAME)
+    elif LEGACY_NAME not in names:
+        print("sensor_data is already a time-series collection.")
+        return
+    ensure_sensor_timeseries()
+    create_asset_indexes()
+
+    legacy = db[LEGACY_NAME]
+    migrations = db['migrations']
+    progress = migrations.find_one({'_id': PROGRESS_ID}) or {'copied': 0}
+    query = {'timestamp': {'$type': 'date'}}
+    if progress.get('last_id') is not None:
+        print(f"Resuming after {progress['copied']} copied readings...")
+        query['_id'] = {'$gt': progress['last_id']}
+    total = legacy.count_documents({'timestamp': {'$type': 'date'}})
+    copied = progress['copied']
+    resumed = progress.get('last_id') is not None
+    started = time.time()
+
+    def flush(batch):
+        nonlocal copied, resumed
+        pending = batch
+        if resumed:
+            # The run before may have stopped between inserting a batch and recording it
+            present = _already_copied(batch)
+            pending = [doc for doc in batch if doc['_id'] not in present]
+            resumed = False
+        if pending:
+            sensor_data.insert_many(pending, ordered=False)
+        copied += len(batch)
+        migrations.update_one(
+            {'_id': PROGRESS_ID}, {'$set': {'last_id': batch[-1]['_id'], 'copied': copied}}, upsert=True
+        )
+
+    batch = []
+    for doc in legacy.find(query).sort('_id', 1).batch_size(BATCH_SIZE):
+        batch.append(to_timeseries_document(doc))
+        if len(batch) >= BATCH_SIZE:
+            flush(batch)
+            batch = []
+            print(f"Copied {copied}/{total} readings ({copied / max(time.time() - started, 1e-6):.0f}/s)")
+    if batch:
+        flush(batch)
+    print(f"Migrated {copied} readings into the sensor_data time-series collection.")
+
+    skipped = legacy.count_documents({}) - total
+    if copied != total:
+        print(f"Copied {copied} of {total} dated readings; {LEGACY_NAME} is kept. Re-run to resume.")
+    elif skipped:
+        print(f"{skipped} readings without a date timestamp were left in {LEGACY_NAME}; drop it once reviewed.")
+    else:
+        legacy.drop()
+        migrations.delete_one({'_id': PROGRESS_ID})
+        print(f"Dropped {LEGACY_NAME}.")
+
+if __name__ == "__main__":
+    migrate_sensor_data()
@@ -1,51 +1,215 @@
+import os
+import time
+import threading
 import pymongo
-from config import MONGO_URI
-
-# MongoDB connection with timeout settings
-client = pymongo.MongoClient(
-    MONGO_URI,
-    serverSelectionTimeoutMS=5000,  # 5 second timeout
-    connectTimeoutMS=10000,         # 10 second connection timeout
-    socketTimeoutMS=10000,          # 10 second socket timeout
-    maxPoolSize=10,                 # Connection pool size
-    retryWrites=True,
-    retryReads=True
+from pymongo import monitoring
+from pymongo.errors import OperationFailure
+from config import (
+    MONGO_URI, MONGO_DB_NAME, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS,
+    MONGO_WAIT_QUEUE_TIMEOUT_MS, MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_SOCKET_TIMEOUT_MS, MONGO_READ_PREFERENCE, MONGO_COMPRESSORS, MONGO_APP_NAME,
+    METRICS_RAW_RETENTION_HOURS, RECOMMENDATION_TTL_SECONDS,
+    SENSOR_TIMESERIES_GRANULARITY, SENSOR_DATA_RETENTION_DAYS, HEALTH_HISTORY_RETENTION_DAYS,
+    EMBEDDING_CACHE_TTL_DAYS
 )
 
-# Test connection
-try:
-    client.admin.command('ping')
-except Exception as e:
-    # Fallback to local MongoDB if available
-    try:
-        client = pymongo.MongoClient('mongodb://localhost:27017/', serverSelectionTimeoutMS=5000)
-        client.admin.command('ping')
-    except Exception as e2:
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection counts and checkout wait times per server pool, for this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.pools = {}
+
+    def reset(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.pools = {}
+
+    def _pool(self, address):
+        key = f'{address[0]}:{address[1]}'
+        if key not in self.pools:
+            self.pools[key] = {
+                'open': 0, 'created': 0, 'checked_out': 0, 'max_checked_out': 0,
+                'checkouts': 0, 'checkout_failures': 0, 'cleared': 0,
+                'wait_ms_total': 0.0, 'wait_ms_max': 0.0
+            }
+        return self.pools[key]
+
+    def _waited_ms(self):
+        started = getattr(self.local, 'started', None)
+        self.local.started = None
+        return (time.perf_counter() - started) * 1000 if started else 0.0
+
+    def pool_created(self, event):
+        with self.lock:
+            self._pool(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self.lock:
+            self._pool(event.address)['cleared'] += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self.lock:
+            pool = self._pool(event.address)
+            pool['open'] += 1
+            pool['created'] += 1
+
+    def connection_ready(self, event):
         pass
 
-db = client.iot
+    def connection_closed(self, event):
+        with self.lock:
+            self._pool(event.address)['open'] -= 1
+
+    def connection_check_out_started(self, event):
+        # Checkout happens on the requesting thread, so a thread-local pairs start and finish
+        self.local.started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        waited = self._waited_ms()
+        with self.lock:
+            pool = self._pool(event.address)
+            pool['checkout_failures'] += 1
+            pool['wait_ms_max'] = max(pool['wait_ms_max'], waited)
+
+    def connection_checked_out(self, event):
+        waited = self._waited_ms()
+        with self.lock:
+            pool = self._pool(event.address)
+            pool['checkouts'] += 1
+            pool['checked_out'] += 1
+            pool['max_checked_out'] = max(pool['max_checked_out'], pool['checked_out'])
+            pool['wait_ms_total'] += waited
+            pool['wait_ms_max'] = max(pool['wait_ms_max'], waited)
+
+    def connection_checked_in(self, event):
+        with self.lock:
+            self._pool(event.address)['checked_out'] -= 1
+
+    def snapshot(self):
+        """Per-pool counters with the average checkout wait."""
+        with self.lock:
+            pools = {key: dict(pool) for key, pool in self.pools.items()}
+        for pool in pools.values():
+            pool['wait_ms_avg'] = round(pool['wait_ms_total'] / pool['checkouts'], 3) if pool['checkouts'] else 0.0
+            pool['wait_ms_total'] = round(pool['wait_ms_total'], 3)
+            pool['wait_ms_max'] = round(pool['wait_ms_max'], 3)
+        return {'pid': os.getpid(), 'max_pool_size': MONGO_MAX_POOL_SIZE, 'pools': pools}
+
+pool_metrics = PoolMetrics()
+
+def client_options():
+    """MongoClient keyword arguments from config.py."""
+    options = {
+        'maxPoolSize': MONGO_MAX_POOL_SIZE,
+        'minPoolSize': MONGO_MIN_POOL_SIZE,
+        'maxIdleTimeMS': MONGO_MAX_IDLE_TIME_MS,
+        'waitQueueTimeoutMS': MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        'serverSelectionTimeoutMS': MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        'connectTimeoutMS': MONGO_CONNECT_TIMEOUT_MS,
+        'socketTimeoutMS': MONGO_SOCKET_TIMEOUT_MS,
+        'readPreference': MONGO_READ_PREFERENCE,
+        'retryWrites': True,
+        'retryReads': True,
+        'appname': MONGO_APP_NAME,
+        'event_listeners': [pool_metrics],
+    }
+    if MONGO_COMPRESSORS:
+        options['compressors'] = MONGO_COMPRESSORS
+    return options
+
+# One client per process; constructing it does no I/O, connections are opened on first use
+_client = {'pid': None, 'client': None}
+_client_lock = threading.Lock()
+
+def get_client():
+    """The process-wide MongoClient, created on first use and again in a forked child."""
+    pid = os.getpid()
+    if _client['pid'] != pid:
+        with _client_lock:
+            if _client['pid'] != pid:
+                _client['client'] = pymongo.MongoClient(MONGO_URI or 'mongodb://localhost:27017/', **client_options())
+                _client['pid'] = pid
+    return _client['client']
+
+def _after_fork_in_child():
+    # Sockets and monitor threads inherited from the parent are unusable; start over
+    global _client_lock
+    _client_lock = threading.Lock()
+    _client.update(pid=None, client=None)
+    pool_metrics.reset()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+class LazyDatabase:
+    """Database handle resolved against the current process's client on use."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def get(self):
+        return get_client()[self.name]
+
+    def __getitem__(self, name):
+        return LazyCollection(self, name)
+
+    def __getattr__(self, attr):
+        return getattr(self.get(), attr)
+
+class LazyCollection:
+    """Collection handle that is safe to create at import time and use after a fork."""
+
+    def __init__(self, database, name):
+        self.database_ref = database
+        self.name = name
+        self._resolved = (None, None)
+
+    def get(self):
+        client = get_client()
+        if self._resolved[0] is not client:
+            self._resolved = (client, client[self.database_ref.name][self.name])
+        return self._resolved[1]
+
+    def __getattr__(self, attr):
+        return getattr(self.get(), attr)
+
+db = LazyDatabase(MONGO_DB_NAME)
 
 # Collections for all tables
-machines = db.machines
-parts = db.parts
-sensor_data = db.sensor_data
-maintenance_records = db.maintenance_records
-alerts = db.alerts
-users = db.users
-file_metadata = db.file_metadata
-ai_interactions = db.ai_interactions
-predictive_models = db.predictive_models
-device_types = db.device_types
-devices = db.devices
-organs = db.organs
-donors = db.donors
+machines = db['machines']
+parts = db['parts']
+sensor_data = db['sensor_data']
+maintenance_records = db['maintenance_records']
+alerts = db['alerts']
+users = db['users']
+file_metadata = db['file_metadata']
+ai_interactions = db['ai_interactions']
+ai_recommendations = db['ai_recommendations']
+anomaly_state = db['anomaly_state']
+health_history = db['health_history']
+predictive_models = db['predictive_models']
+device_types = db['device_types']
+devices = db['devices']
+organs = db['organs']
+donors = db['donors']
 
 # New collections for dashboard data with geospatial support
-airlines = db.airlines
-flight_routes = db.flight_routes
-cities = db.cities
-metrics_data = db.metrics_data
-flight_paths = db.flight_paths
+airlines = db['airlines']
+flight_routes = db['flight_routes']
+cities = db['cities']
+metrics_data = db['metrics_data']
+metrics_rollups = db['metrics_rollups']
+cache_versions = db['cache_versions']
+embedding_cache = db['embedding_cache']
+flight_paths = db['flight_paths']
 
 # Create geospatial indexes for better performance
 def create_geospatial_indexes():
@@ -69,10 +233,125 @@ def create_geospatial_indexes():
     except Exception as e:
         pass
 
-# Initialize geospatial indexes
-create_geospatial_indexes()
+def ensure_ttl_index(collection, field, expire_after_seconds):
+    """Create a TTL index on field, updating its expiry if the index already exists."""
+    try:
+        collection.create_index([(field, pymongo.ASCENDING)], expireAfterSeconds=expire_after_seconds)
+    except OperationFailure as e:
+        # IndexOptionsConflict: retention was reconfigured, adjust the existing index in place
+        if e.code != 85:
+            raise
+        db.command('collMod', collection.name, index={
+            'keyPattern': {field: 1},
+            'expireAfterSeconds': expire_after_seconds
+        })
+
+# Indexes backing the shared metrics snapshot and its retention
+def create_metrics_indexes():
+    try:
+        # One snapshot per time bucket; the unique key is the cross-worker single-flight lock
+        metrics_data.create_index(
+            [("bucket", pymongo.ASCENDING)],
+            unique=True,
+            partialFilterExpression={"bucket": {"$exists": True}}
+        )
+        # Raw snapshots expire after the retention window instead of being trimmed per request
+        ensure_ttl_index(metrics_data, "timestamp", METRICS_RAW_RETENTION_HOURS * 3600)
+        # Rollup buckets carry their own expiry date per resolution
+        metrics_rollups.create_index(
+            [("resolution", pymongo.ASCENDING), ("bucket_start", pymongo.DESCENDING)],
+            unique=True
+        )
+        ensure_ttl_index(metrics_rollups, "expire_at", 0)
+    except Exception as e:
+        pass
+
+# Sensor readings live in a time-series collection bucketed by asset and sensor type
+SENSOR_META_FIELD = "meta"
+
+def ensure_sensor_timeseries():
+    try:
+        existing = list(db.list_collections(filter={"name": sensor_data.name}))
+        if not existing:
+            options = {
+                "timeseries": {
+                    "timeField": "timestamp",
+                    "metaField": SENSOR_META_FIELD,
+                    "granularity": SENSOR_TIMESERIES_GRANULARITY
+                }
+            }
+            if SENSOR_DATA_RETENTION_DAYS:
+                options["expireAfterSeconds"] = SENSOR_DATA_RETENTION_DAYS * 86400
+            db.create_collection(sensor_data.name, **options)
+        elif existing[0].get("type") != "timeseries":
+            print("sensor_data is a plain collection; run migrate_sensor_data.py to convert it to a time-series collection")
+    except Exception as e:
+        pass
+
+# Indexes backing the asset tree and asset details
+def create_asset_indexes():
+    try:
+        # Parts are grouped and looked up by their parent machine
+        parts.create_index([("machine_id", pymongo.ASCENDING)])
+        # Sensor series are read per asset and sensor type over a time window
+        for asset_field in ("machine_id", "part_id"):
+            sensor_data.create_index([
+                (f"{SENSOR_META_FIELD}.{asset_field}", pymongo.ASCENDING),
+                (f"{SENSOR_META_FIELD}.sensor_type", pymongo.ASCENDING),
+                ("timestamp", pymongo.ASCENDING)
+            ])
+        # Cached AI recommendations expire so they are regenerated periodically
+        ensure_ttl_index(ai_recommendations, "created_at", RECOMMENDATION_TTL_SECONDS)
+        ai_recommendations.create_index([
+            ("asset_type", pymongo.ASCENDING),
+            ("asset_id", pymongo.ASCENDING),
+            ("created_at", pymongo.DESCENDING)
+        ])
+    except Exception as e:
+        pass
+
+# Indexes backing materialized health scores and their history
+def create_health_indexes():
+    try:
+        # Fleet-wide "worst assets" queries sort on the stored score
+        for collection in (machines, parts):
+            collection.create_index([("health_score", pymongo.ASCENDING)])
+        health_history.create_index([
+            ("asset_type", pymongo.ASCENDING),
+            ("asset_id", pymongo.ASCENDING),
+            ("timestamp", pymongo.DESCENDING)
+        ])
+        ensure_ttl_index(health_history, "timestamp", HEALTH_HISTORY_RETENTION_DAYS * 86400)
+        # Refreshes recount alerts inside the scoring window
+        alerts.create_index([("timestamp", pymongo.ASCENDING)])
+    except Exception as e:
+        pass
+
+# Cached query and document embeddings expire so model changes eventually propagate
+def create_embedding_cache_indexes():
+    try:
+        ensure_ttl_index(embedding_cache, "created_at", EMBEDDING_CACHE_TTL_DAYS * 86400)
+    except Exception as e:
+        pass
+
+# The critical-alerts summary in AI prompts filters on severity and sorts by time
+def create_alert_indexes():
+    try:
+        alerts.create_index([("severity", pymongo.ASCENDING), ("timestamp", pymongo.DESCENDING)])
+    except Exception as e:
+        pass
 
 hospitals = db['hospitals']
 vehicles = db['vehicles']
 devices = db['devices']
 recipients = db['recipients']
+
+def provision_indexes():
+    """Create collections and indexes the app relies on; idempotent, run by provisioning.py."""
+    ensure_sensor_timeseries()
+    create_geospatial_indexes()
+    create_metrics_indexes()
+    create_asset_indexes()
+    create_health_indexes()
+    create_embedding_cache_indexes()
+    create_alert_indexes()
@@ -0,0 +1,134 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from mongo import metrics_data, alerts
+from config import CONTEXT_REFRESH_SECONDS, CONTEXT_MAX_AGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+def get_latest_metrics():
+    """The latest completed metrics snapshot, or None."""
+    # Skip placeholder rows of a bucket that is still being computed
+    return metrics_data.find_one({'computing': {'$exists': False}}, sort=[('timestamp', -1)])
+
+def get_realtime_metrics_summary(latest_metrics=None):
+    """Fetches and summarizes the latest key metrics."""
+    if latest_metrics is None:
+        latest_metrics = get_latest_metrics()
+    if not latest_metrics:
+        return "No recent metrics available."
+
+    total_flights = latest_metrics.get('total_flights', 0)
+    total_medical_organs = latest_metrics.get('total_medical_organs', 0)
+    active_failures = latest_metrics.get('active_failures', 0)
+    success_rate = latest_metrics.get('success_rate', '0.0%')
+    total_available_organs = latest_metrics.get('total_available_organs', 0)
+    total_in_transit_organs = latest_metrics.get('total_in_transit_organs', 0)
+
+    return (
+        f"Current Status: There are {total_flights} active flights, "
+        f"{total_medical_organs} organs managed ({total_available_organs} available, {total_in_transit_organs} in transit). "
+        f"There are {active_failures} active failures. Overall success rate: {success_rate}."
+    )
+
+def get_critical_alerts_summary():
+    """Fetches and summarizes recent critical alerts."""
+    # Fetch alerts from the last 24 hours as "today's" alerts; served by the (severity, timestamp) index
+    twenty_four_hours_ago = datetime.now() - timedelta(hours=24)
+    critical_alerts = list(alerts.find({
+        'severity': 'critical',
+        'timestamp': {'$gte': twenty_four_hours_ago}
+    }).sort('timestamp', -1).limit(5)) # Limit to 5 most recent critical alerts
+
+    if not critical_alerts:
+        return "No critical alerts reported recently."
+
+    summary_messages = []
+    for alert in critical_alerts:
+        timestamp_str = alert.get('timestamp').strftime('%Y-%m-%d %H:%M') if hasattr(alert.get('timestamp'), 'strftime') else str(alert.get('timestamp'))
+        summary_messages.append(f"- At {timestamp_str}, {alert.get('alert_type', 'unknown')}: {alert.get('message', 'No details.')}")
+    return "Recent Critical Alerts:\n" + "\n".join(summary_messages)
+
+class OperationalContext:
+    """The metrics and critical-alerts summaries used in AI prompts, kept materialized in memory.
+
+    A daemon thread rebuilds them every refresh_seconds, or right away after alerts_changed().
+    Readers never query the database unless the snapshot is older than max_age (e.g. the
+    refresher is stuck on an unreachable database) or alerts changed in this process since
+    the last build.
+    """
+
+    def __init__(self, refresh_seconds=CONTEXT_REFRESH_SECONDS, max_age=CONTEXT_MAX_AGE_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.current = None
+        self.alerts_dirty = False
+        self.pid = None
+        self.counters = {'reads': 0, 'sync_refreshes': 0, 'background_refreshes': 0, 'errors': 0}
+
+    def refresh(self):
+        """Rebuild the snapshot: two database round-trips."""
+        self.alerts_dirty = False
+        latest = get_latest_metrics()
+        snapshot = {
+            'latest_metrics': latest,
+            'metrics_summary': get_realtime_metrics_summary(latest),
+            'alerts_summary': get_critical_alerts_summary(),
+            'built_at': time.monotonic(),
+        }
+        with self.lock:
+            self.current = snapshot
+        return snapshot
+
+    def _run(self):
+        while True:
+            self.wake.wait(self.refresh_seconds)
+            self.wake.clear()
+            try:
+                self.refresh()
+                self._count('background_refreshes')
+            except Exception as e:
+                logger.error("Operational context refresh failed: %s", e)
+                self._count('errors')
+
+    def _ensure_refresher(self):
+        # Threads do not survive a fork, so each worker process starts its own
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self.pid = os.getpid()
+                    threading.Thread(target=self._run, name='operational-context', daemon=True).start()
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def snapshot(self):
+        """{'latest_metrics', 'metrics_summary', 'alerts_summary', 'built_at'}, at most max_age old."""
+        self._ensure_refresher()
+        self._count('reads')
+        with self.lock:
+            current = self.current
+        if current is None or self.alerts_dirty or time.monotonic() - current['built_at'] > self.max_age:
+            self._count('sync_refreshes')
+            return self.refresh()
+        return current
+
+    def alerts_changed(self):
+        """Critical alerts were written; the next prompt sees them and the refresher rebuilds now."""
+        self.alerts_dirty = True
+        self.wake.set()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            current = self.current
+        stats['age_seconds'] = round(time.monotonic() - current['built_at'], 2) if current else None
+        stats['db_round_trips_saved'] = 2 * (stats['reads'] - stats['sync_refreshes'])
+        return stats
+
+operational_context = OperationalContext()
@@ -0,0 +1,111 @@
+import re
+import hashlib
+from vector_search import FILTER_FIELDS
+from config import PASSAGE_MAX_CHARS, PASSAGE_OVERLAP_CHARS
+
+BLOCK_SEPARATOR = re.compile(r"\n\s*\n")
+
+def passage_collection(collection):
+    """The collection holding a guide collection's passages, in the same database."""
+    return collection.database[f"{collection.name}_passages"]
+
+def guide_id(doc):
+    """Stable id of a guide: its title, so revised content keeps the id."""
+    return hashlib.sha256(doc['title'].encode('utf-8')).hexdigest()[:16]
+
+def _blocks(content, max_chars):
+    """Paragraphs (e.g. one "Step N" section each); paragraphs longer than max_chars are split by line."""
+    blocks = []
+    for block in BLOCK_SEPARATOR.split(content.strip()):
+        if len(block) <= max_chars:
+            blocks.append(block.strip())
+            continue
+        current = []
+        for line in block.splitlines():
+            if current and len('\n'.join(current + [line])) > max_chars:
+                blocks.append('\n'.join(current).strip())
+                current = []
+            current.append(line)
+        if current:
+            blocks.append('\n'.join(current).strip())
+    return [block for block in blocks if block]
+
+def split_passages(doc, max_chars=PASSAGE_MAX_CHARS, overlap_chars=PASSAGE_OVERLAP_CHARS):
+    """Passage docs for a guide: runs of whole paragraphs up to max_chars, each repeating the
+    trailing paragraphs of the one before that fit in overlap_chars.
+
+    Passage ids hash the guide id and the passage text, so unchanged passages keep their id
+    (and embedding) when other parts of the guide are revised.
+    """
+    blocks = _blocks(doc['content'], max_chars)
+    windows, start = [], 0
+    while start < len(blocks):
+        end, size = start, 0
+        while end < len(blocks) and (end == start or size + len(blocks[end]) + 2 <= max_chars):
+            size += len(blocks[end]) + 2
+            end += 1
+        windows.append((start, end))
+        if end == len(blocks):
+            break
+        # Step back over trailing paragraphs that fit in the overlap, always moving forward
+        next_start, carried = end, 0
+        while next_start - 1 > start and carried + len(blocks[next_start - 1]) <= overlap_chars:
+            next_start -= 1
+            carried += len(blocks[next_start])
+        start = next_start
+
+    parent = guide_id(doc)
+    passages = []
+    for position, (start, end) in enumerate(windows):
+        text = '\n\n'.join(blocks[start:end])
+        digest = hashlib.sha256(f"{parent}\n{text}".encode('utf-8')).hexdigest()[:16]
+        passages.append({
+            '_id': f"{parent}:{digest}",
+            'passage_id': f"{parent}:{digest}",
+            'guide_id': parent,
+            'title': doc['title'],
+            'content': text,
+            'position': position,
+            'passage_count': len(windows),
+            **{field: doc[field] for field in FILTER_FIELDS if field in doc}
+        })
+    return passages
+
+def embedding_text(passage):
+    """What gets embedded: the passage with its guide title, so it carries its parent's topic."""
+    return f"{passage['title']}\n{passage['content']}"
+
+def group_by_guide(hits):
+    """Passage hits grouped per guide in best-hit order, passages in document order.
+
+    Whole-guide hits (no guide_id) form groups of their own.
+    """
+    groups = {}
+    for hit in hits:
+        key = hit.get('guide_id') or hit.get('title')
+        groups.setdefault(key, {'title': hit.get('title', ''), 'passages': []})['passages'].append(hit)
+    for group in groups.values():
+        group['passages'].sort(key=lambda hit: hit.get('position', 0))
+    return list(groups.values())
+
+def prompt_context(hits, content_field='content'):
+    """Prompt context with each guide's title once, followed by only its matching passages."""
+    sections = []
+    for group in group_by_guide(hits):
+        passages = group['passages']
+        if passages[0].get('passage_count', 1) > 1:
+            parts = ', '.join(str(hit['position'] + 1) for hit in passages)
+            header = f"Title: {group['title']} (excerpts {parts} of {passages[0]['passage_count']})"
+        else:
+            header = f"Title: {group['title']}"
+        # Adjacent passages overlap; each paragraph is sent once, and "..." marks skipped text
+        seen, body, previous = set(), '', None
+        for hit in passages:
+            blocks = [b for b in BLOCK_SEPARATOR.split(hit.get(content_field, '')) if b not in seen]
+            seen.update(blocks)
+            if blocks:
+                adjacent = previous is not None and hit.get('position', 0) == previous + 1
+                body += ('' if previous is None else '\n\n' if adjacent else '\n...\n') + '\n\n'.join(blocks)
+            previous = hit.get('position', 0)
+        sections.append(f"{header}\nContent: {body}")
+    return '\n\n'.join(sections)
@@ -0,0 +1,208 @@
+import os
+import time
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from pymongo.operations import SearchIndexModel
+from mongo import get_client, provision_indexes, cache_versions
+from vector_search import VECTOR_INDEX_NAME, EMBEDDING_DIMENSIONS, vector_index_definition
+from text_search import TEXT_INDEX_NAME, text_index_definition
+from passages import passage_collection
+from config import VECTOR_INDEX_WAIT_SECONDS, PROVISION_RETRY_SECONDS, PROVISION_LEASE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Readiness of each provisioning step: pending, running, ready, failed or skipped
+state = {
+    'indexes': {'status': 'pending', 'error': None, 'finished_at': None},
+    'vector_index': {'status': 'pending', 'error': None, 'finished_at': None},
+    'text_index': {'status': 'pending', 'error': None, 'finished_at': None},
+}
+_started = threading.Event()
+
+# One worker at a time provisions under this lease and publishes its progress on the same document
+LEASE_KEY = 'provisioning'
+HOLDER = f'{socket.gethostname()}:{os.getpid()}'
+POLL_SECONDS = 2
+
+def guides_collection():
+    """The RAG guides collection searched by MongoDBService."""
+    return get_client()["rag_db"]["machine_guides"]
+
+def search_collections():
+    """Collections RAG searches run against: the guides and their passages."""
+    guides = guides_collection()
+    return [guides, passage_collection(guides)]
+
+def _wait_until_queryable(collection, wait_seconds, index_name=VECTOR_INDEX_NAME):
+    deadline = time.monotonic() + wait_seconds
+    while time.monotonic() < deadline:
+        indices = list(collection.list_search_indexes(index_name))
+        if len(indices) and indices[0].get("queryable") is True:
+            return True
+        time.sleep(5)
+    return False
+
+def ensure_vector_index(collection, wait_seconds=VECTOR_INDEX_WAIT_SECONDS):
+    """Create the Atlas vector search index if missing (or update it if its fields differ) and wait, bounded, until it is queryable."""
+    definition = vector_index_definition()
+    existing = next((idx for idx in collection.list_search_indexes() if idx.get("name") == VECTOR_INDEX_NAME), None)
+    if existing:
+        fields = (existing.get("latestDefinition") or {}).get("fields", [])
+        if sorted(map(str, fields)) == sorted(map(str, definition["fields"])):
+            return True
+        # Older indexes lack the filter fields that pre-filtered searches need
+        collection.update_search_index(VECTOR_INDEX_NAME, definition)
+        return _wait_until_queryable(collection, wait_seconds)
+    dummy_id = None
+    if collection.estimated_document_count() == 0:
+        # Search indexes cannot be created on a collection that does not exist yet
+        dummy_id = collection.insert_one({"_dummy": True, "embedding": [0.0] * EMBEDDING_DIMENSIONS}).inserted_id
+    try:
+        collection.create_search_index(model=SearchIndexModel(
+            definition=definition,
+            name=VECTOR_INDEX_NAME,
+            type="vectorSearch"
+        ))
+        return _wait_until_queryable(collection, wait_seconds)
+    finally:
+        if dummy_id:
+            collection.delete_one({"_id": dummy_id})
+
+def ensure_text_index(collection, wait_seconds=VECTOR_INDEX_WAIT_SECONDS):
+    """Create or update the Atlas Search index used by the lexical leg of hybrid search."""
+    definition = text_index_definition()
+    existing = next((idx for idx in collection.list_search_indexes() if idx.get("name") == TEXT_INDEX_NAME), None)
+    if existing:
+        if existing.get("latestDefinition") == definition:
+            return True
+        collection.update_search_index(TEXT_INDEX_NAME, definition)
+    else:
+        if collection.name not in collection.database.list_collection_names():
+            # Search indexes cannot be created on a collection that does not exist yet
+            collection.database.create_collection(collection.name)
+        collection.create_search_index(model=SearchIndexModel(definition=definition, name=TEXT_INDEX_NAME))
+    return _wait_until_queryable(collection, wait_seconds, TEXT_INDEX_NAME)
+
+def _run_step(name, step, lease=False):
+    if lease:
+        # Long steps wait for search indexes to build; hold the lease for as long as they may take
+        _extend_lease(PROVISION_LEASE_SECONDS + (VECTOR_INDEX_WAIT_SECONDS if name != 'indexes' else 0))
+    state[name].update(status='running', error=None)
+    try:
+        result = step()
+        state[name]['status'] = 'ready' if result is not False else 'pending'
+    except Exception as e:
+        logger.error("Provisioning step %s failed: %s", name, e)
+        state[name].update(status='failed', error=str(e))
+    state[name]['finished_at'] = datetime.now()
+    if lease:
+        _publish()
+
+def provision(lease=False):
+    """Ping the database, then create collections, indexes and the vector and text search indexes.
+
+    With lease=True the caller holds the provisioning lease, which is extended before each step,
+    and each step's outcome is published for the other workers.
+    """
+    def indexes():
+        get_client().admin.command('ping')
+        provision_indexes()
+    _run_step('indexes', indexes, lease)
+    if state['indexes']['status'] == 'ready':
+        _run_step('vector_index', lambda: all([ensure_vector_index(c) for c in search_collections()]), lease)
+        _run_step('text_index', lambda: all([ensure_text_index(c) for c in search_collections()]), lease)
+    else:
+        state['vector_index']['status'] = 'skipped'
+        state['text_index']['status'] = 'skipped'
+    return state
+
+def _claim_lease():
+    """Take the provisioning lease if it is free or expired; False if another worker holds it."""
+    now = datetime.now()
+    try:
+        cache_versions.find_one_and_update(
+            {'_id': LEASE_KEY, '$or': [{'lease_until': {'$lt': now}}, {'lease_until': {'$exists': False}}]},
+            {'$set': {'lease_until': now + timedelta(seconds=PROVISION_LEASE_SECONDS), 'holder': HOLDER,
+                      'started_at': now}, '$unset': {'finished_at': '', 'state': ''}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+def _extend_lease(seconds):
+    cache_versions.update_one(
+        {'_id': LEASE_KEY, 'holder': HOLDER},
+        {'$set': {'lease_until': datetime.now() + timedelta(seconds=seconds)}}
+    )
+
+def _publish(finished=False):
+    """Share this worker's step states; when finished, release the lease."""
+    update = {'$set': {'state': state}}
+    if finished:
+        update['$set']['finished_at'] = datetime.now()
+        update['$unset'] = {'lease_until': ''}
+    cache_versions.update_one({'_id': LEASE_KEY, 'holder': HOLDER}, update)
+
+def _follow(since):
+    """Adopt the step states of the run in progress, or of one finished after since; True if it finished."""
+    marker = cache_versions.find_one({'_id': LEASE_KEY}) or {}
+    finished = marker.get('finished_at')
+    if not marker.get('state') or (finished and finished < since):
+        return False
+    for name, step in (marker.get('state') or {}).items():
+        if name in state:
+            state[name].update(step)
+    return bool(finished)
+
+def _provision_until_ready():
+    """Provision under the lease, or follow the worker holding it; retry while the database is unreachable."""
+    since = datetime.now()
+    while True:
+        try:
+            if _follow(since):
+                if state['indexes']['status'] == 'ready':
+                    return
+                # The holder could not reach the database either; whoever claims next retries
+                since = datetime.now()
+            elif _claim_lease():
+                provision(lease=True)
+                _publish(finished=True)
+                if state['indexes']['status'] == 'ready':
+                    return
+                since = datetime.now()
+            else:
+                # Another worker is provisioning: only track its progress
+                time.sleep(POLL_SECONDS)
+                continue
+        except Exception as e:
+            # The database may come up after the workers do
+            logger.error("Provisioning failed: %s", e)
+            state['indexes'].update(status='failed', error=str(e), finished_at=datetime.now())
+        time.sleep(PROVISION_RETRY_SECONDS)
+
+def start_background_provisioning():
+    """Provision on a daemon thread: one worker at a time runs the steps under a lease in
+    cache_versions while the others follow its progress, retrying while the database is unreachable."""
+    if _started.is_set():
+        return
+    _started.set()
+    threading.Thread(target=_provision_until_ready, name='provisioning', daemon=True).start()
+
+def skip_provisioning():
+    """Mark provisioning as handled elsewhere (e.g. by running this module as a release step)."""
+    for step in state.values():
+        step['status'] = 'skipped'
+
+def is_ready():
+    """Collections and indexes are in place; the vector index may still be building."""
+    return state['indexes']['status'] in ('ready', 'skipped')
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    result = provision()
+    for name, step in result.items():
+        print(f"{name}: {step['status']}" + (f" ({step['error']})" if step['error'] else ''))
@@ -0,0 +1,210 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from mongo import ai_recommendations
+from config import RECOMMENDATION_WORKERS, RECOMMENDATION_TIMEOUT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+PROMPT_FILE = 'prompt.txt'
+UNAVAILABLE_MESSAGE = "AI recommendations temporarily unavailable. Please try again later."
+
+# Entries kept in this worker's memory; older ones are still served from Mongo
+MAX_CACHED_RESULTS = 1000
+
+def summarize_sensors(chart_data):
+    """Per-metric avg/max/min/anomaly summary of the chart series."""
+    sensor_summary = []
+    for metric, data in (chart_data or {}).items():
+        stats = data.get('stats')
+        if stats:
+            # Computed over every reading by the series aggregation
+            sensor_summary.append({
+                'metric': metric,
+                'average': stats['average'],
+                'max': round(stats['max'], 2) if isinstance(stats['max'], (int, float)) else stats['max'],
+                'min': round(stats['min'], 2) if isinstance(stats['min'], (int, float)) else stats['min'],
+                'anomalies': stats['anomalies'],
+                'data_points': stats['data_points']
+            })
+        elif 'values' in data and data['values']:
+            values = data['values']
+            anomalies = data.get('anomalies', [])
+            sensor_summary.append({
+                'metric': metric,
+                'average': round(sum(values) / len(values), 2),
+                'max': round(max(values), 2),
+                'min': round(min(values), 2),
+                'anomalies': sum(1 for a in anomalies if a),
+                'data_points': len(values)
+            })
+    return sensor_summary
+
+def recommendation_key(asset, sensor_summary, alert_ids):
+    """Cache key: hash of the asset status, its alert ids and the sensor summary."""
+    material = json.dumps({
+        'asset_id': asset.get('_id'),
+        'status': asset.get('status', 'operational'),
+        'alert_ids': sorted(alert_ids),
+        'sensors': sensor_summary
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+def build_prompt(prompt_template, asset, sensor_summary, alerts, health_score):
+    """Compose the Gemini prompt for an asset's recommendations."""
+    # Prepare comprehensive asset data for Gemini
+    asset_info = {
+        'name': asset.get('name', 'Unknown'),
+        'type': asset.get('part_type', asset.get('type', 'Unknown')),
+        'status': asset.get('status', 'operational'),
+        'manufacturer': asset.get('manufacturer', 'Unknown'),
+        'installation_date': asset.get('installation_date', 'Unknown'),
+        'expected_lifetime_hours': asset.get('expected_lifetime_hours', 'Unknown'),
+        'description': asset.get('description', 'No description available'),
+        'machine_name': asset.get('machine_name', 'N/A')
+    }
+
+    # Prepare alerts summary
+    alerts_summary = []
+    for alert in alerts:
+        alerts_summary.append({
+            'type': alert.get('type', 'Unknown'),
+            'message': alert.get('message', ''),
+            'severity': alert.get('severity', 'medium'),
+            'timestamp': alert.get('timestamp', '')
+        })
+
+    asset_data_text = f"""
+Asset Information:
+- Name: {asset_info['name']}
+- Type: {asset_info['type']}
+- Status: {asset_info['status']}
+- Manufacturer: {asset_info['manufacturer']}
+- Installation Date: {asset_info['installation_date']}
+- Expected Lifetime: {asset_info['expected_lifetime_hours']} hours
+- Description: {asset_info['description']}
+- Parent Machine: {asset_info['machine_name']}
+
+Device Health Score: {health_score}%
+
+Sensor Data Summary:
+{chr(10).join([f"- {s['metric']}: Avg={s['average']}, Max={s['max']}, Min={s['min']}, Anomalies={s['anomalies']}, Data Points={s['data_points']}" for s in sensor_summary])}
+
+Recent Alerts ({len(alerts_summary)}):
+{chr(10).join([f"- [{a['timestamp']}] {a['type']} ({a['severity']}): {a['message']}" for a in alerts_summary])}
+
+Please provide comprehensive AI recommendations for this asset based on the above data. Focus on:
+1. Immediate actions needed based on status and alerts
+2. Preventive maintenance recommendations
+3. Performance optimization suggestions
+4. Risk assessment and mitigation strategies
+5. Long-term health monitoring advice
+"""
+    return f"{prompt_template}\n\n{asset_data_text}"
+
+class RecommendationService:
+    """Generates asset recommendations in a background pool and caches them by input hash."""
+
+    def __init__(self, generate, workers=RECOMMENDATION_WORKERS, store=ai_recommendations):
+        # generate(alerts, prompt) -> text, e.g. GeminiService.generate_summary
+        self.generate = generate
+        # Claims and results shared by every worker process
+        self.store = store
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recommendation')
+        self.results = {}
+        self.lock = threading.Lock()
+        self._prompt = {'mtime': None, 'text': None}
+
+    def prompt_template(self):
+        """Contents of prompt.txt, re-read only when the file changes."""
+        mtime = os.stat(PROMPT_FILE).st_mtime
+        if self._prompt['mtime'] != mtime:
+            with open(PROMPT_FILE, 'r') as f:
+                self._prompt = {'mtime': mtime, 'text': f.read().strip()}
+        return self._prompt['text']
+
+    def request(self, asset_type, asset, sensor_summary, alerts, alert_ids, health_score):
+        """Return (key, entry) for the asset, scheduling generation if nothing is cached."""
+        key = recommendation_key(asset, sensor_summary, alert_ids)
+        entry = self.get(key)
+        if entry and entry['status'] == 'ready':
+            return key, entry
+        with self.lock:
+            generating_here = key in self.results and self.results[key]['status'] == 'pending'
+        if generating_here:
+            return key, entry
+        # Pending in another worker (possibly a dead one), failed, or never requested
+
+        now = datetime.now()
+        cutoff = now - timedelta(seconds=RECOMMENDATION_TIMEOUT_SECONDS)
+        try:
+            # Claim the key so only one worker generates it
+            existing = self.store.find_one_and_update(
+                {'_id': key},
+                {'$setOnInsert': {'asset_type': asset_type, 'asset_id': asset.get('_id'),
+                                  'status': 'pending', 'created_at': now}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            existing = {'status': 'pending', 'created_at': now}
+        claimed = existing is None
+        if existing and existing.get('status') == 'pending' and existing['created_at'] < cutoff:
+            # The claimant died or hung; take the claim over atomically so only one worker retries
+            claimed = self.store.find_one_and_update(
+                {'_id': key, 'status': 'pending', 'created_at': {'$lt': cutoff}},
+                {'$set': {'created_at': now}}
+            ) is not None
+        if claimed:
+            self._schedule(key, asset, sensor_summary, alerts, health_score)
+            return key, {'status': 'pending', 'recommendation': None}
+        return key, {'status': existing.get('status', 'pending'), 'recommendation': existing.get('recommendation')}
+
+    def get(self, key):
+        """Cached entry for key from this worker or the shared store, or None."""
+        with self.lock:
+            entry = self.results.get(key)
+        if entry:
+            return entry
+        doc = self.store.find_one({'_id': key})
+        if not doc:
+            return None
+        entry = {'status': doc.get('status', 'pending'), 'recommendation': doc.get('recommendation')}
+        if entry['status'] == 'ready':
+            self._remember(key, entry)
+        return entry
+
+    def latest_for(self, asset_type, asset_id):
+        """Most recently requested entry for an asset, as (key, entry)."""
+        doc = self.store.find_one({'asset_type': asset_type, 'asset_id': asset_id}, sort=[('created_at', -1)])
+        if not doc:
+            return None, None
+        return doc['_id'], self.get(doc['_id'])
+
+    def _remember(self, key, entry):
+        with self.lock:
+            self.results.pop(key, None)
+            self.results[key] = entry
+            while len(self.results) > MAX_CACHED_RESULTS:
+                self.results.pop(next(iter(self.results)))
+
+    def _schedule(self, key, asset, sensor_summary, alerts, health_score):
+        self._remember(key, {'status': 'pending', 'recommendation': None})
+        self.executor.submit(self._generate, key, dict(asset), sensor_summary, list(alerts), health_score)
+
+    def _generate(self, key, asset, sensor_summary, alerts, health_score):
+        try:
+            prompt = build_prompt(self.prompt_template(), asset, sensor_summary, alerts, health_score)
+            text = self.generate(alerts, prompt)
+            entry = {'status': 'ready', 'recommendation': text}
+            self.store.update_one({'_id': key}, {'$set': {'status': 'ready', 'recommendation': text}})
+        except Exception as e:
+            print(f"AI recommendation error: {e}")
+            entry = {'status': 'error', 'recommendation': UNAVAILABLE_MESSAGE}
+            # Drop the claim so the next view of this asset retries
+            self.store.delete_one({'_id': key, 'status': 'pending'})
+        self._remember(key, entry)
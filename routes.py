@@ -1,130 +1,93 @@
-from flask import render_template, request, redirect, url_for, jsonify, flash, send_from_directory, session
+from flask import render_template, request, redirect, url_for, jsonify, flash, send_from_directory, session, stream_with_context, Response
 from werkzeug.utils import secure_filename
 from werkzeug.security import check_password_hash, generate_password_hash
-from mongo import machines, parts, sensor_data, maintenance_records, alerts, users, airlines, cities, flight_routes, metrics_data, organs, donors, hospitals, vehicles, devices, recipients, db
+from mongo import machines, parts, sensor_data, maintenance_records, alerts, users, airlines, cities, flight_routes, metrics_data, organs, donors, hospitals, vehicles, devices, recipients, db, get_client, pool_metrics
 from bson import ObjectId, errors as bson_errors
 import os
+import json
 from datetime import datetime
 import logging
-import requests
-from pymongo import MongoClient
-from pymongo.operations import SearchIndexModel
 from typing import List, Dict, Any
-import time
-from config import MONGO_URI
+import threading
+from config import (
+    ASSET_TREE_PAGE_SIZE, ASSET_TREE_MAX_PAGE_SIZE,
+    SENSOR_PAGE_MAX_ROWS, SENSOR_STREAM_MAX_ROWS, HEALTH_PAGE_MAX_ROWS,
+    VECTOR_RAG_LIMIT, VECTOR_GEO_LIMIT, HYBRID_SEARCH, RAG_PASSAGE_SEARCH, RAG_PASSAGE_LIMIT
+)
 from ai_service import get_embedding
+from gemini_client import gemini_client
+from generation_cache import generation_cache
+from operational_context import operational_context
+from audio_preprocessing import audio_preprocessor
+from embedding_cache import embedding_cache
+from vector_search import vector_backend, search_filter
+from hybrid_search import hybrid_retriever, retriever_stats
+from passages import passage_collection, prompt_context
+from asset_tree import get_tree_json, machine_page, machine_children
+from sensor_series import (
+    load_series, flatten_reading, readings_query, readings_projection, readings_page, iter_readings,
+    reading_cursor, parse_reading_cursor, naive_local
+)
+from sensor_ingest import ingest_readings, parse_ndjson, parse_csv, parse_json
+from recommendation_service import RecommendationService, summarize_sensors
+from health_service import ensure_health, maybe_refresh, worst_assets, get_health_history
+from provisioning import state as provisioning_state, is_ready as provisioning_ready, guides_collection
+from metrics_service import get_snapshot, public_metrics, get_history as get_metrics_history_records
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Generation settings for answers grounded in retrieved guides or alerts
+SUMMARY_CONFIG = {
+    "temperature": 0.2,
+    "topK": 40,
+    "topP": 0.95,
+    "maxOutputTokens": 1024,
+}
+
 class GeminiService:
-    def __init__(self):
-        self.api_key = os.environ.get('GEMINI_API_KEY')
-        self.embedding_url = f"https://generativelanguage.googleapis.com/v1beta/models/embedding-001:embedContent?key={self.api_key}"
-        self.text_generation_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={self.api_key}"
-        self.headers = {
-            "Content-Type": "application/json"
-        }
+    def __init__(self, client=gemini_client, cache=generation_cache):
+        # Pooled session, timeouts and retries live in the shared client
+        self.client = client
+        # Identical prompts (same question over the same hits) share one upstream call
+        self.cache = cache
 
     def get_embedding(self, text: str) -> List[float]:
-        try:
-            payload = {
-                "model": "models/embedding-001",
-                "content": {
-                    "parts": [{"text": text}]
-                }
-            }
-            response = requests.post(
-                self.embedding_url,
-                headers=self.headers,
-                json=payload
-            )
-            if response.status_code != 200:
-                response.raise_for_status()
-            result = response.json()
-            return result["embedding"]["values"]
-        except Exception as e:
-            raise
+        return embedding_cache.get(text)
 
-    def generate_summary(self, results: List[Dict[str, Any]], query: str) -> str:
-        try:
+    def summary_prompt(self, results: List[Dict[str, Any]], query: str) -> str:
+        if any('guide_id' in r for r in results):
+            # Passage hits: each guide's title once, then only the passages that matched
+            context = prompt_context(results)
+        else:
             context = "\n\n".join([
-                f"Title: {r['title']}\nContent: {r['content']}"
+                f"Title: {r.get('title', r.get('type', ''))}\nContent: {r.get('content', r.get('message', ''))}"
                 for r in results
             ])
-            prompt = f"""Use the following machine repair guides to answer the question.\nIf the guides don't contain relevant information, say so.\n\nGuides:\n{context}\n\nQuestion: {query}\n\nProvide a clear, concise answer based only on the information in the guides."""
-            payload = {
-                "contents": [{
-                    "parts": [{"text": prompt}]
-                }],
-                "generationConfig": {
-                    "temperature": 0.2,
-                    "topK": 40,
-                    "topP": 0.95,
-                    "maxOutputTokens": 1024,
-                }
-            }
-            response = requests.post(
-                self.text_generation_url,
-                headers=self.headers,
-                json=payload
-            )
-            if response.status_code != 200:
-                response.raise_for_status()
-            result = response.json()
-            return result["candidates"][0]["content"]["parts"][0]["text"]
-        except Exception as e:
-            raise
+        return f"""Use the following machine repair guides to answer the question.\nIf the guides don't contain relevant information, say so.\n\nGuides:\n{context}\n\nQuestion: {query}\n\nProvide a clear, concise answer based only on the information in the guides."""
 
-gemini_service = GeminiService()
+    def generate_summary(self, results: List[Dict[str, Any]], query: str) -> str:
+        text = self.cache.generate(self.summary_prompt(results, query), generation_config=SUMMARY_CONFIG)
+        if text is None:
+            raise ValueError("Gemini returned no candidates")
+        return text
+
+    def stream_summary(self, results: List[Dict[str, Any]], query: str):
+        """generate_summary as text chunks, yielded as Gemini produces them."""
+        return self.cache.stream(self.summary_prompt(results, query), generation_config=SUMMARY_CONFIG)
 
 class MongoDBService:
     def __init__(self):
-        self.client = MongoClient(
-            MONGO_URI,
-            serverSelectionTimeoutMS=5000,
-            connectTimeoutMS=10000,
-            socketTimeoutMS=10000,
-            maxPoolSize=10,
-            retryWrites=True,
-            retryReads=True
-        )
-        self.db = self.client["rag_db"]
-        self.collection = self.db["machine_guides"]
-        self._ensure_vector_index()
-
-    def _ensure_vector_index(self):
-        try:
-            existing_indexes = list(self.collection.list_search_indexes())
-            if not any(idx.get("name") == "vector_index" for idx in existing_indexes):
-                dummy_id = None
-                if self.collection.estimated_document_count() == 0:
-                    dummy_id = self.collection.insert_one({"_dummy": True, "embedding": [0.0]*768}).inserted_id
-                search_index_model = SearchIndexModel(
-                    definition={
-                        "fields": [
-                            {
-                                "type": "vector",
-                                "numDimensions": 768,
-                                "path": "embedding",
-                                "similarity": "cosine"
-                            }
-                        ]
-                    },
-                    name="vector_index",
-                    type="vectorSearch"
-                )
-                self.collection.create_search_index(model=search_index_model)
-                while True:
-                    indices = list(self.collection.list_search_indexes("vector_index"))
-                    if len(indices) and indices[0].get("queryable") is True:
-                        break
-                    time.sleep(5)
-                if dummy_id:
-                    self.collection.delete_one({"_id": dummy_id})
-        except Exception as e:
-            raise
+        # Shares the process-wide pool with the rest of the app
+        self.client = get_client()
+        # The same collection seed_guides.py and provisioning write to
+        self.collection = guides_collection()
+        self.db = self.collection.database
+        # Overlapping passages of the guides, written by seed_guides.py
+        self.passages = passage_collection(self.collection)
+        self.search_collection = self.passages if RAG_PASSAGE_SEARCH else self.collection
+        self.search_limit = RAG_PASSAGE_LIMIT if RAG_PASSAGE_SEARCH else VECTOR_RAG_LIMIT
 
     def insert_guide(self, guide_data):
         try:
@@ -140,31 +103,9 @@ class MongoDBService:
         except Exception as e:
             raise
 
-    def search_guides(self, query_embedding, limit=3):
-        try:
-            pipeline = [
-                {
-                    "$vectorSearch": {
-                        "index": "vector_index",
-                        "queryVector": query_embedding,
-                        "path": "embedding",
-                        "exact": True,
-                        "limit": limit
-                    }
-                },
-                {
-                    "$project": {
-                        "_id": 0,
-                        "title": 1,
-                        "content": 1,
-                        "score": { "$meta": "vectorSearchScore" }
-                    }
-                }
-            ]
-            results = list(self.collection.aggregate(pipeline))
-            return results
-        except Exception as e:
-            raise
+    def search_guides(self, query_embedding, limit=None, filters=None):
+        # Atlas $vectorSearch or the in-process index, per VECTOR_SEARCH_BACKEND; hits below VECTOR_MIN_SCORE are dropped
+        return vector_backend(self.search_collection).search(query_embedding, limit or self.search_limit, filters=filters)
 
     def get_stats(self):
         try:
@@ -176,9 +117,44 @@ class MongoDBService:
         except Exception as e:
             raise
 
-mongodb_service = MongoDBService()
+# Services are built on first use so importing this module does no network I/O
+_services = {}
+_services_lock = threading.Lock()
+
+def _service(name, factory):
+    with _services_lock:
+        if name not in _services:
+            _services[name] = factory()
+        return _services[name]
+
+def get_gemini_service():
+    return _service('gemini', GeminiService)
+
+def get_mongodb_service():
+    return _service('mongodb', MongoDBService)
+
+def generate_recommendation_text(alerts, prompt):
+    return get_gemini_service().generate_summary(alerts, prompt)
+
+recommendation_service = RecommendationService(generate_recommendation_text)
 
 def register_routes(app):
+    @app.route('/healthz')
+    def healthz():
+        # Liveness only: the worker is serving requests
+        return jsonify({'status': 'ok'})
+
+    @app.route('/readyz')
+    def readyz():
+        checks = {'provisioning': provisioning_state}
+        try:
+            db.command('ping')
+            checks['database'] = 'ok'
+        except Exception as e:
+            checks['database'] = str(e)
+        ready = checks['database'] == 'ok' and provisioning_ready()
+        return jsonify({'status': 'ready' if ready else 'not_ready', 'checks': checks}), 200 if ready else 503
+
     @app.route('/')
     def dashboard():
         all_machines = list(machines.find())
@@ -252,55 +228,46 @@ def register_routes(app):
     @app.route('/api/asset-tree')
     def asset_tree():
         try:
-            machine_list = list(machines.find())
-            part_list = list(parts.find())
-            tree = []
-            def get_color(status):
-                colors = {
-                    'operational': '#28a745',
-                    'critical': '#e53935',
-                    'warning': '#ffc107',
-                    'maintenance': '#e53935',
-                    'error': '#e53935',
-                    'in_transit': '#6c757d'
-                }
-                return colors.get(status, '#6c757d')
-            for m in machine_list:
-                m_id = str(m['_id'])
-                health_color = get_color(m.get('status', 'operational'))
-                health_circle = f'<span style="display:inline-block;width:12px;height:12px;border-radius:50%;background:{health_color};margin-right:7px;vertical-align:middle;border:1.5px solid #222;"></span>'
-                m_node = {
-                    'id': f'machine-{m_id}',
-                    'text': health_circle + m.get('name', 'Machine'),
-                    'type': 'machine',
-                    'machine_id': m_id,
-                    'status': m.get('status', 'operational'),
-                    'children': []
-                }
-                for p in part_list:
-                    if str(p.get('machine_id')) == m_id:
-                        p_id = str(p['_id'])
-                        health_color = get_color(p.get('status', 'operational'))
-                        health_circle = f'<span style="display:inline-block;width:12px;height:12px;border-radius:50%;background:{health_color};margin-right:7px;vertical-align:middle;border:1.5px solid #222;"></span>'
-                        p_node = {
-                            'id': f'part-{p_id}',
-                            'text': health_circle + p.get('name', 'Part'),
-                            'type': 'part',
-                            'part_id': p_id,
-                            'machine_id': m_id,
-                            'status': p.get('status', 'operational'),
-                            'children': []
-                        }
-                        m_node['children'].append(p_node)
-                tree.append(m_node)
-            return jsonify(tree)
+            # Lazy mode: one keyset page of machines with child counts
+            if 'cursor' in request.args or 'limit' in request.args:
+                cursor, limit, statuses = tree_page_args(ASSET_TREE_PAGE_SIZE)
+                return jsonify(machine_page(cursor, limit, statuses))
+            # Cached, pre-serialized tree; rebuilt when machines or parts change
+            return app.response_class(get_tree_json(), mimetype='application/json')
+        except bson_errors.InvalidId:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/asset-tree/<machine_id>/children')
+    def asset_tree_children(machine_id):
+        try:
+            if not ObjectId.is_valid(machine_id):
+                return jsonify({'error': 'Invalid machine id'}), 400
+            cursor, limit, statuses = tree_page_args(ASSET_TREE_MAX_PAGE_SIZE)
+            return jsonify(machine_children(machine_id, cursor, limit, statuses))
+        except bson_errors.InvalidId:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
     @app.route('/api/asset/<asset_type>/<asset_id>')
     def asset_details(asset_type, asset_id):
         try:
-            chart_data = {}
+            # Sensor window and point budget: ?from=&to=&max_points= (no from: the whole history)
+            try:
+                series_from = parse_iso_arg('from')
+                series_to = parse_iso_arg('to')
+            except ValueError:
+                return jsonify({'error': 'Invalid from/to timestamp'}), 400
+            try:
+                max_points = int(request.args['max_points']) if request.args.get('max_points') else None
+            except ValueError:
+                return jsonify({'error': 'max_points must be an integer'}), 400
             if asset_type == 'machine':
                 asset = machines.find_one({'_id': ObjectId(asset_id)})
                 if not asset:
@@ -312,12 +279,7 @@ def register_routes(app):
                     {k: (str(v) if k == '_id' or isinstance(v, ObjectId) else v) for k, v in p.items()}
                     for p in parts.find({'machine_id': asset['_id']})
                 ]
-                # Fetch sensor data for this machine (use ObjectId if possible)
-                try:
-                    sensor_oid = ObjectId(asset['_id'])
-                except bson_errors.InvalidId:
-                    sensor_oid = asset['_id']
-                sensor_cursor = sensor_data.find({'machine_id': sensor_oid})
+                sensor_field = 'machine_id'
                 # Fetch alerts for this machine
                 asset_alerts = list(alerts.find({'machine_id': asset['_id']}).sort('timestamp', -1).limit(5))
             elif asset_type == 'part':
@@ -340,29 +302,17 @@ def register_routes(app):
                     except Exception as e:
                         machine_name = ''
                 asset['machine_name'] = machine_name
-                # Fetch sensor data for this part (use ObjectId if possible)
-                try:
-                    sensor_oid = ObjectId(asset['_id'])
-                except bson_errors.InvalidId:
-                    sensor_oid = asset['_id']
-                sensor_cursor = sensor_data.find({'part_id': sensor_oid})
+                sensor_field = 'part_id'
                 # Fetch alerts for this part
                 asset_alerts = list(alerts.find({'part_id': asset['_id']}).sort('timestamp', -1).limit(5))
             else:
                 return jsonify({'error': 'Invalid asset type'}), 400
 
-            # Build chart_data from sensor_cursor
-            for s in sensor_cursor:
-                sensor_type = s.get('sensor_type', 'Unknown')
-                if sensor_type not in chart_data:
-                    chart_data[sensor_type] = {'timestamps': [], 'values': [], 'labels': [], 'anomalies': []}
-                ts = s.get('timestamp')
-                val = s.get('value')
-                is_anomaly = s.get('is_anomaly', False)
-                chart_data[sensor_type]['timestamps'].append(ts)
-                chart_data[sensor_type]['values'].append(val)
-                chart_data[sensor_type]['labels'].append(ts)
-                chart_data[sensor_type]['anomalies'].append(is_anomaly)
+            # Downsampled series plus exact per-sensor stats, computed in one aggregation
+            try:
+                chart_data = load_series(sensor_field, asset['_id'], series_from, series_to, max_points)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
 
             # Format alerts for frontend
             formatted_alerts = []
@@ -375,9 +325,19 @@ def register_routes(app):
                 })
             asset['alerts'] = formatted_alerts
             
-            # Generate AI recommendations based on asset data
-            ai_recommendation = generate_ai_recommendation(asset, chart_data, formatted_alerts)
-            asset['ai_recommendation'] = ai_recommendation
+            # Health score is materialized on the asset and maintained at ingest
+            health_score = ensure_health(asset_type, asset)
+            asset['health_score'] = health_score
+            maybe_refresh()
+
+            # AI recommendations are generated in the background; the client polls recommendation_url
+            recommendation_key, recommendation = recommendation_service.request(
+                asset_type, asset, summarize_sensors(chart_data), formatted_alerts,
+                [str(a['_id']) for a in asset_alerts], health_score
+            )
+            asset['ai_recommendation'] = recommendation['recommendation']
+            asset['recommendation_status'] = recommendation['status']
+            asset['recommendation_url'] = url_for('asset_recommendation', asset_type=asset_type, asset_id=asset_id, key=recommendation_key)
             asset['chart_data'] = chart_data
             return jsonify(asset)
         except Exception as e:
@@ -386,6 +346,52 @@ def register_routes(app):
             traceback.print_exc()
             return jsonify({'error': f'Failed to load asset details: {str(e)}'}), 500
 
+    @app.route('/api/asset/<asset_type>/<asset_id>/recommendation')
+    def asset_recommendation(asset_type, asset_id):
+        try:
+            key = request.args.get('key')
+            if key:
+                entry = recommendation_service.get(key)
+            else:
+                key, entry = recommendation_service.latest_for(asset_type, asset_id)
+            if not entry:
+                return jsonify({'error': 'No recommendation requested for this asset'}), 404
+            return jsonify({
+                'key': key,
+                'status': entry['status'],
+                'ai_recommendation': entry['recommendation']
+            })
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/assets/health')
+    def assets_health():
+        try:
+            below = request.args.get('below', type=float)
+            sort = request.args.get('sort', 'asc')
+            if sort not in ('asc', 'desc'):
+                return jsonify({'error': 'sort must be asc or desc'}), 400
+            asset_type = request.args.get('type')
+            if asset_type not in (None, 'machine', 'part'):
+                return jsonify({'error': 'Invalid asset type'}), 400
+            limit = max(1, min(request.args.get('limit', 50, type=int), HEALTH_PAGE_MAX_ROWS))
+            maybe_refresh()
+            return jsonify(worst_assets(asset_type, below, sort == 'desc', limit))
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/asset/<asset_type>/<asset_id>/health-history')
+    def asset_health_history(asset_type, asset_id):
+        try:
+            try:
+                since = parse_iso_arg('since')
+            except ValueError:
+                return jsonify({'error': 'Invalid since timestamp'}), 400
+            limit = max(1, min(request.args.get('limit', 100, type=int), HEALTH_PAGE_MAX_ROWS))
+            return jsonify(get_health_history(asset_type, asset_id, since, limit))
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
     @app.route('/api/alerts/recent')
     def recent_alerts():
         try:
@@ -419,15 +425,65 @@ def register_routes(app):
 
     @app.route('/api/sensor-data')
     def sensor_data_api():
+        """Sensor readings, newest first, keyset-paginated with ?after=<timestamp>,<id>&limit=
+
+        Filters: machine_id, part_id, sensor_type, from, to. ?fields= limits the returned
+        fields and ?order=asc tails readings newer than the cursor. With ?format=ndjson the
+        readings are streamed one per line as pages are read; otherwise a JSON list is
+        returned with the cursor of the next page in the X-Next-Cursor header.
+        """
         try:
-            data = list(sensor_data.find().sort('timestamp', -1).limit(1000))
-            for d in data:
-                d['_id'] = str(d['_id'])
-                if 'machine_id' in d and isinstance(d['machine_id'], ObjectId):
-                    d['machine_id'] = str(d['machine_id'])
-                if 'part_id' in d and isinstance(d['part_id'], ObjectId):
-                    d['part_id'] = str(d['part_id'])
-            return jsonify(data)
+            stream = request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson'
+            max_rows = SENSOR_STREAM_MAX_ROWS if stream else SENSOR_PAGE_MAX_ROWS
+            descending = request.args.get('order', 'desc') != 'asc'
+            try:
+                try:
+                    limit = max(1, min(int(request.args.get('limit') or SENSOR_PAGE_MAX_ROWS), max_rows))
+                except ValueError:
+                    raise ValueError('limit must be an integer')
+                after = parse_reading_cursor(request.args['after']) if request.args.get('after') else None
+                query = readings_query(
+                    machine_id=request.args.get('machine_id'),
+                    part_id=request.args.get('part_id'),
+                    sensor_type=request.args.get('sensor_type'),
+                    start=parse_iso_arg('from'),
+                    end=parse_iso_arg('to')
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            projection = readings_projection([f for f in request.args.get('fields', '').split(',') if f])
+
+            if stream:
+                # Exports are read a page at a time, so no single query sorts the whole range
+                def generate():
+                    for doc in iter_readings(query, limit, after, descending, projection):
+                        yield json.dumps(flatten_reading(doc), default=json_default) + '\n'
+                return app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+            docs = readings_page(query, limit, after, descending, projection)
+            response = jsonify([flatten_reading(d) for d in docs])
+            if len(docs) == limit:
+                response.headers['X-Next-Cursor'] = reading_cursor(docs[-1])
+            return response
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/sensor-data/bulk', methods=['POST'])
+    def sensor_data_bulk():
+        """Bulk ingestion of sensor readings as NDJSON, CSV or a JSON array"""
+        try:
+            content_type = request.mimetype
+            if content_type in ('application/x-ndjson', 'application/ndjson'):
+                records = parse_ndjson(request.stream)
+            elif content_type in ('text/csv', 'application/csv'):
+                records = parse_csv(request.stream)
+            elif content_type == 'application/json':
+                records = parse_json(request.get_json())
+            else:
+                return jsonify({'error': 'Send readings as application/x-ndjson, text/csv or application/json'}), 415
+            summary = ingest_readings(records)
+            status = 400 if summary['inserted'] == 0 and summary['rejected'] > 0 else 200
+            return jsonify(summary), status
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
@@ -451,7 +507,7 @@ def register_routes(app):
             # Compose full prompt
             full_prompt = f"{prompt}\n\nRecent Alerts for this asset:\n{alerts_text}\n\nUser question: {question}"
             # Call Gemini API
-            response = gemini_service.generate_summary(asset_alerts, question)
+            response = get_gemini_service().generate_summary(asset_alerts, question)
             return jsonify({'response': response})
         except Exception as e:
             import traceback
@@ -462,85 +518,9 @@ def register_routes(app):
     @app.route('/api/metrics')
     def get_metrics():
         try:
-            # Count total organs (machines + parts)
-            total_machines = machines.count_documents({})
-            total_parts = parts.count_documents({})
-            total_organs = total_machines + total_parts
-            
-            # Count total flights (machines with in_transit status)
-            total_flights = machines.count_documents({'status': 'in_transit'})
-            
-            # Count total devices monitored (all machines and parts)
-            total_devices = total_organs
-            
-            # Count active failures (critical, error, maintenance status)
-            active_failures = machines.count_documents({
-                'status': {'$in': ['critical', 'error', 'maintenance']}
-            }) + parts.count_documents({
-                'status': {'$in': ['critical', 'error', 'maintenance']}
-            })
-            
-            # Calculate average response time based on recent alerts
-            recent_alerts = list(alerts.find().sort('timestamp', -1).limit(100))
-            avg_response = 2.3  # Default value, could be calculated from actual data
-            
-            # Calculate success rate (operational devices / total devices)
-            operational_devices = machines.count_documents({'status': 'operational'}) + parts.count_documents({'status': 'operational'})
-            success_rate = (operational_devices / total_devices * 100) if total_devices > 0 else 0
-            
-            # NEW: Count organs from organs collection
-            total_available_organs = organs.count_documents({'status': 'available'})
-            total_in_transit_organs = organs.count_documents({'status': 'in_transit'})
-            total_reserved_organs = organs.count_documents({'status': 'reserved'})
-            total_delivered_organs = organs.count_documents({'status': 'delivered'})
-            total_medical_organs = total_available_organs + total_in_transit_organs + total_reserved_organs + total_delivered_organs
-            
-            # Create metrics data
-            metrics = {
-                'total_organs': total_organs,
-                'total_flights': total_flights,
-                'total_devices': total_devices,
-                'active_failures': active_failures,
-                'avg_response': f'{avg_response:.1f}m',
-                'success_rate': f'{success_rate:.1f}%',
-                'timestamp': datetime.now(),
-                'operational_devices': operational_devices,
-                'total_machines': total_machines,
-                'total_parts': total_parts,
-                # NEW: Medical organ metrics
-                'total_available_organs': total_available_organs,
-                'total_in_transit_organs': total_in_transit_organs,
-                'total_reserved_organs': total_reserved_organs,
-                'total_delivered_organs': total_delivered_organs,
-                'total_medical_organs': total_medical_organs
-            }
-            
-            # Store metrics in database for historical tracking
-            metrics_data.insert_one(metrics)
-            
-            # Clean up old metrics (keep last 1000 records)
-            old_count = metrics_data.count_documents({})
-            if old_count > 1000:
-                # Delete oldest records, keeping only the latest 1000
-                oldest_records = list(metrics_data.find().sort('timestamp', 1).limit(old_count - 1000))
-                if oldest_records:
-                    oldest_ids = [record['_id'] for record in oldest_records]
-                    metrics_data.delete_many({'_id': {'$in': oldest_ids}})
-            
-            return jsonify({
-                'total_organs': total_organs,
-                'total_flights': total_flights,
-                'total_devices': total_devices,
-                'active_failures': active_failures,
-                'avg_response': f'{avg_response:.1f}m',
-                'success_rate': f'{success_rate:.1f}%',
-                # NEW: Medical organ metrics
-                'total_available_organs': total_available_organs,
-                'total_in_transit_organs': total_in_transit_organs,
-                'total_reserved_organs': total_reserved_organs,
-                'total_delivered_organs': total_delivered_organs,
-                'total_medical_organs': total_medical_organs
-            })
+            # One shared snapshot per time bucket; only the first request in a bucket hits the database
+            metrics = get_snapshot()
+            return jsonify(public_metrics(metrics))
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
@@ -660,18 +640,74 @@ def register_routes(app):
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
+    @app.route('/api/metrics/db-pool')
+    def get_db_pool_metrics():
+        try:
+            # Connection pool usage of this worker process
+            return jsonify(pool_metrics.snapshot())
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/metrics/gemini')
+    def get_gemini_metrics():
+        try:
+            # Call, retry and latency counters of this worker's Gemini client
+            return jsonify(gemini_client.stats())
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/metrics/embedding-cache')
+    def get_embedding_cache_metrics():
+        try:
+            return jsonify(embedding_cache.stats())
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/metrics/generation-cache')
+    def get_generation_cache_metrics():
+        try:
+            return jsonify(generation_cache.stats())
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/metrics/voice-preprocessing')
+    def get_voice_preprocessing_metrics():
+        try:
+            return jsonify(audio_preprocessor.stats())
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/metrics/operational-context')
+    def get_operational_context_metrics():
+        try:
+            return jsonify(operational_context.stats())
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/metrics/hybrid-search')
+    def get_hybrid_search_metrics():
+        try:
+            return jsonify(retriever_stats())
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
     @app.route('/api/metrics/history')
     def get_metrics_history():
         try:
-            # Get last 100 metrics records for historical data
-            history = list(metrics_data.find().sort('timestamp', -1).limit(100))
-            
-            # Convert ObjectId to string for JSON serialization
-            for record in history:
-                record['_id'] = str(record['_id'])
-                if 'timestamp' in record and hasattr(record['timestamp'], 'isoformat'):
-                    record['timestamp'] = record['timestamp'].isoformat()
-            
+            # Raw snapshots or minute/hour/day rollups, bounded by since and limit
+            resolution = request.args.get('resolution', 'raw')
+            try:
+                limit = max(1, min(int(request.args.get('limit', 100)), 1000))
+            except ValueError:
+                return jsonify({'error': 'limit must be an integer'}), 400
+            try:
+                since = parse_iso_arg('since')
+            except ValueError:
+                return jsonify({'error': 'Invalid since timestamp'}), 400
+            try:
+                history = get_metrics_history_records(resolution, since, limit)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
             return jsonify(history)
         except Exception as e:
             return jsonify({'error': str(e)}), 500
@@ -817,22 +853,27 @@ def register_routes(app):
             if not audio_file:
                 return jsonify({'error': 'No audio file provided'}), 400
 
-            # Save the audio file temporarily
-            temp_path = os.path.join(app.config['UPLOAD_FOLDER'], 'temp_audio.wav')
-            audio_file.save(temp_path)
-
-            # Transcribe the audio
-            from voice_chat import transcribe_audio
+            # Transcribe the audio straight from the upload (in memory, or Werkzeug's self-deleting
+            # spool file for large ones) while the prompt context is built
+            from voice_chat import transcribe_with_context
             from ai_service import ask_gemini_with_context
-            transcription = transcribe_audio(temp_path)
+            transcription, context = transcribe_with_context(
+                audio_file.stream, audio_file.mimetype or 'audio/wav',
+                # Size of the browser's original recording, when it trimmed/resampled the upload
+                request.headers.get('X-Recorded-Bytes', type=int)
+            )
             if not transcription:
                 return jsonify({'error': 'Could not transcribe audio'}), 400
 
-            # Get response from Gemini using the context-aware function
-            response = ask_gemini_with_context(transcription)
+            if wants_event_stream():
+                from ai_service import stream_gemini_with_context
+                return event_stream_response(
+                    ('transcription', {'transcription': transcription}),
+                    lambda: stream_gemini_with_context(transcription, context)
+                )
 
-            # Clean up
-            os.remove(temp_path)
+            # Get response from Gemini using the context-aware function
+            response = ask_gemini_with_context(transcription, context)
 
             return jsonify({
                 'transcription': transcription,
@@ -996,27 +1037,42 @@ def register_routes(app):
         """API endpoint for RAG search"""
         try:
             search_text = request.json.get('search_text', '')
+            filters = request.json.get('filters')
             
             if not search_text:
                 return jsonify({'error': 'Please enter text to search for'}), 400
+            try:
+                search_filter(filters)
+            except (ValueError, AttributeError) as e:
+                return jsonify({'error': f'Invalid filters: {e}'}), 400
             
-            # Get embedding from Gemini
-            embedding = gemini_service.get_embedding(search_text)
-            
-            if not embedding:
-                return jsonify({'error': 'Failed to generate embedding'}), 500
-            
-            # Search MongoDB with the embedding
-            results = mongodb_service.search_guides(embedding)
+            if HYBRID_SEARCH:
+                # Lexical and vector search in parallel, fused by rank
+                mongodb_service = get_mongodb_service()
+                filtered_results = hybrid_retriever(mongodb_service.search_collection).search(
+                    search_text, mongodb_service.search_limit, filters
+                )
+            else:
+                # Get embedding from Gemini
+                embedding = get_gemini_service().get_embedding(search_text)
+                
+                if not embedding:
+                    return jsonify({'error': 'Failed to generate embedding'}), 500
+                
+                # Search MongoDB with the embedding, pre-filtered on metadata and cut at the minimum score
+                filtered_results = get_mongodb_service().search_guides(embedding, filters=filters)
             
-            # Filter by minimum score
-            min_score = 0.75
-            filtered_results = [r for r in results if r.get('score', 0) >= min_score]
+            if wants_event_stream():
+                # Retrieval results go out before generation starts
+                return event_stream_response(
+                    ('results', {'results': filtered_results, 'count': len(filtered_results), 'query': search_text}),
+                    (lambda: get_gemini_service().stream_summary(filtered_results, search_text)) if filtered_results else None
+                )
             
             # Get summary if there are filtered results
             summary = None
             if filtered_results:
-                summary = gemini_service.generate_summary(filtered_results, search_text)
+                summary = get_gemini_service().generate_summary(filtered_results, search_text)
             
             return jsonify({
                 'results': filtered_results,
@@ -1033,40 +1089,37 @@ def register_routes(app):
         """API endpoint for geospatial best practices RAG search"""
         try:
             search_text = request.json.get('search_text', '')
+            filters = request.json.get('filters')
             if not search_text:
                 return jsonify({'error': 'Please enter text to search for'}), 400
-            # Get embedding from Gemini
-            embedding = get_embedding(search_text)
-            if not embedding:
-                return jsonify({'error': 'Failed to generate embedding'}), 500
-            # Vector search in geo_best_practices
-            pipeline = [
-                {
-                    "$vectorSearch": {
-                        "index": "vector_index",
-                        "queryVector": embedding,
-                        "path": "embedding",
-                        "exact": True,
-                        "limit": 5
-                    }
-                },
-                {
-                    "$project": {
-                        "_id": 0,
-                        "title": 1,
-                        "content": 1,
-                        "score": { "$meta": "vectorSearchScore" }
-                    }
-                }
-            ]
-            results = list(db['geo_best_practices'].aggregate(pipeline))
-            min_score = 0.75
-            filtered_results = [r for r in results if r.get('score', 0) >= min_score]
-            summary = None
+            try:
+                search_filter(filters)
+            except (ValueError, AttributeError) as e:
+                return jsonify({'error': f'Invalid filters: {e}'}), 400
+            collection = passage_collection(db['geo_best_practices']) if RAG_PASSAGE_SEARCH else db['geo_best_practices']
+            limit = RAG_PASSAGE_LIMIT if RAG_PASSAGE_SEARCH else VECTOR_GEO_LIMIT
+            if HYBRID_SEARCH:
+                filtered_results = hybrid_retriever(collection).search(search_text, limit, filters)
+            else:
+                # Get embedding from Gemini
+                embedding = get_embedding(search_text)
+                if not embedding:
+                    return jsonify({'error': 'Failed to generate embedding'}), 500
+                # Vector search in geo_best_practices, cut at the minimum score in the pipeline
+                filtered_results = vector_backend(collection).search(embedding, limit, filters=filters)
+            prompt = None
             if filtered_results:
-                from ai_service import ask_gemini_with_context
-                context = '\n\n'.join([f"Title: {r['title']}\nContent: {r['content']}" for r in filtered_results])
+                context = prompt_context(filtered_results)
                 prompt = f"Use the following geospatial best practices to answer the question. If the practices don't contain relevant information, say so.\n\nBest Practices:\n{context}\n\nQuestion: {search_text}\n\nProvide a clear, concise answer based only on the information in the best practices."
+            if wants_event_stream():
+                from ai_service import stream_gemini_with_context
+                return event_stream_response(
+                    ('results', {'results': filtered_results, 'count': len(filtered_results), 'query': search_text}),
+                    (lambda: stream_gemini_with_context(prompt)) if prompt else None
+                )
+            summary = None
+            if prompt:
+                from ai_service import ask_gemini_with_context
                 summary = ask_gemini_with_context(prompt)
             return jsonify({
                 'results': filtered_results,
@@ -1077,120 +1130,51 @@ def register_routes(app):
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
-def generate_ai_recommendation(asset, chart_data, alerts):
-    """Generate AI recommendations using Gemini AI based on asset status, alerts, and sensor data"""
+def wants_event_stream():
+    """The client asked for Server-Sent Events (?format=sse or Accept: text/event-stream)."""
+    return request.args.get('format') == 'sse' or request.accept_mimetypes.best == 'text/event-stream'
+
+def sse_event(event, data):
+    """One Server-Sent Events message with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, default=json_default)}\n\n"
+
+def event_stream_response(first, chunks=None):
+    """SSE response: the first (event, data) right away, then a token event per generated chunk and done.
+
+    chunks is called only after the first event is sent, so generation never delays it; errors
+    during generation become an error event, as the status line has already gone out.
+    """
+    def generate():
+        yield sse_event(*first)
+        try:
+            if chunks is not None:
+                for chunk in chunks():
+                    yield sse_event('token', {'text': chunk})
+            yield sse_event('done', {})
+        except Exception as e:
+            yield sse_event('error', {'error': str(e)})
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def json_default(value):
+    """JSON encoding for datetimes and ObjectIds in streamed responses."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def parse_iso_arg(name):
+    """Parse an optional ISO-8601 query argument into a naive local datetime, like stored timestamps;
+    raises ValueError if it is not ISO-8601."""
+    value = request.args.get(name)
+    return naive_local(datetime.fromisoformat(value.replace('Z', '+00:00'))) if value else None
+
+def tree_page_args(default_limit):
+    """Parse ?cursor=&limit=&status= for the lazy asset tree endpoints; raises ValueError on a bad limit."""
+    cursor = request.args.get('cursor') or None
     try:
-        # Load the prompt template
-        with open('prompt.txt', 'r') as f:
-            prompt_template = f.read().strip()
-        
-        # Prepare comprehensive asset data for Gemini
-        asset_info = {
-            'name': asset.get('name', 'Unknown'),
-            'type': asset.get('part_type', asset.get('type', 'Unknown')),
-            'status': asset.get('status', 'operational'),
-            'manufacturer': asset.get('manufacturer', 'Unknown'),
-            'installation_date': asset.get('installation_date', 'Unknown'),
-            'expected_lifetime_hours': asset.get('expected_lifetime_hours', 'Unknown'),
-            'description': asset.get('description', 'No description available'),
-            'machine_name': asset.get('machine_name', 'N/A')
-        }
-        
-        # Calculate health score
-        health_score = calculate_health_score(asset, chart_data, alerts)
-        
-        # Prepare sensor data summary
-        sensor_summary = []
-        if chart_data:
-            for metric, data in chart_data.items():
-                if 'values' in data and data['values']:
-                    values = data['values']
-                    anomalies = data.get('anomalies', [])
-                    anomaly_count = sum(1 for a in anomalies if a)
-                    avg_value = sum(values) / len(values) if values else 0
-                    max_value = max(values) if values else 0
-                    min_value = min(values) if values else 0
-                    
-                    sensor_summary.append({
-                        'metric': metric,
-                        'average': round(avg_value, 2),
-                        'max': round(max_value, 2),
-                        'min': round(min_value, 2),
-                        'anomalies': anomaly_count,
-                        'data_points': len(values)
-                    })
-        
-        # Prepare alerts summary
-        alerts_summary = []
-        for alert in alerts:
-            alerts_summary.append({
-                'type': alert.get('type', 'Unknown'),
-                'message': alert.get('message', ''),
-                'severity': alert.get('severity', 'medium'),
-                'timestamp': alert.get('timestamp', '')
-            })
-        
-        # Compose the full prompt for Gemini
-        asset_data_text = f"""
-Asset Information:
-- Name: {asset_info['name']}
-- Type: {asset_info['type']}
-- Status: {asset_info['status']}
-- Manufacturer: {asset_info['manufacturer']}
-- Installation Date: {asset_info['installation_date']}
-- Expected Lifetime: {asset_info['expected_lifetime_hours']} hours
-- Description: {asset_info['description']}
-- Parent Machine: {asset_info['machine_name']}
-
-Device Health Score: {health_score}%
-
-Sensor Data Summary:
-{chr(10).join([f"- {s['metric']}: Avg={s['average']}, Max={s['max']}, Min={s['min']}, Anomalies={s['anomalies']}, Data Points={s['data_points']}" for s in sensor_summary])}
-
-Recent Alerts ({len(alerts_summary)}):
-{chr(10).join([f"- [{a['timestamp']}] {a['type']} ({a['severity']}): {a['message']}" for a in alerts_summary])}
-
-Please provide comprehensive AI recommendations for this asset based on the above data. Focus on:
-1. Immediate actions needed based on status and alerts
-2. Preventive maintenance recommendations
-3. Performance optimization suggestions
-4. Risk assessment and mitigation strategies
-5. Long-term health monitoring advice
-"""
-        
-        full_prompt = f"{prompt_template}\n\n{asset_data_text}"
-        
-        # Call Gemini API
-        response = gemini_service.generate_summary(alerts, full_prompt)
-        return response
-            
-    except Exception as e:
-        print(f"AI recommendation error: {e}")
-        return "AI recommendations temporarily unavailable. Please try again later."
-
-def calculate_health_score(asset, chart_data, alerts):
-    """Calculate device health score (0-100)"""
-    score = 100
-    
-    # Status penalty
-    status_penalty = {
-        'critical': 40,
-        'error': 30,
-        'warning': 20,
-        'maintenance': 15,
-        'in_transit': 10
-    }
-    score -= status_penalty.get(asset.get('status', 'operational'), 0)
-    
-    # Alert penalty
-    if alerts:
-        score -= len(alerts) * 5
-    
-    # Anomaly penalty
-    if chart_data:
-        for metric, data in chart_data.items():
-            if 'anomalies' in data:
-                anomaly_count = sum(1 for a in data['anomalies'] if a)
-                score -= anomaly_count * 2
-    
-    return max(0, min(100, score))
+        limit = max(1, min(int(request.args.get('limit') or default_limit), ASSET_TREE_MAX_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    status = request.args.get('status')
+    statuses = [s for s in status.split(',') if s] if status else None
+    return cursor, limit, statuses
@@ -1,9 +1,17 @@
 import os
-from ai_service import get_embedding
+import hashlib
+from embedding_cache import embedding_cache
 from mongo import db
+from pymongo import UpdateOne
 from pymongo.operations import SearchIndexModel
+from vector_search import vector_index_definition
+from provisioning import ensure_text_index, ensure_vector_index as ensure_search_vector_index, guides_collection
+from passages import passage_collection, split_passages, embedding_text
 import time
 
+# Documents per bulk upsert
+UPSERT_CHUNK_SIZE = 500
+
 # Organ transport device guides
 machine_guides = [
     {
@@ -195,16 +203,7 @@ def ensure_vector_index(collection, num_dimensions=768, index_name="vector_index
         if not any(idx.get("name") == index_name for idx in existing_indexes):
             print(f"Creating vector index '{index_name}' on {collection.name}...")
             search_index_model = SearchIndexModel(
-                definition={
-                    "fields": [
-                        {
-                            "type": "vector",
-                            "numDimensions": num_dimensions,
-                            "path": "embedding",
-                            "similarity": "cosine"
-                        }
-                    ]
-                },
+                definition=vector_index_definition(num_dimensions),
                 name=index_name,
                 type="vectorSearch"
             )
@@ -223,23 +222,90 @@ def ensure_vector_index(collection, num_dimensions=768, index_name="vector_index
         print(f"Error ensuring vector index: {e}")
         raise
 
+def content_hash(doc):
+    """Stable hash of a guide's title and content; unchanged guides are not re-embedded or rewritten."""
+    return hashlib.sha256(f"{doc['title']}\n{doc['content']}".encode('utf-8')).hexdigest()
+
+def seed_collection(collection, docs, label):
+    """Embed new or changed docs in parallel batches and upsert them by content hash."""
+    started = time.time()
+    hashes = [content_hash(doc) for doc in docs]
+    collection.create_index("content_hash", unique=True, partialFilterExpression={"content_hash": {"$exists": True}})
+    existing = {d['content_hash'] for d in collection.find({'content_hash': {'$in': hashes}}, {'content_hash': 1})}
+    todo = [(h, doc) for h, doc in zip(hashes, docs) if h not in existing]
+    print(f"{label}: {len(docs)} documents, {len(docs) - len(todo)} unchanged, {len(todo)} to embed")
+    if not todo:
+        return 0
+
+    progress = {'done': 0}
+    def report(count):
+        progress['done'] += count
+        elapsed = time.time() - started
+        print(f"  embedded {progress['done']}/{len(todo)} ({progress['done'] / elapsed:.1f} docs/s)")
+    embeddings = embedding_cache.get_many([doc['content'] for _, doc in todo], on_batch=report)
+
+    written = 0
+    for i in range(0, len(todo), UPSERT_CHUNK_SIZE):
+        chunk = todo[i:i + UPSERT_CHUNK_SIZE]
+        result = collection.bulk_write([
+            UpdateOne({'content_hash': h}, {'$set': dict(doc, content_hash=h, embedding=embedding)}, upsert=True)
+            for (h, doc), embedding in zip(chunk, embeddings[i:i + UPSERT_CHUNK_SIZE])
+        ], ordered=False)
+        written += result.upserted_count + result.modified_count
+    # Drop earlier versions of revised guides, including ones seeded before content hashes existed
+    stale = collection.delete_many({'title': {'$in': [doc['title'] for _, doc in todo]}, 'content_hash': {'$nin': hashes}})
+    if stale.deleted_count:
+        print(f"{label}: removed {stale.deleted_count} outdated versions")
+    elapsed = time.time() - started
+    print(f"{label}: wrote {written} documents in {elapsed:.1f}s ({len(todo) / elapsed:.1f} docs/s)")
+    return written
+
+def seed_passages(collection, docs, label):
+    """Split docs into passages in the sibling passages collection; only new passages are embedded."""
+    started = time.time()
+    target = passage_collection(collection)
+    target.create_index("guide_id")
+    passages = [passage for doc in docs for passage in split_passages(doc)]
+    ids = [passage['_id'] for passage in passages]
+    existing = {d['_id'] for d in target.find({'_id': {'$in': ids}}, {'_id': 1})}
+    todo = [passage for passage in passages if passage['_id'] not in existing]
+    print(f"{label} passages: {len(passages)} passages, {len(passages) - len(todo)} unchanged, {len(todo)} to embed")
+
+    embeddings = dict(zip(
+        [passage['_id'] for passage in todo],
+        embedding_cache.get_many([embedding_text(passage) for passage in todo])
+    )) if todo else {}
+    for i in range(0, len(passages), UPSERT_CHUNK_SIZE):
+        # Unchanged passages are rewritten without their embedding, as their position may have moved
+        target.bulk_write([
+            UpdateOne({'_id': passage['_id']}, {'$set': dict(passage, **(
+                {'embedding': embeddings[passage['_id']]} if passage['_id'] in embeddings else {}
+            ))}, upsert=True)
+            for passage in passages[i:i + UPSERT_CHUNK_SIZE]
+        ], ordered=False)
+    stale = target.delete_many({'guide_id': {'$in': list({p['guide_id'] for p in passages})}, '_id': {'$nin': ids}})
+    if stale.deleted_count:
+        print(f"{label} passages: removed {stale.deleted_count} outdated passages")
+    print(f"{label} passages: done in {time.time() - started:.1f}s")
+    return len(todo)
+
 def seed_guides():
     """Seed the database with sample guides and geospatial best practices"""
     try:
         # Ensure vector index for geo_best_practices
         ensure_vector_index(db['geo_best_practices'])
-        # Generate embeddings for each guide
-        for guide in machine_guides:
-            guide['embedding'] = get_embedding(guide['content'])
-        # Insert guides into MongoDB
-        result = db['machine_guides'].insert_many(machine_guides)
-        print(f"Successfully inserted {len(result.inserted_ids)} guides")
-        # Generate embeddings for each geospatial best practice
-        for entry in geospatial_best_practices:
-            entry['embedding'] = get_embedding(entry['content'])
-        # Insert best practices into MongoDB
-        geo_result = db['geo_best_practices'].insert_many(geospatial_best_practices)
-        print(f"Successfully inserted {len(geo_result.inserted_ids)} geospatial best practices")
+        # And the Atlas Search index for the lexical leg of hybrid search
+        ensure_text_index(db['geo_best_practices'])
+        # Machine guides go where /api/rag/search reads them (rag_db), not the iot database
+        guides = guides_collection()
+        seed_collection(guides, machine_guides, "Guides")
+        seed_collection(db['geo_best_practices'], geospatial_best_practices, "Geospatial best practices")
+        # Passage-level copies that RAG searches retrieve from
+        seed_passages(guides, machine_guides, "Guides")
+        seed_passages(db['geo_best_practices'], geospatial_best_practices, "Geospatial best practices")
+        for collection in (guides, db['geo_best_practices']):
+            ensure_search_vector_index(passage_collection(collection))
+            ensure_text_index(passage_collection(collection))
     except Exception as e:
         print(f"Error seeding guides: {str(e)}")
         raise
@@ -0,0 +1,136 @@
+import io
+import csv
+import json
+from datetime import datetime
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from mongo import sensor_data, SENSOR_META_FIELD
+from sensor_series import META_FIELDS, naive_local
+from anomaly_detector import detector, detect_and_alert
+from health_service import apply_deltas, ingest_deltas
+from config import SENSOR_INGEST_CHUNK_SIZE
+
+# Rejected rows reported back to the client
+MAX_REPORTED_ERRORS = 20
+
+def parse_ndjson(stream):
+    """Yield one record per non-empty line of an NDJSON body, without buffering it."""
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield ValueError(f'line {line_no}: invalid JSON')
+
+def parse_csv(stream):
+    """Yield one record per row of a CSV body with a header row."""
+    yield from csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8'))
+
+def parse_json(body):
+    """Accept a JSON array of readings or {"readings": [...]}."""
+    if isinstance(body, dict):
+        body = body.get('readings', [])
+    if not isinstance(body, list):
+        raise ValueError('Expected a JSON array of readings')
+    return body
+
+def _asset_ref(value):
+    """Store asset ids as ObjectIds where possible, matching existing readings."""
+    if value in (None, ''):
+        return None
+    return ObjectId(value) if ObjectId.is_valid(str(value)) else str(value)
+
+def _parse_timestamp(value):
+    """Epoch seconds/milliseconds or ISO-8601, as naive local time like the rest of the stored data."""
+    if isinstance(value, datetime):
+        return naive_local(value)
+    if isinstance(value, (int, float)) or (isinstance(value, str) and value.replace('.', '', 1).isdigit()):
+        epoch = float(value)
+        # Epoch milliseconds are common from devices
+        return datetime.fromtimestamp(epoch / 1000 if epoch > 1e11 else epoch)
+    return naive_local(datetime.fromisoformat(str(value).replace('Z', '+00:00')))
+
+def reading_document(record):
+    """Normalize one raw record into the time-series document shape."""
+    if not isinstance(record, dict):
+        raise ValueError('expected an object')
+    meta = {
+        'machine_id': _asset_ref(record.get('machine_id')),
+        'part_id': _asset_ref(record.get('part_id')),
+        'sensor_type': record.get('sensor_type')
+    }
+    if not meta['machine_id'] and not meta['part_id']:
+        raise ValueError('machine_id or part_id is required')
+    if not meta['sensor_type']:
+        raise ValueError('sensor_type is required')
+    if record.get('timestamp') in (None, ''):
+        raise ValueError('timestamp is required')
+    if record.get('value') in (None, ''):
+        raise ValueError('value is required')
+    doc = {
+        'timestamp': _parse_timestamp(record['timestamp']),
+        SENSOR_META_FIELD: {k: meta[k] for k in META_FIELDS if meta[k] is not None},
+        'value': float(record['value']),
+        'is_anomaly': str(record.get('is_anomaly', False)).lower() in ('true', '1')
+    }
+    if record.get('unit'):
+        doc['unit'] = record['unit']
+    return doc
+
+def _report(summary, message):
+    if len(summary['errors']) < MAX_REPORTED_ERRORS:
+        summary['errors'].append(message)
+
+def _write_chunk(docs, summary):
+    chunk_no = summary['chunks']
+    summary['chunks'] += 1
+    try:
+        # Flags are stored with the readings; detector state only moves for written ones below
+        detector.flag(docs)
+        scored = True
+    except Exception as e:
+        # Readings are still stored; they just go unscored
+        _report(summary, f'anomaly detection skipped for chunk {chunk_no}: {e}')
+        scored = False
+    written = docs
+    try:
+        result = sensor_data.insert_many(docs, ordered=False)
+        summary['inserted'] += len(result.inserted_ids)
+    except BulkWriteError as e:
+        # Unordered: everything but the failed documents was written
+        failed = {error['index'] for error in e.details.get('writeErrors', [])}
+        written = [doc for i, doc in enumerate(docs) if i not in failed]
+        summary['inserted'] += e.details.get('nInserted', 0)
+        summary['rejected'] += len(failed)
+    if not scored or not written:
+        return
+    try:
+        # Alerts and health deltas only for readings that were stored
+        raised = detect_and_alert(written)
+        summary['alerts'] += len(raised)
+        summary['anomalies'] += sum(1 for d in written if d['is_anomaly'])
+        apply_deltas(ingest_deltas(written, raised))
+    except Exception as e:
+        _report(summary, f'alerts skipped for chunk {chunk_no}: {e}')
+
+def ingest_readings(records, chunk_size=SENSOR_INGEST_CHUNK_SIZE):
+    """Validate records, flag anomalies and write them with unordered insert_many in chunks."""
+    summary = {'inserted': 0, 'rejected': 0, 'chunks': 0, 'anomalies': 0, 'alerts': 0, 'errors': []}
+    chunk = []
+    for index, record in enumerate(records):
+        try:
+            if isinstance(record, Exception):
+                raise record
+            chunk.append(reading_document(record))
+        except (ValueError, TypeError, KeyError) as e:
+            summary['rejected'] += 1
+            _report(summary, f'record {index}: {e}')
+            continue
+        if len(chunk) >= chunk_size:
+            _write_chunk(chunk, summary)
+            chunk = []
+    if chunk:
+        _write_chunk(chunk, summary)
+    return summary
@@ -0,0 +1,223 @@
+import math
+from datetime import datetime, timedelta
+from bson import ObjectId
+from mongo import sensor_data, SENSOR_META_FIELD
+from config import SENSOR_SERIES_MAX_POINTS, SENSOR_PAGE_MAX_ROWS
+
+ANOMALY = {'$cond': [{'$eq': ['$is_anomaly', True]}, 1, 0]}
+
+# Fields stored under the time-series metaField of each reading
+META_FIELDS = ('machine_id', 'part_id', 'sensor_type')
+
+def meta_path(field):
+    """Dotted path of a metadata field in sensor_data."""
+    return f'{SENSOR_META_FIELD}.{field}'
+
+def meta_match(field, condition):
+    """Filter on a metadata field, also matching legacy readings that still keep it at the top level
+    (written before migrate_sensor_data.py moved it under the metaField)."""
+    return {'$or': [{meta_path(field): condition}, {field: condition}]}
+
+def meta_value(field):
+    """Aggregation expression for a metadata field, wherever the reading keeps it."""
+    return {'$ifNull': ['$' + meta_path(field), '$' + field]}
+
+def flatten_reading(doc):
+    """Lift metadata to the top level and stringify ObjectIds, for JSON output."""
+    reading = {k: v for k, v in doc.items() if k != SENSOR_META_FIELD}
+    reading.update(doc.get(SENSOR_META_FIELD) or {})
+    for k, v in reading.items():
+        if isinstance(v, ObjectId):
+            reading[k] = str(v)
+    return reading
+
+def naive_local(value):
+    """A datetime as naive local time, the convention of every stored timestamp (datetime.now());
+    tz-aware values are converted, naive ones are taken as already local."""
+    return value.astimezone().replace(tzinfo=None) if value.tzinfo else value
+
+def asset_keys(asset_id):
+    """Sensor readings reference assets either by ObjectId or by string id; match both."""
+    keys = [str(asset_id)]
+    if ObjectId.is_valid(str(asset_id)):
+        keys.append(ObjectId(str(asset_id)))
+    return keys
+
+def series_window(start=None, end=None, max_points=None):
+    """Normalize the requested window (as naive local time) and point budget; start stays None
+    when omitted, for the asset's whole history."""
+    end = naive_local(end) if end else datetime.now()
+    start = naive_local(start) if start else None
+    if start and start >= end:
+        raise ValueError('from must be before to')
+    max_points = max(1, min(int(max_points or SENSOR_SERIES_MAX_POINTS), SENSOR_SERIES_MAX_POINTS))
+    return start, end, max_points
+
+def series_pipeline(asset_field, asset_id, start, end, max_points):
+    """Aggregation returning per-sensor stats and min/max-bucketed series in one pass."""
+    span_ms = (end - start).total_seconds() * 1000
+    bucket_ms = max(1, math.ceil(span_ms / max_points))
+    return [
+        {'$match': {
+            **meta_match(asset_field, {'$in': asset_keys(asset_id)}),
+            'timestamp': {'$gte': start, '$lte': end}
+        }},
+        {'$facet': {
+            'stats': [
+                {'$group': {
+                    '_id': meta_value('sensor_type'),
+                    'avg': {'$avg': '$value'},
+                    'min': {'$min': '$value'},
+                    'max': {'$max': '$value'},
+                    'count': {'$sum': 1},
+                    'anomalies': {'$sum': ANOMALY}
+                }}
+            ],
+            'series': [
+                {'$group': {
+                    '_id': {
+                        'sensor_type': meta_value('sensor_type'),
+                        'bucket': {'$floor': {'$divide': [{'$subtract': ['$timestamp', start]}, bucket_ms]}}
+                    },
+                    'timestamp': {'$min': '$timestamp'},
+                    'value': {'$avg': '$value'},
+                    'min': {'$min': '$value'},
+                    'max': {'$max': '$value'},
+                    'anomalies': {'$sum': ANOMALY}
+                }},
+                {'$sort': {'_id.sensor_type': 1, 'timestamp': 1}}
+            ]
+        }}
+    ]
+
+def load_series(asset_field, asset_id, start=None, end=None, max_points=None):
+    """Chart data keyed by sensor type, at most max_points buckets per type, with exact stats."""
+    start, end, max_points = series_window(start, end, max_points)
+    if start is None:
+        # Whole history: from the asset's first reading, still downsampled to max_points
+        first = next(sensor_data.find(
+            dict(meta_match(asset_field, {'$in': asset_keys(asset_id)}), timestamp={'$lte': end}), {'timestamp': 1}
+        ).sort('timestamp', 1).limit(1), None)
+        if not first:
+            return {}
+        start = min(first['timestamp'], end - timedelta(seconds=1))
+    result = next(sensor_data.aggregate(series_pipeline(asset_field, asset_id, start, end, max_points)), None)
+    chart_data = {}
+    if not result:
+        return chart_data
+    for row in result['series']:
+        sensor_type = row['_id'].get('sensor_type') or 'Unknown'
+        if sensor_type not in chart_data:
+            chart_data[sensor_type] = {'timestamps': [], 'values': [], 'labels': [], 'anomalies': [], 'min': [], 'max': []}
+        series = chart_data[sensor_type]
+        series['timestamps'].append(row['timestamp'])
+        series['labels'].append(row['timestamp'])
+        series['values'].append(row['value'])
+        series['min'].append(row['min'])
+        series['max'].append(row['max'])
+        series['anomalies'].append(row['anomalies'] > 0)
+    for row in result['stats']:
+        sensor_type = row['_id'] or 'Unknown'
+        if sensor_type in chart_data:
+            chart_data[sensor_type]['stats'] = {
+                'average': round(row['avg'], 2) if row['avg'] is not None else None,
+                'min': row['min'],
+                'max': row['max'],
+                'data_points': row['count'],
+                'anomalies': row['anomalies']
+            }
+    return chart_data
+
+def reading_cursor(doc):
+    """Keyset cursor '<iso timestamp>,<_id>' positioned at a reading."""
+    return f"{doc['timestamp'].isoformat()},{doc['_id']}"
+
+def parse_reading_cursor(value):
+    """Inverse of reading_cursor."""
+    timestamp, _, oid = value.rpartition(',')
+    if not timestamp or not ObjectId.is_valid(oid):
+        raise ValueError('after must be <timestamp>,<id>')
+    return naive_local(datetime.fromisoformat(timestamp)), ObjectId(oid)
+
+def readings_query(machine_id=None, part_id=None, sensor_type=None, start=None, end=None):
+    """Filter for readings of an asset, sensor type and time window."""
+    query = {}
+    conditions = []
+    if machine_id:
+        conditions.append(meta_match('machine_id', {'$in': asset_keys(machine_id)}))
+    if part_id:
+        conditions.append(meta_match('part_id', {'$in': asset_keys(part_id)}))
+    if sensor_type:
+        conditions.append(meta_match('sensor_type', sensor_type))
+    if conditions:
+        query['$and'] = conditions
+    if start or end:
+        query['timestamp'] = {}
+        if start:
+            query['timestamp']['$gte'] = start
+        if end:
+            query['timestamp']['$lte'] = end
+    return query
+
+def _with_timestamp(query, condition):
+    """query with condition added to its timestamp bounds."""
+    bounded = dict(query)
+    bounded['timestamp'] = dict(query.get('timestamp') or {}, **condition)
+    return bounded
+
+def readings_page(query, limit, after=None, descending=True, projection=None):
+    """Up to limit readings matching query in (timestamp, _id) order, continuing after a cursor.
+
+    Only the timestamp sort runs over the collection, which a time-series collection serves
+    bucket by bucket instead of sorting every match in memory. Readings sharing the timestamp
+    at either page boundary are read with an equality match on it and ordered by _id there;
+    ties inside the page are ordered in memory.
+    """
+    direction = -1 if descending else 1
+    op = '$lt' if descending else '$gt'
+
+    def tied(timestamp, count, after_id=None):
+        tie = _with_timestamp(query, {'$eq': timestamp})
+        if after_id is not None:
+            tie['_id'] = {op: after_id}
+        return list(sensor_data.find(tie, projection).sort('_id', direction).limit(count))
+
+    docs = []
+    rest = query
+    if after:
+        timestamp, oid = after
+        docs = tied(timestamp, limit, oid)
+        rest = _with_timestamp(query, {op: timestamp})
+    if len(docs) < limit:
+        page = list(sensor_data.find(rest, projection).sort('timestamp', direction).limit(limit - len(docs)))
+        if len(docs) + len(page) == limit:
+            # The page may end inside a run of equal timestamps: take that run in _id order instead
+            boundary = page[-1]['timestamp']
+            page = [doc for doc in page if doc['timestamp'] != boundary]
+            page += tied(boundary, limit - len(docs) - len(page))
+        docs += page
+    docs.sort(key=lambda doc: (doc['timestamp'], doc['_id']), reverse=descending)
+    return docs
+
+def iter_readings(query, limit, after=None, descending=True, projection=None, page_size=SENSOR_PAGE_MAX_ROWS):
+    """Up to limit readings in readings_page order, fetched a page at a time for long exports."""
+    sent = 0
+    while sent < limit:
+        docs = readings_page(query, min(page_size, limit - sent), after, descending, projection)
+        yield from docs
+        sent += len(docs)
+        if len(docs) < page_size:
+            return
+        after = (docs[-1]['timestamp'], docs[-1]['_id'])
+
+def readings_projection(fields):
+    """Projection for the requested reading fields; _id and timestamp are always kept for the cursor."""
+    if not fields:
+        return None
+    projection = {'_id': 1, 'timestamp': 1}
+    for field in fields:
+        projection[field] = 1
+        if field in META_FIELDS:
+            # Legacy readings keep metadata at the top level
+            projection[meta_path(field)] = 1
+    return projection
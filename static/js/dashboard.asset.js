@@ -9,39 +9,89 @@ function initializeAssetTree() {
         if (treeDiv) treeDiv.innerHTML = '<div class="text-danger">Asset tree cannot load: jQuery or jsTree is missing. Please contact support.</div>';
         return;
     }
-    fetch('/api/asset-tree')
+    try {
+        $('#asset-tree').jstree('destroy');
+    } catch (e) {
+        // ignore if not initialized
+    }
+    $('#asset-tree').jstree({
+        core: { 
+            // Machines load a page at a time; parts load when a machine is expanded
+            data: loadAssetTreeNodes,
+            themes: {
+                name: 'default',
+                responsive: true
+            },
+            multiple: false,
+            animation: 200
+        },
+        plugins: ['wholerow', 'themes'],
+        wholerow: {
+            hover: true
+        }
+    }).on('ready.jstree', function() {
+        // Don't set up click handler immediately - wait for showAssetPanel to be available
+        waitForShowAssetPanel();
+    });
+}
+
+const ASSET_TREE_PAGE_SIZE = 50;
+
+// jsTree data callback: root gets the first machine page, a machine gets its parts
+function loadAssetTreeNodes(node, callback) {
+    const machineId = node.id === '#' ? null : node.original.machine_id;
+    fetchAssetTreePage(machineId, null)
+        .then(nodes => callback.call(this, nodes))
+        .catch((err) => {
+            console.error('Asset tree fetch error:', err);
+            if (node.id === '#') {
+                const treeDiv = document.getElementById('asset-tree');
+                if (treeDiv) treeDiv.innerHTML = '<div class="text-danger">Failed to load asset hierarchy.</div>';
+            }
+            callback.call(this, []);
+        });
+}
+
+// Fetch one keyset page of machines (machineId null) or of one machine's parts
+function fetchAssetTreePage(machineId, cursor) {
+    const params = new URLSearchParams();
+    if (machineId === null) params.set('limit', ASSET_TREE_PAGE_SIZE);
+    if (cursor) params.set('cursor', cursor);
+    const url = machineId === null
+        ? `/api/asset-tree?${params}`
+        : `/api/asset-tree/${machineId}/children?${params}`;
+    return fetch(url)
         .then(response => response.json())
         .then(data => {
-            try {
-                $('#asset-tree').jstree('destroy');
-            } catch (e) {
-                // ignore if not initialized
+            if (data.error) throw new Error(data.error);
+            const nodes = data.nodes;
+            if (data.next_cursor) {
+                // Placeholder node that loads the next page when selected
+                nodes.push({
+                    id: `more-${machineId || 'root'}-${data.next_cursor}`,
+                    text: '<span class="text-muted">Load more...</span>',
+                    type: 'more',
+                    parent_machine_id: machineId,
+                    cursor: data.next_cursor,
+                    children: false
+                });
             }
-            $('#asset-tree').jstree({
-                core: { 
-                    data: data,
-                    themes: {
-                        name: 'default',
-                        responsive: true
-                    },
-                    multiple: false,
-                    animation: 200
-                },
-                plugins: ['wholerow', 'themes'],
-                wholerow: {
-                    hover: true
-                }
-            }).on('ready.jstree', function() {
-                // Don't set up click handler immediately - wait for showAssetPanel to be available
-                waitForShowAssetPanel();
-            });
-        })
-        .catch((err) => {
-            console.error('Asset tree fetch error:', err);
-            if (treeDiv) treeDiv.innerHTML = '<div class="text-danger">Failed to load asset hierarchy.</div>';
+            return nodes;
         });
 }
 
+// Replace a "Load more" placeholder with the next page of nodes
+function loadMoreAssetNodes(moreNode) {
+    const tree = $('#asset-tree').jstree(true);
+    const parent = moreNode.parent;
+    fetchAssetTreePage(moreNode.original.parent_machine_id, moreNode.original.cursor)
+        .then(nodes => {
+            tree.delete_node(moreNode);
+            nodes.forEach(n => tree.create_node(parent, n, 'last'));
+        })
+        .catch(err => console.error('Asset tree fetch error:', err));
+}
+
 // Function to wait for showAssetPanel to be available
 function waitForShowAssetPanel() {
     if (typeof window.showAssetPanel === 'function') {
@@ -58,6 +108,10 @@ function setupAssetTreeClickHandler() {
     // Set up the new handler with more specific targeting
     $('#asset-tree').on('select_node.jstree', function(e, data) {
     const nodeType = data.node.original.type;
+    if (nodeType === 'more') {
+        loadMoreAssetNodes(data.node);
+        return;
+    }
     const assetId = nodeType === 'machine' ? data.node.original.machine_id : data.node.original.part_id;
         
     if (nodeType && assetId) {
@@ -81,6 +135,8 @@ function loadAssetDetailsInPanel(assetType, assetId) {
     }
     
     container.innerHTML = '<div class="text-muted">Loading asset details...</div>';
+    // Cancel any recommendation polling for the previously shown asset
+    window._aiRecommendationUrl = null;
     
     fetch(`/api/asset/${assetType}/${assetId}`)
         .then(response => response.json())
@@ -118,51 +174,22 @@ function loadAssetDetailsInPanel(assetType, assetId) {
                     chartsHtml = generateChartsHtml(data.chart_data, assetName);
                 }
                 
-                // AI recommendations section
-                let aiRecommendationsHtml = '';
-                if (data.ai_recommendation) {
-                    // Clean up the AI response by removing empty lines and formatting properly
-                    const cleanedRecommendations = data.ai_recommendation
-                        .split('\n')
-                        .map(line => line.trim())
-                        .filter(line => {
-                            // Only keep lines with actual content
-                            return line && 
-                                   !line.match(/^\s*$/) && // Not just whitespace
-                                   line !== '-' && 
-                                   line !== '•' && 
-                                   line.length > 1 &&
-                                   !line.match(/^[-\s]*$/); // Not just dashes and spaces
-                        })
-                        .map(line => `<p class="mb-2">${line}</p>`)
-                        .join('');
-                    
-                    aiRecommendationsHtml = `
-                        <div class="card mb-2">
-                            <div class="card-header bg-primary text-white">
-                                <i class="fas fa-robot"></i> AI Recommendations
-                            </div>
-                            <div class="card-body">
-                                <div class="ai-recommendation-content">
-                                    ${cleanedRecommendations}
-                                </div>
-                            </div>
+                // AI recommendations section; generated in the background and polled until ready
+                const aiRecommendationsHtml = `
+                    <div class="card mb-2">
+                        <div class="card-header bg-primary text-white">
+                            <i class="fas fa-robot"></i> AI Recommendations
                         </div>
-                    `;
-                } else {
-                    aiRecommendationsHtml = `
-                        <div class="card mb-2">
-                            <div class="card-header bg-primary text-white">
-                                <i class="fas fa-robot"></i> AI Recommendations
-                            </div>
-                            <div class="card-body">
+                        <div class="card-body">
+                            <div class="ai-recommendation-content">
+                                ${data.ai_recommendation ? formatAiRecommendation(data.ai_recommendation) : `
                                 <div class="text-center text-muted">
                                     <i class="fas fa-spinner fa-spin"></i> Generating AI recommendations...
-                                </div>
+                                </div>`}
                             </div>
                         </div>
-                    `;
-                }
+                    </div>
+                `;
                 
                 // Alerts section
                 let alertsHtml = '';
@@ -197,6 +224,10 @@ function loadAssetDetailsInPanel(assetType, assetId) {
                     initializeCharts(data.chart_data);
                 }
                 
+                if (!data.ai_recommendation && data.recommendation_url) {
+                    pollAiRecommendation(data.recommendation_url);
+                }
+                
                 // Clean up any remaining empty elements in AI recommendations
                 setTimeout(() => {
                     const aiContent = document.querySelector('.ai-recommendation-content');
@@ -222,8 +253,55 @@ function loadAssetDetailsInPanel(assetType, assetId) {
         });
 }
 
+// Clean up the AI response by removing empty lines and formatting properly
+function formatAiRecommendation(text) {
+    return text
+        .split('\n')
+        .map(line => line.trim())
+        .filter(line => {
+            // Only keep lines with actual content
+            return line && 
+                   !line.match(/^\s*$/) && // Not just whitespace
+                   line !== '-' && 
+                   line !== '•' && 
+                   line.length > 1 &&
+                   !line.match(/^[-\s]*$/); // Not just dashes and spaces
+        })
+        .map(line => `<p class="mb-2">${line}</p>`)
+        .join('');
+}
+
+// Poll the recommendation endpoint until the background generation finishes
+function pollAiRecommendation(url, attempt = 0) {
+    window._aiRecommendationUrl = url;
+    setTimeout(() => {
+        // Stop if another asset has been opened since
+        if (window._aiRecommendationUrl !== url) return;
+        fetch(url)
+            .then(response => response.json())
+            .then(data => {
+                if (window._aiRecommendationUrl !== url) return;
+                const aiContent = document.querySelector('.ai-recommendation-content');
+                if (!aiContent) return;
+                if (data.status === 'pending' && attempt < 60) {
+                    pollAiRecommendation(url, attempt + 1);
+                } else if (data.ai_recommendation) {
+                    aiContent.innerHTML = formatAiRecommendation(data.ai_recommendation);
+                } else {
+                    aiContent.innerHTML = '<div class="text-muted">AI recommendations temporarily unavailable. Please try again later.</div>';
+                }
+            })
+            .catch(err => console.error('AI recommendation poll error:', err));
+    }, 2000);
+}
+
 // Calculate device health score based on various factors
 function calculateHealthScore(data) {
+    // Materialized server-side and kept current at ingest
+    if (typeof data.health_score === 'number') {
+        return data.health_score;
+    }
+
     let score = 100;
     
     // Reduce score based on status
@@ -244,7 +322,10 @@ function calculateHealthScore(data) {
     // Reduce score based on anomalies in chart data
     if (data.chart_data) {
         Object.values(data.chart_data).forEach(metric => {
-            if (metric.anomalies) {
+            if (metric.stats) {
+                // Exact count over the whole window; the series itself is downsampled
+                score -= metric.stats.anomalies * 2;
+            } else if (metric.anomalies) {
                 const anomalyCount = metric.anomalies.filter(a => a).length;
                 score -= anomalyCount * 2;
             }
@@ -292,12 +373,21 @@ function generateChartsHtml(chartData, assetName) {
 function generateMetricStats(data) {
     if (!data.values || data.values.length === 0) return '<span class="text-muted">No data available</span>';
     
-    const values = data.values;
-    const anomalies = data.anomalies || [];
-    const avg = (values.reduce((a, b) => a + b, 0) / values.length).toFixed(2);
-    const max = Math.max(...values).toFixed(2);
-    const min = Math.min(...values).toFixed(2);
-    const anomalyCount = anomalies.filter(a => a).length;
+    let avg, max, min, anomalyCount;
+    if (data.stats) {
+        // Server-side stats cover every reading, not just the downsampled points
+        avg = Number(data.stats.average).toFixed(2);
+        max = Number(data.stats.max).toFixed(2);
+        min = Number(data.stats.min).toFixed(2);
+        anomalyCount = data.stats.anomalies;
+    } else {
+        const values = data.values;
+        const anomalies = data.anomalies || [];
+        avg = (values.reduce((a, b) => a + b, 0) / values.length).toFixed(2);
+        max = Math.max(...values).toFixed(2);
+        min = Math.min(...values).toFixed(2);
+        anomalyCount = anomalies.filter(a => a).length;
+    }
     
     return `
         <div class="metric-grid">
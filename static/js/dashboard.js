@@ -70,36 +70,41 @@ if (ragForm) {
             ragSummary.innerHTML = `<div class='text-center text-muted'><i class='fas fa-spinner fa-spin'></i> Generating summary...</div>`;
             fetch('/api/rag/search', {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
+                headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
                 body: JSON.stringify({ search_text: searchText })
             })
-            .then(response => response.json())
-            .then(data => {
-                if (data.error) {
-                    ragResults.innerHTML = `<div class='alert alert-danger'><i class='fas fa-exclamation-circle'></i> ${data.error}</div>`;
-                    ragSummary.innerHTML = '';
-                } else {
-                    if (data.results && data.results.length > 0) {
-                        const resultsHtml = data.results.map(result => `
-                            <div class='result-item'>
-                                <h5>${result.title || 'Untitled'}</h5>
-                                <p>${result.content}</p>
-                                <div class='result-meta'><span class='badge badge-info'>Score: ${(result.score * 100).toFixed(1)}%</span></div>
-                            </div>
-                        `).join('');
-                        ragResults.innerHTML = resultsHtml;
-                    } else {
-                        ragResults.innerHTML = `<div class='alert alert-info'><i class='fas fa-info-circle'></i> No results found</div>`;
-                    }
-                    if (data.summary) {
-                        ragSummary.innerHTML = `<div class='summary-content'>${data.summary}</div>`;
-                    } else {
+            .then(response => {
+                if (!isEventStream(response)) {
+                    return response.json().then(data => { throw new Error(data.error || 'Search failed'); });
+                }
+                // Results arrive first; the summary streams in token by token
+                let summary = '';
+                return readEventStream(response, (event, data) => {
+                    if (event === 'results') {
+                        if (data.results && data.results.length > 0) {
+                            const resultsHtml = data.results.map(result => `
+                                <div class='result-item'>
+                                    <h5>${result.title || 'Untitled'}</h5>
+                                    <p>${result.content}</p>
+                                    <div class='result-meta'><span class='badge badge-info'>Score: ${(result.score * 100).toFixed(1)}%</span></div>
+                                </div>
+                            `).join('');
+                            ragResults.innerHTML = resultsHtml;
+                        } else {
+                            ragResults.innerHTML = `<div class='alert alert-info'><i class='fas fa-info-circle'></i> No results found</div>`;
+                        }
+                    } else if (event === 'token') {
+                        summary += data.text;
+                        ragSummary.innerHTML = `<div class='summary-content'>${summary}</div>`;
+                    } else if (event === 'done' && !summary) {
                         ragSummary.innerHTML = `<div class='alert alert-info'><i class='fas fa-info-circle'></i> No summary available</div>`;
+                    } else if (event === 'error') {
+                        ragSummary.innerHTML = `<div class='alert alert-danger'><i class='fas fa-exclamation-circle'></i> ${data.error}</div>`;
                     }
-                }
+                });
             })
             .catch(error => {
-                ragResults.innerHTML = `<div class='alert alert-danger'><i class='fas fa-exclamation-circle'></i> Search failed</div>`;
+                ragResults.innerHTML = `<div class='alert alert-danger'><i class='fas fa-exclamation-circle'></i> ${error.message || 'Search failed'}</div>`;
                 ragSummary.innerHTML = '';
             });
         }
@@ -131,51 +136,61 @@ function fetchGeoAdvisorResults(query) {
     geoAdvisorBestPractices.innerHTML = `<div class='text-center text-muted'><i class='fas fa-spinner fa-spin'></i> Searching best practices...</div>`;
     fetch('/api/geo-advisor/search', {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
         body: JSON.stringify({ search_text: query })
     })
-    .then(response => response.json())
-    .then(data => {
-        // Remove duplicate results by title/content
-        let unique = [];
-        let seen = new Set();
-        if (data.results && data.results.length > 0) {
-            data.results.forEach(result => {
-                const key = (result.title || '') + (result.content || '');
-                if (!seen.has(key)) {
-                    unique.push(result);
-                    seen.add(key);
-                }
-            });
-        }
-        // Show Gemini summary as advisor message
-        let summaryHtml = '';
-        if (data.summary) {
-            summaryHtml = `
-                <div class='advisor-summary-card mb-3'>
-                    <div class='advisor-avatar'>🧑‍💼</div>
-                    <div class='advisor-message'>
-                        <b>Advisor:</b> <span>${data.summary}</span>
-                    </div>
-                </div>
-            `;
+    .then(response => {
+        if (!isEventStream(response)) {
+            return response.json().then(data => { throw new Error(data.error); });
         }
-        // Show best practices as cards
-        let resultsHtml = '';
-        if (unique.length > 0) {
-            resultsHtml = unique.map(result => `
-                <div class='advisor-card mb-2'>
-                    <div class='advisor-card-header'>
-                        <span class='advisor-title'>${result.title || 'Untitled'}</span>
-                        <span class='advisor-score badge badge-info ml-2'>Score: ${(result.score * 100).toFixed(1)}%</span>
+        let summary = '';
+        return readEventStream(response, (event, data) => {
+            if (event === 'results') {
+                // Remove duplicate results by title/content
+                let unique = [];
+                let seen = new Set();
+                if (data.results && data.results.length > 0) {
+                    data.results.forEach(result => {
+                        const key = (result.title || '') + (result.content || '');
+                        if (!seen.has(key)) {
+                            unique.push(result);
+                            seen.add(key);
+                        }
+                    });
+                }
+                // Gemini summary as advisor message, filled in as it streams
+                const summaryHtml = `
+                    <div class='advisor-summary-card mb-3' id='geo-advisor-summary' style='display:none'>
+                        <div class='advisor-avatar'>🧑‍💼</div>
+                        <div class='advisor-message'>
+                            <b>Advisor:</b> <span id='geo-advisor-summary-text'></span>
+                        </div>
                     </div>
-                    <div class='advisor-card-content'>${result.content}</div>
-                </div>
-            `).join('');
-        } else {
-            resultsHtml = `<div class='alert alert-info'><i class='fas fa-info-circle'></i> No best practices found</div>`;
-        }
-        geoAdvisorBestPractices.innerHTML = summaryHtml + resultsHtml;
+                `;
+                // Show best practices as cards
+                let resultsHtml = '';
+                if (unique.length > 0) {
+                    resultsHtml = unique.map(result => `
+                        <div class='advisor-card mb-2'>
+                            <div class='advisor-card-header'>
+                                <span class='advisor-title'>${result.title || 'Untitled'}</span>
+                                <span class='advisor-score badge badge-info ml-2'>Score: ${(result.score * 100).toFixed(1)}%</span>
+                            </div>
+                            <div class='advisor-card-content'>${result.content}</div>
+                        </div>
+                    `).join('');
+                } else {
+                    resultsHtml = `<div class='alert alert-info'><i class='fas fa-info-circle'></i> No best practices found</div>`;
+                }
+                geoAdvisorBestPractices.innerHTML = summaryHtml + resultsHtml;
+            } else if (event === 'token') {
+                summary += data.text;
+                document.getElementById('geo-advisor-summary').style.display = '';
+                document.getElementById('geo-advisor-summary-text').textContent = summary;
+            } else if (event === 'error') {
+                throw new Error(data.error);
+            }
+        });
     })
     .catch(() => {
         geoAdvisorBestPractices.innerHTML = `<div class='alert alert-danger'><i class='fas fa-exclamation-circle'></i> Advisor search failed</div>`;
@@ -389,10 +404,7 @@ function animateMetrics() {
 }
 
 function startPeriodicUpdates() {
-    // Update all metrics every 30 seconds with real data
-    setInterval(updateMetrics, 30000);
-    
-    // Update metrics every 10 seconds for more frequent updates
+    // Update metrics every 10 seconds; the server shares one snapshot per time bucket
     setInterval(updateMetrics, 10000);
 }
 
@@ -1,3 +1,8 @@
+// Speech recognition needs no more than 16 kHz mono; matches the server's AUDIO_* defaults
+const UPLOAD_SAMPLE_RATE = 16000;
+const FRAME_MS = 10;
+const SILENCE_PADDING_MS = 200;
+
 class VoiceChat {
     constructor() {
         this.mediaRecorder = null;
@@ -160,36 +165,136 @@ class VoiceChat {
         this.source = null;
     }
 
-    async processAudio() {
+    async prepareUpload(recording) {
+        // Resample to 16 kHz mono and trim silence in the browser. Upload whichever is smaller:
+        // that WAV or the compressed recording. Returns null when nothing was said.
+        const decoder = new (window.AudioContext || window.webkitAudioContext)();
+        let decoded;
         try {
-            const audioBlob = new Blob(this.audioChunks, { type: 'audio/wav' });
-            const formData = new FormData();
-            formData.append('audio', audioBlob);
+            decoded = await decoder.decodeAudioData(await recording.arrayBuffer());
+        } finally {
+            decoder.close();
+        }
+        const rendered = await this.resample(decoded, UPLOAD_SAMPLE_RATE);
+        const samples = this.trimSilence(rendered.getChannelData(0), UPLOAD_SAMPLE_RATE);
+        if (samples.length === 0) {
+            return null;
+        }
+        const wav = this.encodeWav(samples, UPLOAD_SAMPLE_RATE);
+        return wav.size < recording.size ? wav : recording;
+    }
 
-            const response = await fetch('/api/voice-chat', {
-                method: 'POST',
-                body: formData
-            });
+    resample(buffer, rate) {
+        // A one-channel offline context downmixes and resamples (with filtering) as it renders
+        const length = Math.max(1, Math.ceil(buffer.duration * rate));
+        const context = new (window.OfflineAudioContext || window.webkitOfflineAudioContext)(1, length, rate);
+        const source = context.createBufferSource();
+        source.buffer = buffer;
+        source.connect(context.destination);
+        source.start();
+        return context.startRendering();
+    }
 
-            const data = await response.json();
-            
-            if (data.error) {
-                throw new Error(data.error);
+    trimSilence(samples, rate) {
+        // Drop leading/trailing 10 ms frames quieter than silenceThreshold, keeping some padding
+        const frame = Math.round(rate * FRAME_MS / 1000);
+        const frames = Math.floor(samples.length / frame);
+        let first = -1;
+        let last = -1;
+        for (let f = 0; f < frames; f++) {
+            let energy = 0;
+            for (let i = f * frame; i < (f + 1) * frame; i++) {
+                energy += samples[i] * samples[i];
             }
+            if (Math.sqrt(energy / frame) >= this.silenceThreshold) {
+                if (first < 0) first = f;
+                last = f;
+            }
+        }
+        if (first < 0) {
+            return samples.subarray(0, 0);
+        }
+        const padding = SILENCE_PADDING_MS / FRAME_MS;
+        return samples.subarray(Math.max(0, first - padding) * frame, Math.min(samples.length, (last + 1 + padding) * frame));
+    }
 
-            // Add user message
-            this.addMessage(data.transcription, 'user');
-            
-            // Add assistant response
-            this.addMessage(data.response, 'assistant');
-            
-            await this.playAssistantAudio(data.response);
+    encodeWav(samples, rate) {
+        // Mono 16-bit PCM WAV
+        const view = new DataView(new ArrayBuffer(44 + samples.length * 2));
+        const writeString = (offset, text) => {
+            for (let i = 0; i < text.length; i++) view.setUint8(offset + i, text.charCodeAt(i));
+        };
+        writeString(0, 'RIFF');
+        view.setUint32(4, 36 + samples.length * 2, true);
+        writeString(8, 'WAVE');
+        writeString(12, 'fmt ');
+        view.setUint32(16, 16, true);
+        view.setUint16(20, 1, true);
+        view.setUint16(22, 1, true);
+        view.setUint32(24, rate, true);
+        view.setUint32(28, rate * 2, true);
+        view.setUint16(32, 2, true);
+        view.setUint16(34, 16, true);
+        writeString(36, 'data');
+        view.setUint32(40, samples.length * 2, true);
+        for (let i = 0; i < samples.length; i++) {
+            const sample = Math.max(-1, Math.min(1, samples[i]));
+            view.setInt16(44 + i * 2, sample < 0 ? sample * 0x8000 : sample * 0x7FFF, true);
+        }
+        return new Blob([view], { type: 'audio/wav' });
+    }
+
+    async processAudio() {
+        try {
+            const recording = new Blob(this.audioChunks, { type: this.mediaRecorder.mimeType || 'audio/webm' });
+            let audioBlob = recording;
+            try {
+                audioBlob = await this.prepareUpload(recording);
+            } catch (error) {
+                // Browsers that cannot decode or resample their own recording send it as recorded
+                console.warn('Could not preprocess the recording, sending it as is:', error);
+            }
+
+            if (audioBlob) {
+                const formData = new FormData();
+                formData.append('audio', audioBlob, audioBlob === recording ? 'recording' : 'recording.wav');
+
+                const response = await fetch('/api/voice-chat', {
+                    method: 'POST',
+                    // The server reports bytes saved against what was actually recorded
+                    headers: { 'Accept': 'text/event-stream', 'X-Recorded-Bytes': String(recording.size) },
+                    body: formData
+                });
+
+                if (!isEventStream(response)) {
+                    const data = await response.json();
+                    throw new Error(data.error);
+                }
+
+                // The transcription arrives first, then the answer streams into its message
+                let answer = '';
+                let answerDiv = null;
+                await readEventStream(response, (event, data) => {
+                    if (event === 'transcription') {
+                        this.addMessage(data.transcription, 'user');
+                        answerDiv = this.addMessage('', 'assistant');
+                    } else if (event === 'token') {
+                        answer += data.text;
+                        answerDiv.textContent = answer;
+                        this.content.scrollTop = this.content.scrollHeight;
+                    } else if (event === 'error') {
+                        throw new Error(data.error);
+                    }
+                });
+
+                await this.playAssistantAudio(answer);
+            }
 
             // If still in duplex mode, start recording again
             if (this.isDuplex) {
                 await this.startRecording();
             } else {
-                this.status.textContent = 'Ready';
+                this.status.textContent = audioBlob ? 'Ready' : 'No speech detected';
                 // Do NOT hide the modal here; keep it open until user closes it
             }
         } catch (error) {
@@ -219,6 +324,7 @@ class VoiceChat {
         this.content.appendChild(messageDiv);
         // Auto-scroll to the latest message
         this.content.scrollTop = this.content.scrollHeight;
+        return messageDiv;
     }
 
     showModal() {
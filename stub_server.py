@@ -0,0 +1,107 @@
+"""Local HTTP stand-in for upstream APIs (Gemini, Deepgram), shared by the tests and benchmarks."""
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class StubRequest:
+    """A POST received by the stand-in."""
+
+    def __init__(self, path, headers, body):
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+    @property
+    def model(self):
+        """Model name of a Gemini-style .../models/{model}:{method} path."""
+        return self.path.split('/models/')[1].split(':')[0] if '/models/' in self.path else None
+
+    @property
+    def prompt(self):
+        """Text of the first part of a generateContent request."""
+        return self.json()['contents'][0]['parts'][0]['text']
+
+def gemini_reply(text):
+    """generateContent response body carrying text."""
+    return {'candidates': [{'content': {'parts': [{'text': text}]}}]}
+
+class StubServer:
+    """Serves POSTs on 127.0.0.1 from a daemon thread with respond(request), which returns a body or
+    (status, body) or (status, body, headers). A dict/list body is sent as JSON, bytes as they are,
+    and any other iterable of bytes as a chunked response, one chunk per item.
+
+    Counts requests and the peak number handled at once; use as a context manager or close().
+    """
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.requests = 0
+        self.in_flight = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                stub._handle(self)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    def _handle(self, handler):
+        body = handler.rfile.read(int(handler.headers.get('Content-Length') or 0))
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            reply = self.respond(StubRequest(handler.path, handler.headers, body))
+            status, payload, headers = 200, reply, {}
+            if isinstance(reply, tuple):
+                status, payload, headers = (reply + ({},))[:3]
+            if isinstance(payload, (dict, list)):
+                payload = json.dumps(payload).encode()
+                headers = {'Content-Type': 'application/json', **headers}
+            handler.send_response(status)
+            for name, value in headers.items():
+                handler.send_header(name, str(value))
+            if isinstance(payload, bytes):
+                handler.send_header('Content-Length', str(len(payload)))
+                handler.end_headers()
+                handler.wfile.write(payload)
+            else:
+                handler.send_header('Transfer-Encoding', 'chunked')
+                handler.end_headers()
+                for chunk in payload:
+                    handler.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                    handler.wfile.flush()
+                handler.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on a slow reply
+            pass
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
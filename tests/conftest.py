@@ -0,0 +1,23 @@
+import os
+import sys
+
+# Tests use local stand-ins, never a database or the real APIs; set before config is read
+os.environ.setdefault('MONGO_URI', 'mongodb://127.0.0.1:9/?serverSelectionTimeoutMS=500')
+os.environ.setdefault('PROVISION_ON_STARTUP', 'false')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from stub_server import StubServer
+
+@pytest.fixture
+def stub():
+    """Start StubServer(respond) stand-ins, closed after the test."""
+    servers = []
+
+    def start(respond):
+        server = StubServer(respond)
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.close()
@@ -0,0 +1,112 @@
+"""Retries, backoff, timeouts, the concurrency limit and counters of the Gemini client."""
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+import gemini_client
+from gemini_client import GeminiClient, GeminiBusyError
+from stub_server import gemini_reply
+
+RETRIES = 2
+
+@pytest.fixture(autouse=True)
+def short_backoff(monkeypatch):
+    monkeypatch.setattr(gemini_client, 'GEMINI_BACKOFF_BASE', 0.05)
+    monkeypatch.setattr(gemini_client, 'GEMINI_BACKOFF_MAX', 2)
+
+@pytest.fixture
+def script(stub):
+    """Stand-in replaying (status, retry_after, delay) replies from its .replies, then 200s after latency."""
+    replies = deque()
+    lock = threading.Lock()
+
+    def respond(request):
+        with lock:
+            status, retry_after, delay = replies.popleft() if replies else (200, None, server.latency)
+        time.sleep(delay)
+        if status != 200:
+            return status, {'error': {'code': status}}, {'Retry-After': retry_after} if retry_after else {}
+        return gemini_reply('ok')
+    server = stub(respond)
+    server.replies = replies
+    server.latency = 0
+    return server
+
+def client(server, **options):
+    options.setdefault('max_retries', RETRIES)
+    options.setdefault('max_concurrency', 3)
+    return GeminiClient(api_key='stub', base_url=server.url, **options)
+
+def test_transient_503s_are_retried(script):
+    script.replies.extend([(503, None, 0)] * RETRIES)
+    gemini = client(script)
+    assert gemini.generate_content('ping') == 'ok'
+    counters = gemini.stats()['generateContent']
+    assert script.requests == RETRIES + 1
+    assert (counters['retries'], counters['errors']) == (RETRIES, 0)
+
+def test_429_waits_for_retry_after(script):
+    script.replies.append((429, 1, 0))
+    gemini = client(script)
+    started = time.perf_counter()
+    assert gemini.generate_content('ping') == 'ok'
+    assert time.perf_counter() - started >= 1
+    counters = gemini.stats()['generateContent']
+    assert script.requests == 2
+    assert (counters['throttled'], counters['retries']) == (1, 1)
+
+def test_persistent_500s_give_up(script):
+    script.replies.extend([(500, None, 0)] * (RETRIES + 1))
+    gemini = client(script)
+    with pytest.raises(requests.exceptions.HTTPError):
+        gemini.generate_content('ping')
+    counters = gemini.stats()['generateContent']
+    assert script.requests == RETRIES + 1
+    assert (counters['retries'], counters['errors']) == (RETRIES, 1)
+
+def test_400_is_not_retried(script):
+    script.replies.append((400, None, 0))
+    gemini = client(script)
+    with pytest.raises(requests.exceptions.HTTPError):
+        gemini.generate_content('ping')
+    counters = gemini.stats()['generateContent']
+    assert script.requests == 1
+    assert (counters['retries'], counters['errors']) == (0, 1)
+
+def test_slow_replies_time_out(script):
+    script.replies.extend([(200, None, 1)] * (RETRIES + 1))
+    gemini = client(script, timeout=(1, 0.2))
+    started = time.perf_counter()
+    with pytest.raises(requests.exceptions.Timeout):
+        gemini.generate_content('ping')
+    assert time.perf_counter() - started < RETRIES + 1
+    counters = gemini.stats()['generateContent']
+    assert script.requests == RETRIES + 1
+    assert (counters['timeouts'], counters['errors']) == (RETRIES + 1, 1)
+
+def test_concurrency_limit_holds(script):
+    script.latency = 0.2
+    gemini = client(script, max_concurrency=3)
+    with ThreadPoolExecutor(max_workers=12) as pool:
+        results = list(pool.map(lambda _: gemini.generate_content('ping'), range(12)))
+    assert results == ['ok'] * 12
+    assert script.peak == 3
+    counters = gemini.stats()['generateContent']
+    assert (counters['calls'], counters['errors']) == (12, 0)
+
+def test_full_queue_raises_busy(script, monkeypatch):
+    monkeypatch.setattr(gemini_client, 'GEMINI_QUEUE_TIMEOUT', 0.3)
+    script.replies.append((200, None, 1))
+    gemini = client(script, max_concurrency=1)
+    holder = threading.Thread(target=gemini.generate_content, args=('ping',))
+    holder.start()
+    time.sleep(0.1)
+    with pytest.raises(GeminiBusyError):
+        gemini.generate_content('ping')
+    holder.join()
+    counters = gemini.stats()['generateContent']
+    assert script.requests == 1
+    assert (counters['calls'], counters['errors']) == (2, 1)
@@ -0,0 +1,43 @@
+"""streamGenerateContent over SSE, read from a chunked reply."""
+import json
+
+import pytest
+from gemini_client import GeminiClient
+from generation_cache import GenerationCache
+from stub_server import gemini_reply
+
+TEXTS = ['Température du moteur : 85 °C', ' — nominal ✅', ' 设备正常']
+
+def sse(texts):
+    """An SSE body carrying one event per text."""
+    return b''.join(b'data: ' + json.dumps(gemini_reply(text), ensure_ascii=False).encode() + b'\r\n\r\n'
+                    for text in texts)
+
+def split_bytes(body, size):
+    """body in size-byte chunks, so multi-byte characters straddle chunk boundaries."""
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+@pytest.fixture
+def gemini(stub):
+    def respond(request):
+        return 200, iter(split_bytes(sse(TEXTS), 7)), {'Content-Type': 'text/event-stream'}
+    server = stub(respond)
+    server.client = GeminiClient(api_key='stub', base_url=server.url, max_retries=0)
+    return server
+
+def splits_a_character(chunk):
+    try:
+        chunk.decode('utf-8')
+        return False
+    except UnicodeDecodeError:
+        return True
+
+def test_split_chunks_decode_as_utf8(gemini):
+    assert any(splits_a_character(chunk) for chunk in split_bytes(sse(TEXTS), 7))
+    assert list(gemini.client.stream_generate_content('ping')) == TEXTS
+
+def test_cached_stream_is_replayed_whole(gemini):
+    cache = GenerationCache(gemini.client.generate_content, gemini.client.stream_generate_content)
+    assert list(cache.stream('ping')) == TEXTS
+    assert list(cache.stream('ping')) == [''.join(TEXTS)]
+    assert gemini.requests == 1
@@ -0,0 +1,75 @@
+"""Single-flight coalescing and caching of Gemini generations."""
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from gemini_client import GeminiClient
+from generation_cache import GenerationCache
+from stub_server import gemini_reply
+
+USERS = 16
+
+@pytest.fixture
+def gemini(stub):
+    """Stand-in answering every prompt with its own text after a delay; prompts containing fail get a 500."""
+    def respond(request):
+        time.sleep(0.3)
+        if 'fail' in request.prompt:
+            return 500, {'error': {'code': 500}}
+        return gemini_reply(f'answer to {request.prompt}')
+    server = stub(respond)
+    server.client = GeminiClient(api_key='stub', base_url=server.url, max_retries=0,
+                                 max_concurrency=USERS, pool_size=USERS)
+    return server
+
+def ask(generate, prompts):
+    """Ask every prompt at the same moment; returns the answers, or the exceptions raised, in order."""
+    barrier = threading.Barrier(len(prompts))
+
+    def one(prompt):
+        barrier.wait()
+        try:
+            return generate(prompt)
+        except Exception as e:
+            return e
+    with ThreadPoolExecutor(max_workers=len(prompts)) as pool:
+        return list(pool.map(one, prompts))
+
+def test_identical_prompts_in_flight_share_one_call(gemini):
+    cache = GenerationCache(gemini.client.generate_content)
+    answers = ask(cache.generate, ['status?'] * USERS)
+    assert answers == ['answer to status?'] * USERS
+    assert gemini.requests == 1
+    stats = cache.stats()
+    assert (stats['misses'], stats['coalesced'] + stats['hits']) == (1, USERS - 1)
+
+def test_distinct_prompts_each_call_once(gemini):
+    cache = GenerationCache(gemini.client.generate_content)
+    prompts = [f'question {user % 4}' for user in range(USERS)]
+    assert ask(cache.generate, prompts) == [f'answer to {prompt}' for prompt in prompts]
+    assert gemini.requests == 4
+
+def test_repeat_prompts_are_served_from_cache(gemini):
+    cache = GenerationCache(gemini.client.generate_content)
+    cache.generate('status?')
+    assert ask(cache.generate, ['status?'] * USERS) == ['answer to status?'] * USERS
+    assert gemini.requests == 1
+    assert cache.stats()['hits'] == USERS
+
+def test_failure_is_shared_but_not_cached(gemini):
+    cache = GenerationCache(gemini.client.generate_content)
+    answers = ask(cache.generate, ['fail?'] * USERS)
+    assert all(isinstance(answer, Exception) for answer in answers)
+    assert gemini.requests == 1
+    with pytest.raises(Exception):
+        cache.generate('fail?')
+    assert gemini.requests == 2
+    assert cache.stats()['entries'] == 0
+
+def test_zero_ttl_coalesces_without_caching(gemini):
+    cache = GenerationCache(gemini.client.generate_content)
+    ask(lambda prompt: cache.generate(prompt, ttl=0), ['status?'] * USERS)
+    assert gemini.requests == 1
+    cache.generate('status?', ttl=0)
+    assert gemini.requests == 2
@@ -0,0 +1,105 @@
+"""Once-per-key recommendation generation across workers sharing one store."""
+import re
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import recommendation_service
+from recommendation_service import RecommendationService, recommendation_key
+from gemini_client import GeminiClient
+from config import RECOMMENDATION_TIMEOUT_SECONDS
+from stub_server import gemini_reply
+
+mongomock = pytest.importorskip('mongomock')
+
+ASSET_NAME = re.compile(r'- Name: (\S+)')
+WORKERS = 4
+VIEWS = 16
+
+def answer(request):
+    """Recommendation per asset name; names starting with fail- get a 500."""
+    time.sleep(0.2)
+    name = ASSET_NAME.search(request.prompt).group(1)
+    if name.startswith('fail-'):
+        return 500, {'error': {'code': 500}}
+    return gemini_reply(f'Inspect {name}')
+
+@pytest.fixture
+def gemini(stub):
+    return stub(answer)
+
+@pytest.fixture
+def store():
+    return mongomock.MongoClient().iot.ai_recommendations
+
+@pytest.fixture
+def services(gemini, store, tmp_path, monkeypatch):
+    """One RecommendationService per simulated worker, like gunicorn workers sharing ai_recommendations."""
+    prompt = tmp_path / 'prompt.txt'
+    prompt.write_text('You are a maintenance advisor.')
+    monkeypatch.setattr(recommendation_service, 'PROMPT_FILE', str(prompt))
+    client = GeminiClient(api_key='stub', base_url=gemini.url, max_retries=0)
+    return [RecommendationService(lambda alerts, text: client.generate_content(text), store=store)
+            for _ in range(WORKERS)]
+
+def asset(name, status='operational'):
+    return {'_id': name, 'name': name, 'status': status}
+
+def views(services, doc, count=VIEWS, alert_ids=()):
+    """count concurrent asset-detail views spread over services; returns the key."""
+    def view(i):
+        key, _ = services[i % len(services)].request('machine', doc, [], [], list(alert_ids), 90)
+        return key
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        return list(pool.map(view, range(count)))[0]
+
+def settle(services, key, timeout=10):
+    """Entry for key once no service reports it pending (a failed key's claim is deleted, so
+    services that did not generate it see nothing)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        entries = [entry for entry in (service.get(key) for service in services) if entry]
+        if entries and all(entry['status'] != 'pending' for entry in entries):
+            return entries[0]
+        time.sleep(0.05)
+    raise TimeoutError(f'{key} still pending after {timeout}s')
+
+def test_concurrent_views_generate_once(services, gemini):
+    key = views(services, asset('pump-1'))
+    entry = settle(services, key)
+    assert entry == {'status': 'ready', 'recommendation': 'Inspect pump-1'}
+    assert gemini.requests == 1
+
+def test_repeat_views_are_cached(services, gemini):
+    settle(services, views(services, asset('pump-1')))
+    settle(services, views(services, asset('pump-1')))
+    assert gemini.requests == 1
+
+def test_changed_asset_is_regenerated(services, gemini):
+    first = views(services, asset('pump-1'))
+    settle(services, first)
+    second = views(services, asset('pump-1', 'warning'), alert_ids=['alert-1'])
+    assert second != first
+    assert settle(services, second)['status'] == 'ready'
+    assert gemini.requests == 2
+
+def test_stale_claim_is_taken_over_once(services, gemini, store):
+    doc = asset('pump-2')
+    key = recommendation_key(doc, [], [])
+    # A worker that claimed the key and died before generating it
+    store.insert_one({'_id': key, 'asset_type': 'machine', 'asset_id': doc['_id'], 'status': 'pending',
+                      'created_at': datetime.now() - timedelta(seconds=RECOMMENDATION_TIMEOUT_SECONDS + 1)})
+    views(services, doc)
+    assert settle(services, key)['status'] == 'ready'
+    assert gemini.requests == 1
+
+def test_upstream_failure_is_retried_on_next_view(services, gemini):
+    doc = asset('fail-3')
+    key = views(services, doc)
+    assert settle(services, key)['status'] == 'error'
+    assert gemini.requests == 1
+    # The failed claim is dropped, so the next view retries
+    views(services[:1], doc, 1)
+    assert settle(services[:1], key)['status'] == 'error'
+    assert gemini.requests == 2
@@ -0,0 +1,78 @@
+"""Atlas fallback and local index reloads of the auto search backends."""
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from pymongo.errors import OperationFailure
+from vector_search import AutoVectorBackend, LocalVectorIndex
+from text_search import AutoTextBackend, LocalTextIndex
+
+mongomock = pytest.importorskip('mongomock')
+
+@pytest.fixture
+def collection():
+    collection = mongomock.MongoClient().rag_db.machine_guides_passages
+    collection.insert_many([
+        {'title': 'Pump', 'content': 'Check the pump seals', 'embedding': [1.0, 0.0]},
+        {'title': 'Battery', 'content': 'Monitor battery levels', 'embedding': [0.0, 1.0]},
+    ])
+    return collection
+
+class FlakyAtlas:
+    """Stands in for the Atlas backend, rejecting searches while available is False."""
+
+    def __init__(self, atlas):
+        self.collection = atlas.collection
+        self.name = atlas.name
+        self.available = False
+        self.calls = 0
+
+    def search(self, *args, **kwargs):
+        self.calls += 1
+        if not self.available:
+            raise OperationFailure('search stages are only allowed on MongoDB Atlas')
+        return ['atlas hit']
+
+@pytest.mark.parametrize('backend_class, query, options', [
+    (AutoVectorBackend, [1.0, 0.0], {'min_score': 0}),
+    (AutoTextBackend, 'pump', {}),
+])
+def test_auto_backend_retries_atlas_after_interval(collection, backend_class, query, options):
+    backend = backend_class(collection, retry_seconds=0.3)
+    backend.atlas = atlas = FlakyAtlas(backend.atlas)
+
+    assert backend.search(query, 1, **options)
+    assert backend.name == 'local'
+    backend.search(query, 1)
+    assert atlas.calls == 1
+
+    atlas.available = True
+    time.sleep(0.35)
+    assert backend.search(query, 1) == ['atlas hit']
+    assert backend.name == atlas.name
+    assert atlas.calls == 2
+
+def test_only_one_search_probes_atlas(collection):
+    backend = AutoVectorBackend(collection, retry_seconds=0.2)
+    backend.atlas = atlas = FlakyAtlas(backend.atlas)
+    backend.search([1.0, 0.0], 1)
+    time.sleep(0.25)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: backend.search([1.0, 0.0], 1), range(8)))
+    assert atlas.calls == 2
+
+@pytest.mark.parametrize('index_class, query', [(LocalVectorIndex, [1.0, 0.0]), (LocalTextIndex, 'pump')])
+def test_concurrent_searches_load_the_index_once(collection, index_class, query, monkeypatch):
+    index = index_class(collection)
+    loads = []
+    load = index.load
+
+    def slow_load():
+        loads.append(threading.get_ident())
+        time.sleep(0.2)
+        load()
+    monkeypatch.setattr(index, 'load', slow_load)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: index.search(query, 1), range(8)))
+    assert len(loads) == 1
@@ -0,0 +1,59 @@
+"""Sensor series and reading pages over both reading layouts, and their argument checks."""
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+import sensor_series
+from sensor_series import load_series, readings_query, readings_projection, readings_page, flatten_reading
+
+mongomock = pytest.importorskip('mongomock')
+
+MACHINE = ObjectId()
+
+@pytest.fixture
+def readings(monkeypatch):
+    """Readings of one machine: migrated ones under meta, and legacy ones (written before
+    migrate_sensor_data.py ran) with metadata at the top level, a week apart."""
+    collection = mongomock.MongoClient().iot.sensor_data
+    now = datetime.now()
+    collection.insert_many(
+        [{'meta': {'machine_id': str(MACHINE), 'sensor_type': 'temperature'},
+          'timestamp': now - timedelta(minutes=i), 'value': 70.0} for i in range(5)] +
+        [{'machine_id': str(MACHINE), 'sensor_type': 'temperature',
+          'timestamp': now - timedelta(days=7, minutes=i), 'value': 60.0} for i in range(3)] +
+        [{'meta': {'machine_id': str(ObjectId()), 'sensor_type': 'temperature'}, 'timestamp': now, 'value': 1.0}]
+    )
+    monkeypatch.setattr(sensor_series, 'sensor_data', collection)
+    return collection
+
+def test_series_covers_the_whole_history_of_both_layouts(readings):
+    chart = load_series('machine_id', MACHINE)
+    assert list(chart) == ['temperature']
+    assert chart['temperature']['stats']['data_points'] == 8
+    assert chart['temperature']['stats']['min'] == 60.0
+
+def test_series_window_is_bounded_by_from(readings):
+    chart = load_series('machine_id', MACHINE, start=datetime.now() - timedelta(hours=1))
+    assert chart['temperature']['stats']['data_points'] == 5
+
+def test_reading_pages_include_legacy_readings(readings):
+    query = readings_query(machine_id=str(MACHINE), sensor_type='temperature')
+    docs = readings_page(query, 10, projection=readings_projection(['machine_id', 'value']))
+    assert len(docs) == 8
+    assert {flatten_reading(doc)['machine_id'] for doc in docs} == {str(MACHINE)}
+
+@pytest.fixture
+def client():
+    from app import app
+    return app.test_client()
+
+@pytest.mark.parametrize('url', [
+    f'/api/asset/machine/{MACHINE}?max_points=many',
+    f'/api/asset/machine/{MACHINE}?from=yesterday',
+    '/api/sensor-data?limit=ten',
+    '/api/sensor-data?from=2024-13-01',
+])
+def test_invalid_arguments_are_rejected(client, url):
+    response = client.get(url)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
@@ -0,0 +1,75 @@
+"""Concurrent /api/voice-chat requests each get their own transcription and answer."""
+import io
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import voice_chat
+from gemini_client import gemini_client
+from operational_context import operational_context
+from stub_server import gemini_reply
+
+TOKEN = re.compile(rb'voice-[0-9a-f]{32}')
+CLIENTS = 16
+
+def transcribe(request):
+    """Deepgram stand-in transcribing the token embedded in the upload."""
+    time.sleep(0.2)
+    match = TOKEN.search(request.body)
+    transcript = f"status of {match.group().decode()}" if match else ''
+    return {'results': {'channels': [{'alternatives': [{'transcript': transcript}]}]}}
+
+def answer(request):
+    """Gemini stand-in echoing the question."""
+    time.sleep(0.2)
+    question = request.prompt.rsplit('User Question:', 1)[-1].strip()
+    return gemini_reply(f'Answer to {question}')
+
+def static_context():
+    time.sleep(0.1)
+    return {'latest_metrics': None, 'metrics_summary': 'No recent metrics available.',
+            'alerts_summary': 'No critical alerts reported recently.', 'built_at': time.monotonic()}
+
+def fake_audio(token):
+    """An opaque ~65 KB upload embedding token; not WAV, so it skips audio preprocessing."""
+    return b'RIFF' + os.urandom(64 * 1024) + token.encode() + os.urandom(1024)
+
+@pytest.fixture
+def app(stub, monkeypatch):
+    deepgram = stub(transcribe)
+    gemini = stub(answer)
+    monkeypatch.setattr(voice_chat, 'DEEPGRAM_URL', f'{deepgram.url}/v1/listen')
+    monkeypatch.setattr(voice_chat, 'DEEPGRAM_API_KEY', 'stub')
+    monkeypatch.setattr(gemini_client, 'base_url', gemini.url)
+    monkeypatch.setattr(gemini_client, 'api_key', 'stub')
+    monkeypatch.setattr(operational_context, 'refresh', static_context)
+    # Every request rebuilds the context, so its cost overlaps transcription
+    monkeypatch.setattr(operational_context, 'max_age', -1)
+    from app import app
+    return app
+
+def test_concurrent_requests_get_their_own_answers(app):
+    def one_request(_):
+        token = f'voice-{uuid.uuid4().hex}'
+        response = app.test_client().post('/api/voice-chat', data={
+            'audio': (io.BytesIO(fake_audio(token)), 'recording', 'application/octet-stream')
+        })
+        return token, response.status_code, response.get_json()
+
+    with ThreadPoolExecutor(max_workers=CLIENTS) as pool:
+        results = list(pool.map(one_request, range(CLIENTS * 2)))
+    for token, status, body in results:
+        assert status == 200
+        assert body['transcription'] == f'status of {token}'
+        assert token in body['response']
+        assert body['response'].count('voice-') == 1
+
+def test_silent_upload_is_rejected(app):
+    response = app.test_client().post('/api/voice-chat', data={
+        'audio': (io.BytesIO(b'RIFF' + os.urandom(1024)), 'recording', 'application/octet-stream')
+    })
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Could not transcribe audio'}
@@ -0,0 +1,230 @@
+import re
+import math
+import time
+import logging
+import threading
+from collections import Counter, defaultdict
+import numpy as np
+from pymongo.errors import OperationFailure
+from vector_search import RESULT_FIELDS, FILTER_FIELDS, filter_values, matching_rows, top_k
+from config import TEXT_SEARCH_BACKEND, TEXT_LOCAL_REFRESH_SECONDS, TEXT_ATLAS_RETRY_SECONDS, TEXT_MIN_TERM_MATCH
+
+logger = logging.getLogger(__name__)
+
+TEXT_INDEX_NAME = "text_index"
+
+# Words, numbers and codes such as DEV-1003 or 4.2.1
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+CODE_SEPARATORS = re.compile(r"[-_./]")
+STOPWORDS = frozenset(
+    'a an and are as at be by for from how i in is it of on or that the this to was what when where which who why with'.split()
+)
+
+# Okapi BM25 parameters; title terms count twice
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITLE_WEIGHT = 2
+
+def tokenize(text):
+    """Lower-cased terms without stopwords; codes are kept whole and also split into their parts."""
+    terms = []
+    for token in TOKEN_PATTERN.findall((text or '').lower()):
+        parts = CODE_SEPARATORS.split(token)
+        if len(parts) > 1:
+            terms.append(token)
+        terms.extend(part for part in parts if part not in STOPWORDS)
+    return terms
+
+def required_terms(terms, min_match=TEXT_MIN_TERM_MATCH):
+    """How many of a query's distinct terms a document must contain to count as a lexical match."""
+    return max(1, math.ceil(min_match * len(terms))) if terms else 0
+
+def text_index_definition():
+    """Atlas Search index over the guide text, with the filterable metadata as tokens."""
+    return {
+        "mappings": {
+            "dynamic": False,
+            "fields": {
+                "title": {"type": "string", "analyzer": "lucene.english"},
+                "content": {"type": "string", "analyzer": "lucene.english"},
+                **{field: {"type": "token"} for field in FILTER_FIELDS}
+            }
+        }
+    }
+
+class AtlasTextBackend:
+    """Atlas $search over title and content."""
+
+    name = 'atlas'
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def pipeline(self, query, limit, filters=None, min_match=TEXT_MIN_TERM_MATCH):
+        # One clause per distinct term, so documents sharing a single word with the query do not match
+        terms = sorted(set(tokenize(query))) or [query]
+        compound = {
+            "should": [
+                {"compound": {"should": [
+                    {"text": {"query": term, "path": "title", "score": {"boost": {"value": TITLE_WEIGHT}}}},
+                    {"text": {"query": term, "path": "content"}}
+                ]}}
+                for term in terms
+            ],
+            "minimumShouldMatch": required_terms(terms, min_match)
+        }
+        clauses = [{"in": {"path": field, "value": values}} for field, values in filter_values(filters).items()]
+        if clauses:
+            compound["filter"] = clauses
+        return [
+            {"$search": {"index": TEXT_INDEX_NAME, "compound": compound}},
+            {"$limit": limit},
+            {
+                "$project": {
+                    "_id": 0,
+                    **{field: 1 for field in RESULT_FIELDS},
+                    "score": {"$meta": "searchScore"}
+                }
+            }
+        ]
+
+    def search(self, query, limit, filters=None, min_match=TEXT_MIN_TERM_MATCH):
+        return list(self.collection.aggregate(self.pipeline(query, limit, filters, min_match)))
+
+class LocalTextIndex:
+    """In-process BM25 inverted index over a collection's title and content.
+
+    Postings are NumPy arrays per term, so scoring a query is a few vectorized adds.
+    The index reloads from the collection every TEXT_LOCAL_REFRESH_SECONDS.
+    """
+
+    name = 'local'
+
+    def __init__(self, collection, refresh_seconds=TEXT_LOCAL_REFRESH_SECONDS):
+        self.collection = collection
+        self.refresh_seconds = refresh_seconds
+        self.lock = threading.Lock()
+        # Held while (re)loading, so concurrent searches wait for one load instead of each running it
+        self.load_lock = threading.Lock()
+        self.loaded_at = None
+        self.docs = []
+        self.postings = {}
+        self.lengths = np.zeros(0, dtype=np.float32)
+
+    def load(self):
+        """(Re)build the index from every document in the collection."""
+        projection = {'_id': 0, **{field: 1 for field in RESULT_FIELDS + FILTER_FIELDS}}
+        self.build(list(self.collection.find({'_dummy': {'$ne': True}}, projection)))
+        self.loaded_at = time.monotonic()
+
+    def build(self, docs):
+        rows, frequencies = defaultdict(list), defaultdict(list)
+        lengths = np.zeros(len(docs), dtype=np.float32)
+        for i, doc in enumerate(docs):
+            terms = tokenize(doc.get('title')) * TITLE_WEIGHT + tokenize(doc.get('content'))
+            lengths[i] = len(terms)
+            for term, count in Counter(terms).items():
+                rows[term].append(i)
+                frequencies[term].append(count)
+        postings = {
+            term: (np.asarray(rows[term], dtype=np.int64), np.asarray(frequencies[term], dtype=np.float32))
+            for term in rows
+        }
+        with self.lock:
+            self.docs, self.postings, self.lengths = docs, postings, lengths
+
+    def _stale(self):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.refresh_seconds
+
+    def _ensure_loaded(self):
+        if self._stale():
+            with self.load_lock:
+                if self._stale():
+                    self.load()
+
+    def search(self, query, limit, filters=None, min_match=TEXT_MIN_TERM_MATCH):
+        self._ensure_loaded()
+        with self.lock:
+            docs, postings, lengths = self.docs, self.postings, self.lengths
+        if not docs:
+            return []
+        scores = np.zeros(len(docs), dtype=np.float32)
+        matches = np.zeros(len(docs), dtype=np.int32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(float(lengths.mean()), 1.0))
+        terms = set(tokenize(query))
+        for term in terms:
+            if term not in postings:
+                continue
+            rows, tf = postings[term]
+            idf = np.log(1 + (len(docs) - len(rows) + 0.5) / (len(rows) + 0.5))
+            scores[rows] += idf * tf * (BM25_K1 + 1) / (tf + norm[rows])
+            matches[rows] += 1
+        scores[matches < required_terms(terms, min_match)] = 0
+        allowed = matching_rows(docs, filters)
+        if allowed is not None:
+            mask = np.zeros(len(docs), dtype=bool)
+            mask[allowed] = True
+            scores[~mask] = 0
+        matched = np.flatnonzero(scores > 0)
+        best = matched[top_k(scores[matched], limit)]
+        return [dict(docs[i], score=float(scores[i])) for i in best.tolist()]
+
+class AutoTextBackend:
+    """Atlas $search where available, falling back to the local index while the server rejects it.
+
+    After a rejection, one search retries Atlas every TEXT_ATLAS_RETRY_SECONDS.
+    """
+
+    def __init__(self, collection, retry_seconds=TEXT_ATLAS_RETRY_SECONDS):
+        self.atlas = AtlasTextBackend(collection)
+        self.local = LocalTextIndex(collection)
+        self.active = self.atlas
+        self.retry_seconds = retry_seconds
+        # When to retry Atlas; None while Atlas is in use
+        self.retry_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self.active.name
+
+    def _try_atlas(self):
+        """Whether this search should go to Atlas; claims the retry when one is due."""
+        with self.lock:
+            if self.retry_at is None:
+                return True
+            if time.monotonic() < self.retry_at:
+                return False
+            # Other searches stay local while this one probes
+            self.retry_at = time.monotonic() + self.retry_seconds
+            return True
+
+    def search(self, query, limit, filters=None, **options):
+        if self._try_atlas():
+            try:
+                results = self.atlas.search(query, limit, filters, **options)
+            except OperationFailure as e:
+                logger.warning("$search unavailable on %s, using the local index for %ss: %s",
+                               self.atlas.collection.name, self.retry_seconds, e)
+                with self.lock:
+                    self.active, self.retry_at = self.local, time.monotonic() + self.retry_seconds
+            else:
+                with self.lock:
+                    if self.retry_at is not None:
+                        logger.info("$search available again on %s", self.atlas.collection.name)
+                    self.active, self.retry_at = self.atlas, None
+                return results
+        return self.local.search(query, limit, filters, **options)
+
+BACKENDS = {'atlas': AtlasTextBackend, 'local': LocalTextIndex, 'auto': AutoTextBackend}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+def text_backend(collection, kind=TEXT_SEARCH_BACKEND):
+    """Shared lexical search backend for a collection, chosen by TEXT_SEARCH_BACKEND."""
+    key = (collection.full_name, kind)
+    with _backends_lock:
+        if key not in _backends:
+            _backends[key] = BACKENDS[kind](collection)
+        return _backends[key]
@@ -0,0 +1,291 @@
+import time
+import logging
+import threading
+import numpy as np
+from pymongo.errors import OperationFailure
+from config import (
+    VECTOR_SEARCH_BACKEND, VECTOR_LOCAL_REFRESH_SECONDS, VECTOR_ATLAS_RETRY_SECONDS, VECTOR_IVF_MIN_DOCS, VECTOR_IVF_NPROBE,
+    VECTOR_SEARCH_EXACT, VECTOR_NUM_CANDIDATES_FACTOR, VECTOR_MAX_NUM_CANDIDATES, VECTOR_MIN_SCORE
+)
+
+logger = logging.getLogger(__name__)
+
+VECTOR_INDEX_NAME = "vector_index"
+EMBEDDING_DIMENSIONS = 768
+# Returned with each hit; the passage fields are only present on passage collections
+RESULT_FIELDS = ('title', 'content', 'passage_id', 'guide_id', 'position', 'passage_count')
+
+# Metadata that searches can pre-filter on; declared as filter fields in the search index
+FILTER_FIELDS = ('category', 'device_type')
+
+def vector_index_definition(num_dimensions=EMBEDDING_DIMENSIONS):
+    """Atlas vector search index over embedding, with the filterable metadata fields."""
+    return {
+        "fields": [
+            {
+                "type": "vector",
+                "numDimensions": num_dimensions,
+                "path": "embedding",
+                "similarity": "cosine"
+            },
+            *({"type": "filter", "path": field} for field in FILTER_FIELDS)
+        ]
+    }
+
+def filter_values(filters):
+    """{field: [values]} from {field: value or [values]}, restricted to FILTER_FIELDS; empty values are ignored."""
+    values = {}
+    for field, value in (filters or {}).items():
+        if field not in FILTER_FIELDS:
+            raise ValueError(f"Cannot filter on '{field}'; filterable fields are {', '.join(FILTER_FIELDS)}")
+        if value in (None, '', []):
+            continue
+        values[field] = value if isinstance(value, list) else [value]
+    return values
+
+def search_filter(filters):
+    """$vectorSearch filter from {field: value or [values]}."""
+    clauses = [{field: {'$in': value}} for field, value in filter_values(filters).items()]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {'$and': clauses}
+
+def matching_rows(docs, filters):
+    """Indices of the docs matching filters, or None when there is nothing to filter on."""
+    wanted = filter_values(filters)
+    if not wanted:
+        return None
+    return np.asarray([
+        i for i, doc in enumerate(docs)
+        if all(doc.get(field) in values for field, values in wanted.items())
+    ], dtype=np.int64)
+
+def num_candidates(limit):
+    """ANN candidate pool: a multiple of limit, within Atlas's bounds."""
+    return max(limit, min(limit * VECTOR_NUM_CANDIDATES_FACTOR, VECTOR_MAX_NUM_CANDIDATES))
+
+def cosine_to_score(cosine):
+    """Atlas reports cosine similarity as (1 + cos) / 2; local scores use the same scale so thresholds carry over."""
+    return (1.0 + cosine) / 2.0
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def top_k(scores, k):
+    """Indices of the k largest scores, best first, without sorting the whole array."""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, k)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+def kmeans(vectors, clusters, iterations=10, seed=0):
+    """Spherical k-means over unit vectors; returns (centroids, assignment)."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(clusters):
+            members = vectors[assignment == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        centroids = normalize_rows(centroids)
+    return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+class AtlasVectorBackend:
+    """$vectorSearch against an Atlas Search vector index."""
+
+    name = 'atlas'
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def pipeline(self, query_vector, limit, filters=None, min_score=VECTOR_MIN_SCORE, exact=VECTOR_SEARCH_EXACT,
+                 candidates=None):
+        """$vectorSearch (ENN or ANN) with pre-filtering, projected and cut at min_score on the server."""
+        stage = {
+            "index": VECTOR_INDEX_NAME,
+            "queryVector": query_vector,
+            "path": "embedding",
+            "exact": exact,
+            "limit": limit
+        }
+        if not exact:
+            stage["numCandidates"] = candidates or num_candidates(limit)
+        vector_filter = search_filter(filters)
+        if vector_filter:
+            stage["filter"] = vector_filter
+        pipeline = [
+            {"$vectorSearch": stage},
+            {
+                "$project": {
+                    "_id": 0,
+                    **{field: 1 for field in RESULT_FIELDS},
+                    "score": {"$meta": "vectorSearchScore"}
+                }
+            }
+        ]
+        if min_score:
+            pipeline.append({"$match": {"score": {"$gte": min_score}}})
+        return pipeline
+
+    def search(self, query_vector, limit, filters=None, min_score=VECTOR_MIN_SCORE, **options):
+        return list(self.collection.aggregate(self.pipeline(query_vector, limit, filters, min_score, **options)))
+
+class LocalVectorIndex:
+    """In-process index over a collection's embeddings: exact (flat) search, or IVF for larger corpora.
+
+    Embeddings are held as a row-normalized float32 matrix, so cosine similarity is a dot product.
+    The index reloads from the collection every VECTOR_LOCAL_REFRESH_SECONDS.
+    """
+
+    name = 'local'
+
+    def __init__(self, collection, ivf_min_docs=VECTOR_IVF_MIN_DOCS, nprobe=VECTOR_IVF_NPROBE,
+                 refresh_seconds=VECTOR_LOCAL_REFRESH_SECONDS):
+        self.collection = collection
+        self.ivf_min_docs = ivf_min_docs
+        self.nprobe = nprobe
+        self.refresh_seconds = refresh_seconds
+        self.lock = threading.Lock()
+        # Held while (re)loading, so concurrent searches wait for one load instead of each running it
+        self.load_lock = threading.Lock()
+        self.loaded_at = None
+        self.docs = []
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.centroids = None
+        self.lists = None
+
+    def load(self):
+        """(Re)build the index from every document with an embedding."""
+        docs, vectors = [], []
+        projection = {'_id': 0, 'embedding': 1, **{field: 1 for field in RESULT_FIELDS + FILTER_FIELDS}}
+        for doc in self.collection.find({'embedding': {'$exists': True}, '_dummy': {'$ne': True}}, projection):
+            vectors.append(doc.pop('embedding'))
+            docs.append(doc)
+        self.build(docs, np.asarray(vectors, dtype=np.float32))
+        self.loaded_at = time.monotonic()
+
+    def build(self, docs, vectors):
+        matrix = normalize_rows(vectors) if len(vectors) else np.zeros((0, 0), dtype=np.float32)
+        centroids, lists = None, None
+        if docs and len(docs) >= self.ivf_min_docs:
+            # About sqrt(n) lists keeps both the centroid scan and each list scan small
+            centroids, assignment = kmeans(matrix, max(1, int(np.sqrt(len(docs)))))
+            lists = [np.flatnonzero(assignment == c) for c in range(len(centroids))]
+        with self.lock:
+            self.docs, self.matrix, self.centroids, self.lists = docs, matrix, centroids, lists
+
+    def _stale(self):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.refresh_seconds
+
+    def _ensure_loaded(self):
+        if self._stale():
+            with self.load_lock:
+                if self._stale():
+                    self.load()
+
+    def candidates(self, query):
+        """Row indices to score exactly: everything, or the rows of the nprobe nearest IVF lists."""
+        if self.centroids is None:
+            return None
+        nearest = top_k(self.centroids @ query, self.nprobe)
+        return np.concatenate([self.lists[c] for c in nearest])
+
+    def search(self, query_vector, limit, filters=None, min_score=VECTOR_MIN_SCORE, exact=False, **options):
+        self._ensure_loaded()
+        with self.lock:
+            docs, matrix = self.docs, self.matrix
+            if not docs:
+                return []
+            query = normalize_rows(np.asarray([query_vector], dtype=np.float32))[0]
+            rows = None if exact else self.candidates(query)
+        allowed = matching_rows(docs, filters)
+        if allowed is not None:
+            rows = allowed if rows is None else np.intersect1d(rows, allowed)
+        if rows is None:
+            scores = matrix @ query
+            best = top_k(scores, limit)
+            hits = zip(best.tolist(), scores[best].tolist())
+        else:
+            scores = matrix[rows] @ query
+            picked = top_k(scores, limit)
+            hits = zip(rows[picked].tolist(), scores[picked].tolist())
+        results = [dict(docs[i], score=cosine_to_score(score)) for i, score in hits]
+        return [r for r in results if not min_score or r['score'] >= min_score]
+
+    def search_many(self, query_vectors, limit):
+        """Exact top-k for a batch of queries with one matrix product."""
+        self._ensure_loaded()
+        with self.lock:
+            docs, matrix = self.docs, self.matrix
+        if not docs:
+            return [[] for _ in query_vectors]
+        scores = normalize_rows(np.asarray(query_vectors, dtype=np.float32)) @ matrix.T
+        return [
+            [dict(docs[i], score=cosine_to_score(float(row[i]))) for i in top_k(row, limit).tolist()]
+            for row in scores
+        ]
+
+class AutoVectorBackend:
+    """Atlas $vectorSearch where available, falling back to the local index while the server rejects it.
+
+    After a rejection, one search retries Atlas every VECTOR_ATLAS_RETRY_SECONDS, so an index that
+    finishes building (or a restored cluster) is picked up again without a restart.
+    """
+
+    def __init__(self, collection, retry_seconds=VECTOR_ATLAS_RETRY_SECONDS):
+        self.atlas = AtlasVectorBackend(collection)
+        self.local = LocalVectorIndex(collection)
+        self.active = self.atlas
+        self.retry_seconds = retry_seconds
+        # When to retry Atlas; None while Atlas is in use
+        self.retry_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self.active.name
+
+    def _try_atlas(self):
+        """Whether this search should go to Atlas; claims the retry when one is due."""
+        with self.lock:
+            if self.retry_at is None:
+                return True
+            if time.monotonic() < self.retry_at:
+                return False
+            # Other searches stay local while this one probes
+            self.retry_at = time.monotonic() + self.retry_seconds
+            return True
+
+    def search(self, query_vector, limit, **options):
+        if self._try_atlas():
+            try:
+                results = self.atlas.search(query_vector, limit, **options)
+            except OperationFailure as e:
+                # Self-hosted servers and missing search indexes both land here
+                logger.warning("$vectorSearch unavailable on %s, using the local index for %ss: %s",
+                               self.atlas.collection.name, self.retry_seconds, e)
+                with self.lock:
+                    self.active, self.retry_at = self.local, time.monotonic() + self.retry_seconds
+            else:
+                with self.lock:
+                    if self.retry_at is not None:
+                        logger.info("$vectorSearch available again on %s", self.atlas.collection.name)
+                    self.active, self.retry_at = self.atlas, None
+                return results
+        return self.local.search(query_vector, limit, **options)
+
+BACKENDS = {'atlas': AtlasVectorBackend, 'local': LocalVectorIndex, 'auto': AutoVectorBackend}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+def vector_backend(collection, kind=VECTOR_SEARCH_BACKEND):
+    """Shared search backend for a collection, chosen by VECTOR_SEARCH_BACKEND."""
+    key = (collection.full_name, kind)
+    with _backends_lock:
+        if key not in _backends:
+            _backends[key] = BACKENDS[kind](collection)
+        return _backends[key]